@@ -2,18 +2,40 @@ import os
 import uuid
 import base64
 import traceback
-import pandas as pd
 import datetime
-import websockets
+import hashlib
 import json
 import asyncio
+import time
+from typing import Optional
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect
+from email.utils import formatdate, parsedate_to_datetime
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import WebSocketException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from .config import settings
 from pydantic import BaseModel, Field
-from .core import analyze_image, generate_answer_audio, transcribe_speech_input
-from openai import OpenAI
+from .core import AUDIO_FORMATS, DEFAULT_AUDIO_QUALITY, analyze_image, generate_answer_audio, negotiate_audio_format, revise_analysis, synthesize_speech, transcribe_speech_input
 from .evaluator import Evaluator
+from .audio_preprocessing import ffmpeg_available, preprocess_audio
+from .image_optimizer import estimate_vision_tokens, load_notepad_image, prepare_image
+from .drawing_tracker import compare_fingerprints, drawing_tracker, fingerprint
+from .upstream import UpstreamUnavailableError, upstream
+from .model_router import model_router
+from .concepts import CONCEPT_FIELDS
+from .course_db import course_db
+from .search_index import concept_search
+from .slide_index import format_slide_excerpts, slide_search
+from .openai_clients import openai_clients
+from .usage_ledger import GROUP_BY_FIELDS, attribute_usage, usage_ledger
+from .realtime_transcription import TranscriptBuffer, audio_append_event, transcription_session_update
+from .speculation import speculator
+from .idempotency import IdempotencyConflictError, idempotency_cache, request_fingerprint, scoped_key
+from .pdf_uploads import file_sha256
+from .transcription_cache import transcription_cache
+from .scratch import scratch_space
+from .stroke_rasterizer import STROKE_SUFFIX, StrokeFormatError, is_stroke_upload, load_strokes, parse_strokes, stroke_rasterizer, write_strokes
 
 # Create router instead of app
 router = APIRouter()
@@ -27,49 +49,69 @@ class EvaluationResponse(BaseModel):
 class FollowUpResponse(BaseModel):
     feedback: str = Field(..., description="Feedback from the grandfather on the explanation")
     audio_data: str = Field(..., description="Base64-encoded audio of the feedback")
+    audio_format: str = Field("mp3", description="Format of the encoded audio (mp3, opus, aac, flac or wav)")
+    audio_mime_type: str = Field("audio/mpeg", description="MIME type to use when playing the audio")
+    session_id: Optional[str] = Field(None, description="The learner's session; send it with the next turns")
+
+class ConceptPage(BaseModel):
+    items: list = Field(..., description="Concepts on this page, restricted to the requested fields")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null on the last page")
 
 # Store active voice sessions 
 active_voice_sessions = {}
 
+def new_learning_session_id() -> str:
+    """
+    A learning session ID for a learner who did not send one.
+    
+    Returned to the client to send with its next turns. Sessions are never shared
+    between learners, so a turn without an ID starts a new one rather than joining
+    some default session (e.g. one per concept).
+    """
+    return uuid.uuid4().hex
+
+def resolve_concept(course_id: str, concept_id: str) -> dict:
+    """
+    Look up a concept in the catalog.
+    
+    Raises:
+        HTTPException: 404 if the course does not exist, 400 if the concept ID is invalid or out of range
+    """
+    concept = course_db.get_concept(course_id, concept_id)
+    if concept is None and not course_db.has_course(course_id):
+        print(f"ERROR: Course '{course_id}' not found")
+        raise HTTPException(status_code=404, detail=f"Course not found: {course_id}")
+    if concept is None:
+        print(f"ERROR: Invalid concept_id '{concept_id}' for course '{course_id}'")
+        raise HTTPException(status_code=400, detail=f"Invalid or out-of-range concept_id: {concept_id}")
+    return concept
+
 @router.post("/evaluate", response_model=EvaluationResponse)
 async def evaluate_explanation(
-    concept_id: str = Form(...)
+    concept_id: str = Form(...),
+    course_id: str = Form(None, description="Course the concept belongs to; defaults to settings.default_course_id"),
+    session_id: str = Form(None, description="Learning session of the evaluated learner (scheduling, usage)")
 ):
     """
     Evaluate the user's overall understanding based on conversation history for a specific concept.
     
     Args:
         concept_id (str): The ID of the concept to evaluate.
+        course_id (str): The course the concept belongs to.
+        session_id (str): The learner's session, as returned by their turns.
         
     Returns:
         EvaluationResponse: A dictionary containing the evaluation score.
     """
     print(f"evaluate_explanation function called for concept_id: {concept_id}")
-    concept_file_path = "extracted_key_concepts/ArtificialIntelligence_2_IntelligentAgents-2_qa.csv"
+    course_id = course_id or settings.default_course_id
     history_file_path = "conversation_history.txt"
     
     try:
-        # 1. Read Concepts CSV
-        if not os.path.exists(concept_file_path):
-            print(f"ERROR: Concepts file not found at {concept_file_path}")
-            raise HTTPException(status_code=404, detail="Concepts data not found.")
-        
-        concepts = pd.read_csv(concept_file_path)
-        print(f"Loaded concepts from {concept_file_path}")
-
-        # 2. Retrieve the specific concept
-        try:
-            concept_id_int = int(concept_id)
-            if not (1 <= concept_id_int <= len(concepts)):
-                raise ValueError("Concept ID out of range")
-            concept_row = concepts.iloc[concept_id_int - 1]
-            concept_explanation = concept_row.iloc[0]
-            concept_text = concept_row._name[1]
-            print(f"Retrieved concept: ID={concept_id}, Title={concept_text}")
-            concept = {"title": concept_text, "description": concept_explanation}
-        except (ValueError, IndexError) as e:
-            print(f"ERROR: Invalid concept_id '{concept_id}'. Error: {e}")
-            raise HTTPException(status_code=400, detail=f"Invalid or out-of-range concept_id: {concept_id}")
+        # 1. & 2. Retrieve the specific concept from the catalog
+        catalog_concept = resolve_concept(course_id, concept_id)
+        print(f"Retrieved concept: ID={concept_id}, Title={catalog_concept['title']}")
+        concept = {"title": catalog_concept["title"], "description": catalog_concept["answer"]}
         
         # 3. Read Conversation History
         conversation_history = ""
@@ -83,7 +125,9 @@ async def evaluate_explanation(
 
         # 4. Call the evaluator function
         print("Calling evaluator...")
-        score = evaluator.evaluate(concept=concept, chat_history=conversation_history)
+        # In a worker thread: waiting for an upstream slot must not block the event loop
+        with attribute_usage(endpoint="evaluate", session_id=session_id, concept_id=concept_id, course_id=course_id):
+            score = await run_in_threadpool(evaluator.evaluate, concept=concept, chat_history=conversation_history)
         print(f"Evaluation score received: {score}")
         
         # 5. Return the score
@@ -92,12 +136,15 @@ async def evaluate_explanation(
     except HTTPException as http_exc:
         # Re-raise HTTPException to let FastAPI handle it
         raise http_exc
+    except UpstreamUnavailableError as e:
+        print(f"ERROR in evaluate_explanation: upstream unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Evaluation service temporarily unavailable: {str(e)}")
     except Exception as e:
         print(f"ERROR in evaluate_explanation: {str(e)}")
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error evaluating explanation: {str(e)}")
 
-def process_follow_up(client, audio_path, image_path, concept_explanation, concept_text, last_explanation: bool):
+def process_follow_up(client, audio_path, image_path, concept_explanation, concept_text, last_explanation: bool, audio_format: str = "mp3", session_id: str = None, course_id: str = None):
     """
     Process a follow-up question with audio and image data.
     
@@ -108,37 +155,42 @@ def process_follow_up(client, audio_path, image_path, concept_explanation, conce
         concept_explanation: The explanation of the concept
         concept_text: The text of the concept
         last_explanation: Boolean indicating if this is the user's final explanation attempt.
+        audio_format: TTS output format for grandpa's spoken answer
+        session_id: Learning session, used to skip drawings unchanged since the previous turn
+        course_id: Course of the concept, used to retrieve relevant slide excerpts
     Returns:
         tuple: (feedback, audio_output_path, transcription)
     """
     audio_output_path = None
+    preprocessed_audio_path = None
     transcription_text = None
-    conversation_history = ""
-    history_file_path = "conversation_history.txt"
     
     try:
-        # Read conversation history if it exists
-        if os.path.exists(history_file_path):
-            with open(history_file_path, "r", encoding="utf-8") as f:
-                conversation_history = f.read()
-                print(f"Loaded conversation history from {history_file_path}")
-        else:
-            print("Conversation history file not found, starting new history.")
+        conversation_history = load_conversation_history()
             
         # Convert image to base64 for OpenAI API
         print("Converting image to base64...")
-        with open(image_path, "rb") as image_file:
-            image_data = image_file.read()
-            base64_image = base64.b64encode(image_data).decode("utf-8")
-            image_url = f"data:image/webp;base64,{base64_image}"
+        image_url, image_detail, drawing_change, drawing_fingerprint = prepare_notepad_image(image_path, session_id)
         print("Image encoded as base64 for API")
         
-        # Process the audio to get transcription
+        def transcribe():
+            nonlocal preprocessed_audio_path
+            # Optionally trim silence and downsample before uploading for transcription
+            transcription_input_path = audio_path
+            if settings.audio_preprocessing:
+                preprocessed_audio_path, transcription_input_path = prepare_audio_for_transcription(audio_path)
+            return transcribe_speech_input(client, transcription_input_path).text
+        
+        # Process the audio to get transcription; a recording transcribed before (e.g. a retry) is looked up
         print("Processing audio transcription...")
-        transcription_obj = transcribe_speech_input(client, audio_path)
-        transcription_text = transcription_obj.text # Extract text from the transcription object
+        transcription_text = transcription_cache.transcribe(file_sha256(audio_path), transcribe)
         print("Transcription completed")
         
+        # Ground the analysis in the most relevant slides of the source deck
+        slide_excerpts = None
+        if settings.slide_context and course_id:
+            slide_excerpts = retrieve_slide_excerpts(course_id, f"{concept_text} {transcription_text}")
+        
         # Analyze the image with audio transcription and history
         print("Analyzing image with transcription and history...")
         feedback = analyze_image(
@@ -148,14 +200,19 @@ def process_follow_up(client, audio_path, image_path, concept_explanation, conce
             concept_explanation=concept_explanation, 
             concept_text=concept_text, 
             conversation_history=conversation_history,
-            last_explanation=last_explanation # Pass the flag here
+            last_explanation=last_explanation, # Pass the flag here
+            image_detail=image_detail,
+            drawing_change=drawing_change,
+            slide_excerpts=slide_excerpts
         )
         print("Analysis completed")
+        if drawing_fingerprint is not None:
+            drawing_tracker.remember(session_id, drawing_fingerprint)
         
         # Generate audio response
         print("Generating audio response...")
-        audio_output_path = f"temp_response_{uuid.uuid4()}.mp3"
-        generate_answer_audio(client, feedback, audio_output_path)
+        audio_output_path = scratch_space.path(f"response.{audio_format}")
+        generate_answer_audio(client, feedback, audio_output_path, audio_format=audio_format)
         print(f"Audio response generated at {audio_output_path}")
         
         return feedback, audio_output_path, transcription_text
@@ -166,21 +223,190 @@ def process_follow_up(client, audio_path, image_path, concept_explanation, conce
             try: os.remove(audio_output_path)
             except: pass
         raise e
+    finally:
+        if preprocessed_audio_path and os.path.exists(preprocessed_audio_path):
+            try: os.remove(preprocessed_audio_path)
+            except: pass
+
+def load_conversation_history(history_file_path: str = "conversation_history.txt") -> str:
+    """Read the conversation history file, or return an empty history if there is none yet."""
+    if not os.path.exists(history_file_path):
+        print("Conversation history file not found, starting new history.")
+        return ""
+    with open(history_file_path, "r", encoding="utf-8") as f:
+        print(f"Loaded conversation history from {history_file_path}")
+        return f.read()
+
+def retrieve_slide_excerpts(course_id: str, query: str):
+    """
+    Fetch the slide chunks most relevant to the current turn within the token budget.
+    
+    Returns:
+        Formatted excerpts for the analysis prompt, or None if the course has no slide index
+    """
+    try:
+        chunks = slide_search.top_chunks(course_id, query)
+    except Exception as e:
+        print(f"Slide retrieval failed, continuing without excerpts: {str(e)}")
+        return None
+    if not chunks:
+        return None
+    print(f"Retrieved slide excerpts from pages {[chunk['page'] for chunk in chunks]}")
+    return format_slide_excerpts(chunks)
+
+def prepare_notepad_image(image_path: str, session_id: str = None):
+    """
+    Build the data URL and vision detail level for an uploaded notepad image.
+    
+    With settings.drawing_change_detection and a session, the drawing is compared
+    with the session's previous one: an unchanged drawing is not sent at all and a
+    locally edited one is reduced to the changed region. With
+    settings.notepad_image_optimization the drawing is cropped to its strokes and
+    downscaled. Otherwise, or if anything fails, the upload is sent as is.
+    
+    Args:
+        image_path: Path to the uploaded notepad image (WebP format) or stroke vectors
+        session_id: Learning session the drawing belongs to
+        
+    Returns:
+        tuple: (image_url or None, image_detail, drawing_change, fingerprint to remember or None)
+    """
+    if is_stroke_upload(image_path):
+        return prepare_stroke_drawing(image_path, session_id)
+    track_changes = settings.drawing_change_detection and session_id is not None
+    if settings.notepad_image_optimization or track_changes:
+        try:
+            image = load_notepad_image(image_path)
+            original_bytes = os.path.getsize(image_path)
+            original_tokens = estimate_vision_tokens(image.width, image.height, "high")
+            
+            drawing_change = "changed"
+            current_fingerprint = None
+            if track_changes:
+                current_fingerprint = fingerprint(image)
+                change = drawing_tracker.compare(session_id, current_fingerprint)
+                print(f"Drawing change for session {session_id}: {change.kind}")
+                if change.kind == "unchanged":
+                    print(f"Drawing unchanged, skipping image: saved {original_bytes} bytes and ~{original_tokens} vision tokens")
+                    return None, "auto", "unchanged", current_fingerprint
+                if change.kind == "region" and settings.notepad_image_optimization:
+                    image = image.crop(change.bbox)
+                    drawing_change = "region"
+            
+            if settings.notepad_image_optimization:
+                optimized = prepare_image(image, original_bytes, original_tokens)
+                print(f"Notepad image optimized to {optimized.width}x{optimized.height} ({optimized.detail} detail): "
+                      f"saved {optimized.bytes_saved} bytes and ~{optimized.tokens_saved} vision tokens")
+                return optimized.image_url, optimized.detail, drawing_change, current_fingerprint
+            return encode_notepad_upload(image_path), "auto", drawing_change, current_fingerprint
+        except Exception as e:
+            print(f"Notepad image preparation failed, sending original: {str(e)}")
+    
+    return encode_notepad_upload(image_path), "auto", "changed", None
+
+def prepare_stroke_drawing(strokes_path: str, session_id: str = None):
+    """
+    Rasterize a drawing uploaded as stroke vectors for the vision call.
+    
+    Like prepare_notepad_image, but the change since the previous turn comes from
+    comparing stroke lists, and only the crop that is sent is drawn, at the
+    resolution it is sent at. Results are cached per stroke set.
+    
+    Args:
+        strokes_path: Path to the saved stroke upload
+        session_id: Learning session the drawing belongs to
+        
+    Returns:
+        tuple: (image_url or None, image_detail, drawing_change, fingerprint to remember or None)
+    """
+    stroke_set = load_strokes(strokes_path)
+    original_bytes = os.path.getsize(strokes_path)
+    
+    drawing_change = "changed"
+    current_fingerprint = None
+    region = None
+    if settings.drawing_change_detection and session_id is not None:
+        current_fingerprint = stroke_rasterizer.fingerprint(stroke_set)
+        change = drawing_tracker.compare(session_id, current_fingerprint)
+        print(f"Drawing change for session {session_id}: {change.kind} "
+              f"({change.strokes_added} strokes added, {change.strokes_removed} removed)")
+        if change.kind == "unchanged":
+            print(f"Drawing unchanged, skipping image of {len(stroke_set.strokes)} strokes")
+            return None, "auto", "unchanged", current_fingerprint
+        if change.kind == "region" and settings.notepad_image_optimization:
+            region = change.bbox
+            drawing_change = "region"
+    
+    optimized = stroke_rasterizer.rasterize(stroke_set, region, original_bytes)
+    print(f"Rasterized {len(stroke_set.strokes)} strokes ({original_bytes} bytes) to "
+          f"{optimized.width}x{optimized.height} ({optimized.detail} detail, {optimized.optimized_bytes} bytes)")
+    return optimized.image_url, optimized.detail, drawing_change, current_fingerprint
+
+def parse_notepad_strokes(notepad_strokes: str):
+    """Validate a notepad_strokes form field, as a 400 for the client if it is malformed."""
+    try:
+        return parse_strokes(notepad_strokes)
+    except StrokeFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid notepad_strokes: {str(e)}")
+
+def encode_notepad_upload(image_path: str) -> str:
+    """Encode the raw notepad upload as a data URL."""
+    with open(image_path, "rb") as image_file:
+        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+    return f"data:image/webp;base64,{base64_image}"
+
+def prepare_audio_for_transcription(audio_path: str):
+    """
+    Run the silence-trimming preprocessing stage on an uploaded recording.
+    
+    Falls back to the raw upload if ffmpeg is missing or decoding fails, so
+    preprocessing can never break a turn.
+    
+    Args:
+        audio_path: Path to the uploaded recording
+        
+    Returns:
+        tuple: (path of the temporary preprocessed file or None, path to transcribe)
+    """
+    if not ffmpeg_available():
+        print(f"Audio preprocessing skipped: '{settings.ffmpeg_binary}' not found")
+        return None, audio_path
+    try:
+        result = preprocess_audio(audio_path, scratch_space.path("audio_preprocessed"))
+    except Exception as e:
+        print(f"Audio preprocessing failed, using raw upload: {str(e)}")
+        return None, audio_path
+    
+    print(f"Audio preprocessing removed {result.removed_seconds:.1f}s of {result.original_seconds:.1f}s "
+          f"({result.input_bytes} -> {result.output_bytes} bytes) in {result.elapsed_seconds:.3f}s")
+    if result.output_path == audio_path:
+        return None, audio_path
+    return result.output_path, result.output_path
+    
+async def save_uploaded_files(audio_file, notepad, notepad_strokes: str = None):
+    """Save uploaded WebM audio and the WebP image (or stroke vectors) temporarily."""
+    stroke_set = parse_notepad_strokes(notepad_strokes) if notepad_strokes is not None else None
+    if stroke_set is None and notepad is None:
+        raise HTTPException(status_code=400, detail="Send the drawing as notepad_image or notepad_strokes")
     
-async def save_uploaded_files(audio_file, notepad):
-    """Save uploaded WebM audio and WebP image files temporarily."""
     # Save audio file temporarily (WebM format)
     print("Saving audio file temporarily...")
-    audio_path = f"temp_audio_{uuid.uuid4()}.webm"
+    audio_path = scratch_space.path("audio.webm")
     with open(audio_path, "wb") as f:
         audio_content = await audio_file.read()
         print(f"Read {len(audio_content)} bytes from audio file")
         f.write(audio_content)
     print(f"Audio file saved to {audio_path}")
     
+    if stroke_set is not None:
+        image_path = scratch_space.path(f"notepad{STROKE_SUFFIX}")
+        write_strokes(stroke_set, image_path)
+        print(f"Notepad strokes ({len(stroke_set.strokes)}) saved to {image_path}")
+        return audio_path, image_path
+    
     # Save notepad image temporarily (WebP format)
     print("Saving notepad image temporarily...")
-    image_path = f"temp_image_{uuid.uuid4()}.webp"
+    image_path = scratch_space.path("notepad.webp")
     with open(image_path, "wb") as f:
         image_content = await notepad.read()
         print(f"Read {len(image_content)} bytes from notepad image")
@@ -224,19 +450,40 @@ def save_conversation_to_history(user_input: str, ai_response: str):
     return history_file_path
 
 @router.post("/ask-follow-up", response_model=FollowUpResponse)
+@scratch_space.scoped("ask-follow-up")
 async def ask_follow_up(
     concept_id: str = Form(..., description="ID of the concept being explained"),
     last_explanation: bool = Form(False, description="Whether this is the second follow-up question"),
     audio_file: UploadFile = File(..., description="Audio recording of the explanation (WebM format)"),
-    notepad_image: UploadFile = File(..., description="Image of drawn notes or diagram (WebP format)")
+    notepad_image: UploadFile = File(None, description="Image of drawn notes or diagram (WebP format)"),
+    notepad_strokes: str = Form(None, description="The drawing as stroke vectors (JSON), instead of notepad_image"),
+    audio_format: str = Form(None, description="Comma-separated audio formats the client can play, most preferred first, e.g. 'opus,aac,mp3'"),
+    audio_quality: str = Form(DEFAULT_AUDIO_QUALITY, description="Audio quality tier: low, standard or high"),
+    session_id: str = Form(None, description="Learning session ID returned by an earlier turn; a new session is started without one"),
+    course_id: str = Form(None, description="Course the concept belongs to; defaults to settings.default_course_id"),
+    idempotency_key: str = Header(None, alias="Idempotency-Key", description="Client-chosen key; a retry with the same key gets the first response"),
+    response: Response = None
 ):
     """
     Process a follow-up question with audio explanation and notepad drawing.
     
+    A retry that sends the same Idempotency-Key (and the same form data and files)
+    gets the stored response, or waits for the original if it is still running,
+    instead of running the turn again; replays carry Idempotent-Replayed: true.
+    
     Args:
         concept_id: ID of the concept being explained
         audio_file: Audio recording of the user's explanation (WebM format)
         notepad_image: Image of the user's drawn notes (WebP format)
+        notepad_strokes: The drawing as stroke vectors, usually an order of magnitude
+            smaller than the image; rasterized here at the size the vision call needs
+        audio_format: Formats the client can play, most preferred first; defaults to mp3
+        audio_quality: Quality tier whose format is used if none of audio_format can be produced
+        session_id: Learning session the turn belongs to, as returned with an earlier
+            turn. Without one a new session is issued (returned as session_id) and the
+            drawing is sent without comparing it to anything.
+        course_id: Course the concept belongs to
+        idempotency_key: Optional key identifying the turn across retries
         
     Returns:
         JSON response with feedback and base64-encoded audio data
@@ -245,113 +492,654 @@ async def ask_follow_up(
     # Log that the function was called
     print(f"ask_follow_up function called with concept: {concept_id}")
     print(f"Audio file: {audio_file.filename} ({audio_file.content_type})")
-    print(f"Notepad file: {notepad_image.filename} ({notepad_image.content_type})")
+    if notepad_image is not None:
+        print(f"Notepad file: {notepad_image.filename} ({notepad_image.content_type})")
     
-    # Create OpenAI client
-    print("Creating OpenAI client...")
-    client = OpenAI(api_key=settings.openai_api_key)
-    print("OpenAI client created successfully")
+    # Shared client: the turn's calls reuse pooled, already-open connections
+    client = openai_clients.sync()
     
-    # Initialize paths as None to handle cleanup in finally block
-    audio_path = None
-    image_path = None
+    # Uploads and the response audio live in the request's scratch workspace, removed when it ends
     audio_output_path = None
     
     try:
         # Save uploaded files
-        audio_path, image_path = await save_uploaded_files(audio_file, notepad_image)
-
-        # Retrieve the concept from the database
-        concepts = pd.read_csv("extracted_key_concepts/ArtificialIntelligence_2_IntelligentAgents-2_qa.csv")
-        concept_row = concepts.iloc[int(concept_id) - 1]
-        concept_explanation = concept_row.iloc[0]
-        concept_text = concept_row._name[1]
-        print(f"Concept explanation: {concept_explanation}")
-        print(f"Concept text: {concept_text}")
-
-        # Process the follow-up using extracted function
-        feedback, audio_output_path, transcription = process_follow_up(client, audio_path, image_path, concept_explanation, concept_text, last_explanation)
-        
-        # Read the audio file and encode it as base64
-        print("Encoding audio file as base64...")
-        with open(audio_output_path, "rb") as audio_file:
-            audio_data = audio_file.read()
-            print(f"Read {len(audio_data)} bytes from response audio file")
-            audio_base64 = base64.b64encode(audio_data).decode("utf-8")
-        print(f"Audio encoded successfully, base64 length: {len(audio_base64)}")
-        
-        # Save the conversation to history file
-        save_conversation_to_history(transcription, feedback)
+        audio_path, image_path = await save_uploaded_files(audio_file, notepad_image, notepad_strokes)
+        course_id = course_id or settings.default_course_id
+        learner_session_id = session_id or new_learning_session_id()
+
+        async def answer():
+            nonlocal audio_output_path
+            # Retrieve the concept from the catalog
+            concept = resolve_concept(course_id, concept_id)
+            concept_explanation = concept["answer"]
+            concept_text = concept["title"]
+            print(f"Concept explanation: {concept_explanation}")
+            print(f"Concept text: {concept_text}")
+
+            # Process the follow-up using extracted function
+            response_format = negotiate_audio_format(audio_format, audio_quality)
+            print(f"Negotiated audio format: {response_format} (requested: {audio_format}, quality: {audio_quality})")
+            with attribute_usage(endpoint="ask-follow-up", session_id=learner_session_id, concept_id=concept_id, course_id=course_id):
+                # In a worker thread: the turn's upstream calls may queue for a slot (see app/scheduler.py)
+                feedback, audio_output_path, transcription = await run_in_threadpool(
+                    process_follow_up, client, audio_path, image_path, concept_explanation, concept_text, last_explanation,
+                    audio_format=response_format, session_id=session_id, course_id=course_id)
+            
+            # Read the audio file and encode it as base64
+            print("Encoding audio file as base64...")
+            with open(audio_output_path, "rb") as audio_file:
+                audio_data = audio_file.read()
+                print(f"Read {len(audio_data)} bytes from response audio file")
+                audio_base64 = base64.b64encode(audio_data).decode("utf-8")
+            print(f"Audio encoded successfully, base64 length: {len(audio_base64)}")
+            
+            # Save the conversation to history file
+            save_conversation_to_history(transcription, feedback)
+            
+            return {
+                "feedback": feedback,
+                "audio_data": audio_base64,
+                "audio_format": response_format,
+                "audio_mime_type": AUDIO_FORMATS[response_format],
+                "session_id": learner_session_id
+            }
+
+        key = scoped_key("ask-follow-up", idempotency_key)
+        if key is None:
+            result = await answer()
+        else:
+            fingerprint = request_fingerprint(concept_id, course_id, session_id, last_explanation, audio_format, audio_quality,
+                                              files=(audio_path, image_path))
+            result, replayed = await idempotency_cache.run(key, fingerprint, answer)
+            if replayed:
+                print(f"Replaying the stored response for Idempotency-Key {idempotency_key}")
+                response.headers["Idempotent-Replayed"] = "true"
         
         print("Returning response to client")
-        return {
-            "feedback": feedback,
-            "audio_data": audio_base64
-        }
+        return result
         
+    except HTTPException:
+        raise
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except UpstreamUnavailableError as e:
+        print(f"ERROR in ask_follow_up: upstream unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Grandpa is temporarily unavailable, please try again: {str(e)}")
     except Exception as e:
         print(f"ERROR in ask_follow_up: {str(e)}")
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
-        
-    finally:
-        print("Cleaning up temporary files...")
-        # Clean up temporary files
-        for path in [audio_path, image_path, audio_output_path]:
-            if path and os.path.exists(path):
-                try:
-                    os.remove(path)
-                    print(f"Removed temporary file: {path}")
-                except Exception as e:
-                    print(f"Failed to remove temporary file {path}: {str(e)}")
-        print("Cleanup completed")
+
+def catalog_validators(*variant):
+    """
+    ETag and Last-Modified for a catalog response.
+    
+    The ETag combines the catalog version with the request parameters that shape the
+    representation, so different pages or field selections never share a tag.
+    """
+    version, last_modified = course_db.version()
+    variant_hash = hashlib.sha1(repr(variant).encode("utf-8")).hexdigest()[:8]
+    return f'"{version}-{variant_hash}"', last_modified
+
+def not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the current validators."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def set_validators(response: Response, etag: str, last_modified: float) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    # Let browsers cache, but revalidate every time so a new catalog shows up immediately
+    response.headers["Cache-Control"] = "no-cache"
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+@router.get("/courses")
+async def list_courses(request: Request, response: Response):
+    """
+    List all courses that have extracted concepts.
+    
+    Supports conditional requests: returns 304 if the catalog did not change.
+    """
+    etag, last_modified = catalog_validators("courses")
+    if not_modified(request, etag, last_modified):
+        not_modified_response = Response(status_code=304)
+        set_validators(not_modified_response, etag, last_modified)
+        return not_modified_response
+    set_validators(response, etag, last_modified)
+    return course_db.list_courses()
+
+@router.get("/courses/{course_id}/concepts", response_model=ConceptPage)
+async def list_concepts(
+    course_id: str,
+    request: Request,
+    response: Response,
+    cursor: str = Query(None, description="Cursor from the previous page's next_cursor"),
+    limit: int = Query(20, ge=1, le=200, description="Maximum number of concepts per page"),
+    fields: str = Query(None, description="Comma-separated fields to return (concept_id, title, question, answer)")
+):
+    """
+    List the concepts of a course with cursor pagination and field selection.
+    
+    Supports conditional requests via ETag/Last-Modified: returns 304 without
+    touching the concept data if the catalog did not change.
+    """
+    selected_fields = CONCEPT_FIELDS
+    if fields:
+        selected_fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in selected_fields if field not in CONCEPT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    offset = decode_cursor(cursor) if cursor else 0
+    
+    etag, last_modified = catalog_validators("concepts", course_id, offset, limit, selected_fields)
+    if not_modified(request, etag, last_modified):
+        not_modified_response = Response(status_code=304)
+        set_validators(not_modified_response, etag, last_modified)
+        return not_modified_response
+    
+    # Fetch one extra row to know whether there is a next page
+    page = course_db.get_concepts(course_id, offset=offset, limit=limit + 1)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Course not found: {course_id}")
+    
+    has_more = len(page) > limit
+    page = page[:limit]
+    set_validators(response, etag, last_modified)
+    return ConceptPage(
+        items=[{field: concept[field] for field in selected_fields} for concept in page],
+        next_cursor=encode_cursor(offset + len(page)) if has_more else None
+    )
+
+@router.get("/concepts/search")
+async def search_concepts(
+    q: str = Query(..., min_length=1, description="Search text"),
+    k: int = Query(10, ge=1, le=100, description="Maximum number of results"),
+    course_id: str = Query(None, description="Restrict results to one course")
+):
+    """
+    Search concept titles, questions and answers across all courses with the local BM25 index.
+    """
+    # SQLite reads and, if the catalog changed, an index rebuild: keep them off the event loop
+    return {"results": await run_in_threadpool(concept_search.search, q, k=k, course_id=course_id)}
+
+@router.post("/concepts/match")
+async def match_concepts(
+    transcription: str = Form(..., description="What the learner said"),
+    course_id: str = Form(None, description="Restrict matches to one course"),
+    k: int = Form(3, description="Number of concepts to return")
+):
+    """
+    Find the concepts a learner's transcription most likely talks about.
+    """
+    return {"matches": await run_in_threadpool(concept_search.search, transcription, k=max(1, min(k, 20)), course_id=course_id)}
 
 @router.get("/get-key-concepts")
-async def get_key_concepts():
+async def get_key_concepts(course_id: str = None):
     """
-    Get the key concepts for the hardcoded course.
+    Get the first key concepts of a course as [concept_id, title, question] lists.
+    
+    Kept for the current frontend; new clients should use /courses/{course_id}/concepts.
     """
-    concepts = pd.read_csv("extracted_key_concepts/ArtificialIntelligence_2_IntelligentAgents-2_qa.csv")
+    concepts = course_db.get_concepts(course_id or settings.default_course_id, limit=10)
+    if concepts is None:
+        raise HTTPException(status_code=404, detail=f"Course not found: {course_id}")
 
-    key_concepts = []
-    for tuples in concepts.head(10).itertuples():
-        key_concepts.append(tuples[0]) # DO NOT CHANGE THIS
+    return [[concept["concept_id"], concept["title"], concept["question"]] for concept in concepts]
 
-    return key_concepts
+@router.get("/metrics/upstream")
+async def get_upstream_metrics():
+    """
+    Get per-operation counters of the upstream call layer (retries, hedges won, ...)
+    and the state of each circuit breaker.
+    """
+    return {
+        "operations": upstream.metrics.snapshot(),
+        "connections": openai_clients.stats.snapshot(),
+        "scheduler": upstream.scheduler.snapshot() if upstream.scheduler else None,
+        "circuit_breakers": {operation: upstream.breaker(operation).state for operation in upstream.policies},
+    }
+
+@router.get("/metrics/evaluation")
+async def get_evaluation_metrics():
+    """
+    Get how many evaluations the local coverage scorer answered (LLM calls avoided)
+    and how often audited local scores agreed with the LLM.
+    """
+    return evaluator.snapshot()
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Guard for /admin endpoints when settings.admin_token is configured."""
+    if settings.admin_token and x_admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("/admin/usage", dependencies=[Depends(require_admin)])
+async def get_usage_summary(
+    group_by: str = Query("session_id", description=f"One of {', '.join(GROUP_BY_FIELDS)}"),
+    since_seconds: float = Query(None, ge=0, description="Only count calls from the last N seconds"),
+    session_id: str = Query(None, description="Only count calls of this session"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Get upstream token usage, estimated cost and wall time aggregated by session,
+    concept, course, endpoint, model or operation.
+    """
+    if group_by not in GROUP_BY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+    since = time.time() - since_seconds if since_seconds is not None else None
+    return {"group_by": group_by, "groups": usage_ledger.summary(group_by, since=since, session_id=session_id, limit=limit)}
+
+@router.get("/admin/usage/sessions/{session_id}", dependencies=[Depends(require_admin)])
+async def get_session_usage(session_id: str, limit: int = Query(50, ge=1, le=500)):
+    """
+    Get a session's usage totals, whether it is over budget, and its most recent calls.
+    """
+    return {
+        "session_id": session_id,
+        "totals": usage_ledger.session_totals(session_id),
+        "over_budget": usage_ledger.over_budget(session_id),
+        "calls": usage_ledger.recent(session_id=session_id, limit=limit),
+    }
 
 # Endpoints for real-time transcription
 
+def sweep_voice_sessions(now: float = None) -> int:
+    """
+    Drop voice sessions older than settings.voice_session_ttl_seconds, with their drafts.
+    
+    Finalize removes a session only when it succeeds; abandoned and failed turns
+    would otherwise keep their transcript, drawings and draft for good.
+    
+    Returns:
+        Number of sessions dropped
+    """
+    now = time.time() if now is None else now
+    expired = [session_id for session_id, session in list(active_voice_sessions.items())
+               if now - session["created_at"] > settings.voice_session_ttl_seconds]
+    for session_id in expired:
+        active_voice_sessions.pop(session_id, None)
+        speculator.discard(session_id)
+    if expired:
+        print(f"Dropped {len(expired)} voice sessions that were never finalized")
+    return len(expired)
+
 @router.post("/session/initiate")
-async def initiate_voice_session(concept_id: str = Form(...)):
+async def initiate_voice_session(
+    concept_id: str = Form(...),
+    course_id: str = Form(None, description="Course the concept belongs to"),
+    learning_session_id: str = Form(None, description="Learning session returned by an earlier turn (drawing history, usage); a new one is started without it"),
+    last_explanation: bool = Form(False, description="Whether this is the second follow-up question")
+):
     """
     Initiate a voice session and return the endpoint to the client
-    """ 
+    
+    Expired voice sessions are swept first (see sweep_voice_sessions).
+    """
+    sweep_voice_sessions()
+    course_id = course_id or settings.default_course_id
+    concept = resolve_concept(course_id, concept_id)
     session_id: str = str(uuid.uuid4())
     active_voice_sessions[session_id] = {
         "concept_id": concept_id,
-        "audio_chunks": [],
-        "transcription": ""
+        "course_id": course_id,
+        "concept": concept,
+        "learning_session_id": learning_session_id or new_learning_session_id(),
+        # Drawings are only compared with a session the client continues
+        "drawing_session_id": learning_session_id,
+        "last_explanation": last_explanation,
+        "transcript": TranscriptBuffer(),
+        "drawing": None,
+        "client": openai_clients.sync(),
+        "created_at": time.time()
     }
     print(f"Session initiated with ID: {session_id}")
     return {
         "session_id": session_id,
-        "endpoint": f"api/session/stream_audio/{session_id}"
+        "learning_session_id": active_voice_sessions[session_id]["learning_session_id"],
+        "endpoint": f"api/session/stream_audio_async/{session_id}"
+    }
+
+def run_speculative_draft(session: dict, transcript: str, drawing: Optional[dict]):
+    """
+    Draft grandpa's answer from the transcript so far (runs on the speculator's threads).
+
+    Returns:
+        tuple: (feedback, tokens used)
+    """
+    concept = session["concept"]
+    slide_excerpts = None
+    if settings.slide_context:
+        slide_excerpts = retrieve_slide_excerpts(session["course_id"], f"{concept['title']} {transcript}")
+    usage = {}
+    with attribute_usage(endpoint="speculative-draft", session_id=session["learning_session_id"],
+                         concept_id=session["concept_id"], course_id=session["course_id"]):
+        feedback = analyze_image(
+            client=session["client"],
+            transcription=transcript,
+            image_url=drawing["image_url"] if drawing else None,
+            concept_explanation=concept["answer"],
+            concept_text=concept["title"],
+            conversation_history=load_conversation_history(),
+            last_explanation=session["last_explanation"],
+            image_detail=drawing["image_detail"] if drawing else "auto",
+            drawing_change=drawing["drawing_change"] if drawing else "pending",
+            slide_excerpts=slide_excerpts,
+            usage_out=usage
+        )
+    return feedback, usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+def start_speculative_draft(session_id: str):
+    """Start a draft on the current transcript and drawing when the learner pauses."""
+    session = active_voice_sessions.get(session_id)
+    if not settings.speculation_enabled or session is None:
+        return
+    transcript = session["transcript"].text()
+    draft = speculator.speculate(session_id, transcript, session["drawing"],
+                                 lambda text, drawing: run_speculative_draft(session, text, drawing))
+    if draft is not None:
+        print(f"Speculative draft for session {session_id} on {len(transcript.split())} words")
+
+def prepare_session_drawing(image_path: str, learning_session_id: Optional[str]) -> dict:
+    """Prepare a notepad upload for the vision call and key it by content."""
+    with open(image_path, "rb") as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+    image_url, image_detail, drawing_change, drawing_fingerprint = prepare_notepad_image(image_path, learning_session_id)
+    return {
+        "key": key,
+        "image_url": image_url,
+        "image_detail": image_detail,
+        "drawing_change": drawing_change,
+        "fingerprint": drawing_fingerprint
     }
 
+def same_drawing(draft_drawing: Optional[dict], final_drawing: dict) -> bool:
+    """Whether the drawing a draft looked at still matches the final drawing."""
+    if draft_drawing is None:
+        # The draft saw no drawing; that only holds if there is nothing new to see
+        return final_drawing["image_url"] is None
+    if draft_drawing["key"] == final_drawing["key"]:
+        return True
+    if draft_drawing["fingerprint"] is None or final_drawing["fingerprint"] is None:
+        return False
+    return compare_fingerprints(draft_drawing["fingerprint"], final_drawing["fingerprint"]).kind == "unchanged"
+
+async def save_notepad_upload(notepad: UploadFile, notepad_strokes: str = None) -> str:
+    """Save an uploaded notepad image (or stroke vectors) temporarily and return its path."""
+    if notepad_strokes is not None:
+        stroke_set = parse_notepad_strokes(notepad_strokes)
+        strokes_path = scratch_space.path(f"notepad{STROKE_SUFFIX}")
+        write_strokes(stroke_set, strokes_path)
+        return strokes_path
+    if notepad is None:
+        raise HTTPException(status_code=400, detail="Send the drawing as notepad_image or notepad_strokes")
+    image_path = scratch_space.path("notepad.webp")
+    with open(image_path, "wb") as f:
+        f.write(await notepad.read())
+    return image_path
+
+@router.post("/session/{session_id}/drawing")
+@scratch_space.scoped("session-drawing")
+async def update_session_drawing(
+    session_id: str,
+    notepad_image: UploadFile = File(None, description="Current notepad drawing (WebP format)"),
+    notepad_strokes: str = Form(None, description="The drawing as stroke vectors (JSON), instead of notepad_image")
+):
+    """
+    Share the learner's current drawing while they are talking, so speculative
+    drafts can look at it. Starts a new draft if the learner is pausing.
+    """
+    session = active_voice_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Voice session not found: {session_id}")
+    image_path = await save_notepad_upload(notepad_image, notepad_strokes)
+    session["drawing"] = await run_in_threadpool(prepare_session_drawing, image_path, session["drawing_session_id"])
+    if not session["transcript"].pending:
+        start_speculative_draft(session_id)
+    return {"session_id": session_id, "drawing_change": session["drawing"]["drawing_change"]}
+
 
-async def openai_message_listener(session_id: str, openai_ws: websockets.client.ClientProtocol):
-    pass
+async def openai_message_listener(session_id: str, openai_ws: ClientConnection):
+    """Fold realtime transcription events into the session transcript; draft at every pause."""
+    transcript = active_voice_sessions[session_id]["transcript"]
+    async for message in openai_ws:
+        try:
+            event = json.loads(message)
+        except ValueError:
+            continue
+        kind = transcript.apply(event)
+        if kind == "error":
+            print(f"Realtime transcription error in session {session_id}: {event.get('error', event)}")
+        elif kind == "segment":
+            print(f"Segment transcribed for session {session_id}: {event.get('transcript', '')!r}")
+            start_speculative_draft(session_id)
 
 
 @router.websocket("/session/stream_audio_async/{session_id}")
 async def stream_audio_async(websocket: WebSocket, session_id: str):
-    pass    
-        
+    """
+    Relay the learner's microphone to the realtime transcription API.
+
+    The client sends binary frames of pcm16 mono audio at 24 kHz and a
+    {"type": "stop"} text frame (or simply disconnects) when the learner is done.
+    """
+    session = active_voice_sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    transcript = session["transcript"]
+    headers = {"Authorization": f"Bearer {settings.openai_api_key}", "OpenAI-Beta": "realtime=v1"}
+    listener = None
+    try:
+        async with connect(settings.openai_transcription_url, additional_headers=headers) as openai_ws:
+            await openai_ws.send(json.dumps(transcription_session_update(prompt=session["concept"]["title"])))
+            listener = asyncio.create_task(openai_message_listener(session_id, openai_ws))
+            while not listener.done():
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await openai_ws.send(json.dumps(audio_append_event(message["bytes"])))
+                elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                    break
+
+            # Transcribe whatever is still buffered after the last pause
+            if not listener.done():
+                transcript.expect_commit()
+                await openai_ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
+                await transcript.wait_settled(settings.realtime_final_transcript_wait_seconds)
+    except WebSocketDisconnect:
+        print(f"Client disconnected from session {session_id}")
+    except (WebSocketException, OSError) as e:
+        print(f"Realtime transcription connection failed for session {session_id}: {str(e)}")
+        try:
+            await websocket.close(code=1011)
+        except RuntimeError:
+            pass
+    finally:
+        if listener is not None:
+            listener.cancel()
+
+
+def finalize_feedback(session_id: str, session: dict, transcription: str, image_path: str, last_explanation: bool):
+    """
+    Grandpa's answer for a finished voice turn, reusing the speculative draft if possible.
+
+    Returns:
+        tuple: (feedback, outcome kind: "hit", "revise" or "miss")
+    """
+    client = session["client"]
+    concept = session["concept"]
+    final_drawing = prepare_session_drawing(image_path, session["drawing_session_id"])
+    if last_explanation != session["last_explanation"] or not settings.speculation_enabled:
+        # The draft answered a different kind of turn
+        speculator.discard(session_id)
+    outcome = speculator.resolve(session_id, transcription, lambda draft: same_drawing(draft.drawing, final_drawing))
+    print(f"Speculation outcome for session {session_id}: {outcome.kind} ({outcome.reason})")
+
+    feedback = None
+    if outcome.kind == "hit":
+        feedback = outcome.feedback
+    elif outcome.kind == "revise":
+        try:
+            usage = {}
+            drawing_changed = not same_drawing(outcome.draft.drawing, final_drawing)
+            feedback = revise_analysis(
+                client, outcome.feedback, outcome.draft.transcript, transcription, concept["title"],
+                image_url=final_drawing["image_url"] if drawing_changed else None,
+                image_detail=final_drawing["image_detail"],
+                usage_out=usage
+            )
+            speculator.record_revision(usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+        except Exception as e:
+            print(f"Revising the draft failed, running the full analysis: {str(e)}")
+    if feedback is None:
+        slide_excerpts = None
+        if settings.slide_context:
+            slide_excerpts = retrieve_slide_excerpts(session["course_id"], f"{concept['title']} {transcription}")
+        feedback = analyze_image(
+            client=client,
+            transcription=transcription,
+            image_url=final_drawing["image_url"],
+            concept_explanation=concept["answer"],
+            concept_text=concept["title"],
+            conversation_history=load_conversation_history(),
+            last_explanation=last_explanation,
+            image_detail=final_drawing["image_detail"],
+            drawing_change=final_drawing["drawing_change"],
+            slide_excerpts=slide_excerpts
+        )
+    if final_drawing["fingerprint"] is not None:
+        drawing_tracker.remember(session["drawing_session_id"], final_drawing["fingerprint"])
+    return feedback, outcome.kind
 
 @router.post("/session/finalize_stream", response_model=FollowUpResponse)
+@scratch_space.scoped("finalize-stream")
 async def finalize_stream_multi_session(
     session_id: str = Form(...),
-    notepad_image: UploadFile = File(..., description="Image of drawn notes or diagram (WebP format)"),
-    last_explanation: bool = Form(False, description="Whether this is the second follow-up question")
+    notepad_image: UploadFile = File(None, description="Image of drawn notes or diagram (WebP format)"),
+    notepad_strokes: str = Form(None, description="The drawing as stroke vectors (JSON), instead of notepad_image"),
+    last_explanation: bool = Form(False, description="Whether this is the second follow-up question"),
+    audio_format: str = Form(None, description="Comma-separated audio formats the client can play, most preferred first"),
+    audio_quality: str = Form(DEFAULT_AUDIO_QUALITY, description="Quality tier: 'low', 'standard' or 'high'"),
+    idempotency_key: str = Header(None, alias="Idempotency-Key", description="Client-chosen key; a retry with the same key gets the first response"),
+    response: Response = None
 ):
-    pass
\ No newline at end of file
+    """
+    Finish a voice turn: answer from the live transcript and the final drawing.
+
+    The answer drafted during the learner's last pause is reused when the
+    transcript and drawing did not change materially since, so usually only
+    speech synthesis remains between the end of speech and grandpa speaking.
+    A retry with the same Idempotency-Key gets the stored response, also after
+    the voice session was closed by the original request.
+    """
+    key = scoped_key("finalize-stream", idempotency_key)
+    if key is None and session_id not in active_voice_sessions:
+        raise HTTPException(status_code=404, detail=f"Voice session not found: {session_id}")
+    started = time.monotonic()
+    image_path = None
+
+    async def answer():
+        session = active_voice_sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Voice session not found: {session_id}")
+        transcript = session["transcript"]
+        if not await transcript.wait_settled(settings.realtime_final_transcript_wait_seconds):
+            print(f"Segments {transcript.pending} of session {session_id} not transcribed in time, using partial text")
+        transcription = transcript.text(include_partial=True)
+        if not transcription:
+            raise HTTPException(status_code=400, detail="Nothing was transcribed in this session")
+
+        response_format = negotiate_audio_format(audio_format, audio_quality)
+        with attribute_usage(endpoint="finalize-stream", session_id=session["learning_session_id"],
+                             concept_id=session["concept_id"], course_id=session["course_id"]):
+            feedback, outcome = await run_in_threadpool(finalize_feedback, session_id, session, transcription, image_path, last_explanation)
+            audio_data = await run_in_threadpool(synthesize_speech, session["client"], feedback, response_format)
+        speculator.metrics.observe_finalize(outcome, time.monotonic() - started)
+        print(f"Voice turn of session {session_id} answered in {time.monotonic() - started:.2f}s ({outcome})")
+
+        save_conversation_to_history(transcription, feedback)
+        active_voice_sessions.pop(session_id, None)
+        return {
+            "feedback": feedback,
+            "audio_data": base64.b64encode(audio_data).decode("utf-8"),
+            "audio_format": response_format,
+            "audio_mime_type": AUDIO_FORMATS[response_format],
+            "session_id": session["learning_session_id"]
+        }
+
+    try:
+        image_path = await save_notepad_upload(notepad_image, notepad_strokes)
+        if key is None:
+            return await answer()
+        fingerprint = request_fingerprint(session_id, last_explanation, audio_format, audio_quality, files=(image_path,))
+        result, replayed = await idempotency_cache.run(key, fingerprint, answer)
+        if replayed:
+            print(f"Replaying the stored response for Idempotency-Key {idempotency_key}")
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+    except HTTPException:
+        raise
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except UpstreamUnavailableError as e:
+        print(f"ERROR in finalize_stream: upstream unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Grandpa is temporarily unavailable, please try again: {str(e)}")
+    except Exception as e:
+        print(f"ERROR in finalize_stream: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+@router.get("/metrics/scratch")
+async def get_scratch_metrics():
+    """
+    Get scratch space usage: bytes and files in it, open workspaces, whether it is
+    RAM-backed, free space on its filesystem and what the sweeper removed.
+    """
+    return await run_in_threadpool(scratch_space.usage)
+
+@router.get("/metrics/caches")
+async def get_cache_metrics():
+    """
+    Get idempotent-replay counters (responses executed, replayed or joined while in
+    flight, key conflicts), transcription cache hits and stroke rasterization cache hits.
+    """
+    return {"idempotency": idempotency_cache.snapshot(), "transcription": transcription_cache.snapshot(),
+            "stroke_rasterization": stroke_rasterizer.snapshot()}
+
+@router.get("/metrics/routing")
+async def get_routing_metrics():
+    """
+    Get model routing counters per operation (easy and hard calls, latency switches),
+    the cost of the calls made against their alternative model, median wall time per
+    difficulty and the recent average latency of each model.
+    """
+    return model_router.snapshot()
+
+@router.get("/metrics/speculation")
+async def get_speculation_metrics():
+    """
+    Get speculative-draft counters: hit rate, revisions, misses, wasted tokens and
+    the average finalize latency per outcome.
+    """
+    return speculator.metrics.snapshot()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from .config import settings
+
+try:
+    import webrtcvad
+except ImportError:  # optional, the energy-based detector below is used instead
+    webrtcvad = None
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# Output codecs for the re-encoded recording: ffmpeg arguments and file extension.
+# Both are accepted by the transcription endpoint.
+OUTPUT_CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip"], "ogg"),
+    "flac": (["-c:a", "flac"], "flac"),
+}
+
+
+@dataclass
+class PreprocessingResult:
+    """Outcome of preprocess_audio, used for logging and the preprocessing benchmark."""
+    output_path: str
+    original_seconds: float
+    kept_seconds: float
+    input_bytes: int
+    output_bytes: int
+    elapsed_seconds: float
+
+    @property
+    def removed_seconds(self) -> float:
+        return self.original_seconds - self.kept_seconds
+
+
+def ffmpeg_available() -> bool:
+    """Check whether the configured ffmpeg binary can be found."""
+    return shutil.which(settings.ffmpeg_binary) is not None
+
+
+def decode_to_pcm(audio_file_path: str) -> np.ndarray:
+    """
+    Decode any container the browser may send into mono 16 kHz signed 16-bit samples.
+
+    Args:
+        audio_file_path: Path to the uploaded recording (WebM, WAV, ...)
+
+    Returns:
+        1-D int16 array of samples
+    """
+    result = subprocess.run(
+        [settings.ffmpeg_binary, "-nostdin", "-v", "error", "-i", audio_file_path,
+         "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        capture_output=True,
+        check=True,
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def encode_pcm(samples: np.ndarray, output_path: str, codec: str) -> None:
+    """Encode mono 16 kHz int16 samples with one of OUTPUT_CODECS."""
+    codec_args, _ = OUTPUT_CODECS[codec]
+    subprocess.run(
+        [settings.ffmpeg_binary, "-nostdin", "-v", "error", "-y",
+         "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "-",
+         *codec_args, output_path],
+        input=samples.tobytes(),
+        capture_output=True,
+        check=True,
+    )
+
+
+def detect_speech_frames(samples: np.ndarray) -> np.ndarray:
+    """
+    Classify each 30 ms frame as speech or silence.
+
+    Uses webrtcvad when it is installed, otherwise an adaptive energy threshold
+    relative to the recording's noise floor.
+
+    Args:
+        samples: Mono 16 kHz int16 samples
+
+    Returns:
+        Boolean array with one entry per full frame
+    """
+    frame_count = len(samples) // FRAME_SAMPLES
+    if frame_count == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[:frame_count * FRAME_SAMPLES].reshape(frame_count, FRAME_SAMPLES)
+
+    if webrtcvad is not None:
+        vad = webrtcvad.Vad(settings.audio_vad_aggressiveness)
+        return np.array([vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in frames], dtype=bool)
+
+    rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1)) + 1e-6
+    level_db = 20 * np.log10(rms / 32768.0)
+    noise_floor_db = np.percentile(level_db, 10)
+    threshold_db = max(noise_floor_db + 12.0, -50.0)
+    return level_db > threshold_db
+
+
+def select_kept_frames(is_speech: np.ndarray) -> np.ndarray:
+    """
+    Decide which frames survive trimming.
+
+    Speech frames are padded on both sides, leading and trailing silence is dropped
+    and internal pauses are shortened to settings.audio_max_silence_seconds so the
+    transcription still sees sentence boundaries.
+    """
+    frame_seconds = FRAME_MS / 1000
+    padding = int(round(settings.audio_speech_padding_seconds / frame_seconds))
+    max_gap = int(round(settings.audio_max_silence_seconds / frame_seconds))
+
+    # Widen speech regions by the padding (a 1-D dilation). The centre slice of the
+    # full convolution has one entry per frame; mode="same" would not when the
+    # window is longer than the clip.
+    window = np.ones(2 * padding + 1, dtype=np.int32)
+    padded = np.convolve(is_speech.astype(np.int32), window, mode="full")[padding:padding + len(is_speech)] > 0
+    keep = padded.copy()
+
+    speech_indices = np.flatnonzero(padded)
+    if len(speech_indices) == 0:
+        return keep
+    first, last = speech_indices[0], speech_indices[-1]
+
+    # Inside the speech span, keep only the first max_gap frames of every pause
+    gap_start = None
+    for index in range(first, last + 1):
+        if padded[index]:
+            gap_start = None
+            continue
+        if gap_start is None:
+            gap_start = index
+        if index - gap_start < max_gap:
+            keep[index] = True
+    return keep
+
+
+def preprocess_audio(audio_file_path: str, output_path_stem: str) -> PreprocessingResult:
+    """
+    Trim silence from a recording and re-encode it compactly before transcription.
+
+    Args:
+        audio_file_path: Path to the uploaded recording
+        output_path_stem: Output path without extension; the codec's extension is appended
+
+    Returns:
+        PreprocessingResult. If no speech is detected the original file is returned
+        untouched, so quiet recordings are never dropped entirely.
+    """
+    start = time.perf_counter()
+    input_bytes = os.path.getsize(audio_file_path)
+
+    samples = decode_to_pcm(audio_file_path)
+    original_seconds = len(samples) / SAMPLE_RATE
+    is_speech = detect_speech_frames(samples)
+
+    if not is_speech.any():
+        print("Audio preprocessing: no speech detected, keeping original recording")
+        return PreprocessingResult(audio_file_path, original_seconds, original_seconds, input_bytes, input_bytes,
+                                   time.perf_counter() - start)
+
+    keep = select_kept_frames(is_speech)
+    frame_count = len(keep)
+    frames = samples[:frame_count * FRAME_SAMPLES].reshape(frame_count, FRAME_SAMPLES)
+    trimmed = frames[keep].reshape(-1)
+
+    codec = settings.audio_preprocessing_codec
+    output_path = f"{output_path_stem}.{OUTPUT_CODECS[codec][1]}"
+    encode_pcm(trimmed, output_path, codec)
+
+    return PreprocessingResult(
+        output_path=output_path,
+        original_seconds=original_seconds,
+        kept_seconds=len(trimmed) / SAMPLE_RATE,
+        input_bytes=input_bytes,
+        output_bytes=os.path.getsize(output_path),
+        elapsed_seconds=time.perf_counter() - start,
+    )
+
@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+from .concepts import parse_concepts_csv
+from .config import settings
+from .course_db import course_db
+from .intro_speech import intro_speech
+from .page_rasterizer import PageImage, init_pool_worker
+from .pdf_stream import iter_pdf_pages
+from .pdf_uploads import file_sha256
+from .search_index import concept_search
+from .slide_extractor_with_images import generate_questions_answers, store_course
+from .usage_ledger import attribute_usage
+
+STAGES = ("extract", "generate", "store")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def course_id_for_deck(root: Path, path: Path) -> str:
+    """Course ID of a deck: its path below the root without .pdf, directories joined with "_"."""
+    return "_".join(path.relative_to(root).with_suffix("").parts)
+
+
+def _write_json(path: Path, data) -> None:
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def extract_deck(pdf_path: str, work_dir: str) -> dict:
+    """
+    Extraction stage: page texts and selected images of a deck, written to work_dir.
+
+    Runs in a worker process. Embedded images are spilled to work_dir/images and
+    renders stay in the render cache; extract.json lists the texts and image files.
+    """
+    started = time.monotonic()
+    work_dir = Path(work_dir)
+    images_dir = work_dir / "images"
+    # A previous, interrupted attempt may have left images behind
+    shutil.rmtree(images_dir, ignore_errors=True)
+    page_texts, images = [], []
+    for page in iter_pdf_pages(pdf_path, images_dir):
+        page_texts.append(page.text)
+        images.extend({"page_number": image.page_number, "path": str(image.payload), "width": image.width,
+                       "height": image.height, "source": image.source} for image in page.images)
+    _write_json(work_dir / "extract.json", {"page_texts": page_texts, "images": images})
+    return {"pages": len(page_texts), "images": len(images), "seconds": round(time.monotonic() - started, 3)}
+
+
+def load_extraction(work_dir: Path) -> dict:
+    with open(Path(work_dir) / "extract.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def generate_deck(course_id: str, work_dir: str) -> dict:
+    """Generation stage: the concept CSV for an extracted deck, written to work_dir/qa.csv."""
+    started = time.monotonic()
+    extraction = load_extraction(work_dir)
+    images = [PageImage(image["page_number"], Path(image["path"]), image["width"], image["height"], image["source"])
+              for image in extraction["images"]]
+    with attribute_usage(endpoint="bulk-ingest", course_id=course_id):
+        qa_content = generate_questions_answers("".join(extraction["page_texts"]), images=images)
+    concepts = parse_concepts_csv(qa_content)
+    if not concepts:
+        raise ValueError("The model's answer contained no concepts")
+    (Path(work_dir) / "qa.csv").write_text(qa_content, encoding="utf-8")
+    return {"concepts": len(concepts), "seconds": round(time.monotonic() - started, 3)}
+
+
+class Manifest:
+    """
+    Checkpoints of a bulk ingestion, one entry per deck (keyed by its path below the root).
+
+    Each entry records the deck's content hash, course ID, status and the result of
+    every finished stage. The file is rewritten atomically after every change, so an
+    interrupted run loses at most the stages that were in flight.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"created_at": _now(), "decks": {}}
+
+    def entry(self, key: str) -> dict:
+        return self.data["decks"].get(key, {})
+
+    def reset(self, key: str, **fields) -> dict:
+        """Start a deck's entry over, e.g. because its content changed."""
+        with self._lock:
+            self.data["decks"][key] = dict(fields, stages={})
+            self._save()
+            return self.data["decks"][key]
+
+    def update(self, key: str, **fields) -> None:
+        with self._lock:
+            self.data["decks"][key].update(fields)
+            self._save()
+
+    def complete_stage(self, key: str, stage: str, result: dict) -> None:
+        with self._lock:
+            entry = self.data["decks"][key]
+            entry["stages"][stage] = dict(result, finished_at=_now())
+            entry["status"] = stage if stage != "store" else "completed"
+            entry.pop("error", None)
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.data["updated_at"] = _now()
+        _write_json(self.path, self.data)
+
+
+def default_manifest_path(root: Path) -> Path:
+    """course_data/bulk_ingest/<root name>-<hash of the root's absolute path>/manifest.json"""
+    digest = hashlib.sha1(str(Path(root).resolve()).encode("utf-8")).hexdigest()[:8]
+    return Path(settings.bulk_ingest_dir) / f"{Path(root).resolve().name}-{digest}" / "manifest.json"
+
+
+class BulkIngestor:
+    """
+    Ingests a directory tree of decks with resumable, per-stage checkpoints.
+
+    Decks go through three stages: extract (page texts and images, in a process pool
+    since it is CPU-bound), generate (the concept CSV from the model, in a thread pool
+    since it waits on the network) and store (course database and slide index, in the
+    calling thread, since the database has a single writer). Extraction of later
+    decks overlaps with generation of earlier ones. Every finished stage is recorded
+    in the manifest with its output under the work directory, so a rerun continues
+    each deck from its last finished stage. Decks whose content hash was already
+    ingested (by an earlier run or an upload) are skipped.
+    """
+
+    def __init__(self, root, manifest_path: Path = None, extract_workers: int = None, generate_workers: int = None,
+                 force: bool = False, intro_speech_enabled: bool = None):
+        self.root = Path(root)
+        self.manifest = Manifest(manifest_path or default_manifest_path(self.root))
+        self.work_root = self.manifest.path.parent / "work"
+        self.extract_workers = extract_workers or settings.bulk_ingest_extract_workers
+        self.generate_workers = generate_workers or settings.bulk_ingest_generate_workers
+        self.force = force
+        self.intro_speech_enabled = settings.intro_speech_pregeneration if intro_speech_enabled is None else intro_speech_enabled
+        self.outcomes = {"ingested": [], "skipped": [], "failed": []}
+        self.resumed = 0
+        self.stage_seconds = {stage: [] for stage in STAGES}
+        self.run_ids = {}
+
+    def discover(self) -> List[Path]:
+        return sorted(path for path in self.root.rglob("*") if path.is_file() and path.suffix.lower() == ".pdf")
+
+    def work_dir(self, content_hash: str) -> Path:
+        path = self.work_root / content_hash[:16]
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _next_stage(self, entry: dict) -> str:
+        """The first stage whose checkpoint is missing or whose output is gone."""
+        stages = entry.get("stages", {})
+        work_dir = self.work_root / entry["sha256"][:16]
+        if "extract" not in stages or not (work_dir / "extract.json").exists():
+            return "extract"
+        # Renders live in the render cache, which may have been cleared since
+        if not all(Path(image["path"]).exists() for image in load_extraction(work_dir)["images"]):
+            return "extract"
+        if "generate" not in stages or not (work_dir / "qa.csv").exists():
+            return "generate"
+        return "store"
+
+    def _plan(self, paths: List[Path]) -> Dict[str, dict]:
+        """Hash every deck and decide what is left to do; returns the decks to process by key."""
+        with ThreadPoolExecutor(max_workers=self.generate_workers) as pool:
+            hashes = dict(zip(paths, pool.map(file_sha256, paths)))
+
+        todo = {}
+        seen = {}
+        course_keys = {}
+        for path in paths:
+            key = path.relative_to(self.root).as_posix()
+            content_hash = hashes[path]
+            entry = self.manifest.entry(key)
+            if entry.get("sha256") != content_hash or self.force:
+                entry = self.manifest.reset(key, path=str(path), sha256=content_hash,
+                                            course_id=course_id_for_deck(self.root, path), status="pending")
+            # week1/agents.pdf and week1_agents.pdf map to the same course; the second would overwrite the first
+            claimed_by = course_keys.setdefault(entry["course_id"], key)
+            if claimed_by != key:
+                self._refuse(key, f"course ID '{entry['course_id']}' is already used by {claimed_by}")
+                continue
+            # So would a deck named like a course that came from another deck (e.g. an upload)
+            existing = course_db.get_course(entry["course_id"])
+            if (existing is not None and existing["content_hash"] not in (None, content_hash)
+                    and not (existing["source_path"] and Path(existing["source_path"]).resolve() == path.resolve())):
+                self._refuse(key, f"course ID '{entry['course_id']}' already belongs to {existing['source_path']}")
+                continue
+            if entry.get("status") in ("completed", "skipped"):
+                self.outcomes["skipped"].append(key)
+                continue
+
+            previous = None if self.force else course_db.find_completed_run(content_hash)
+            duplicate = seen.get(content_hash)
+            if previous is not None or duplicate is not None:
+                reason = f"already ingested as '{previous['course_key']}'" if previous else f"same content as {duplicate}"
+                self.manifest.update(key, status="skipped", reason=reason)
+                self.outcomes["skipped"].append(key)
+                continue
+            seen[content_hash] = key
+            if entry.get("stages"):
+                self.resumed += 1
+            todo[key] = entry
+        return todo
+
+    def _refuse(self, key: str, error: str) -> None:
+        """Fail a deck while planning, before any stage ran."""
+        print(f"{key}: plan: {error}")
+        self.manifest.update(key, status="failed", error=f"plan: {error}")
+        self.outcomes["failed"].append(key)
+
+    def _fail(self, key: str, stage: str, error: Exception) -> None:
+        print(f"{key}: {stage} failed: {error}")
+        self.manifest.update(key, status="failed", error=f"{stage}: {error}")
+        course_db.finish_ingestion_run(self.run_ids.pop(key), error=f"{stage}: {error}")
+        self.outcomes["failed"].append(key)
+
+    def _store(self, key: str) -> None:
+        entry = self.manifest.entry(key)
+        started = time.monotonic()
+        work_dir = self.work_dir(entry["sha256"])
+        concepts = parse_concepts_csv((work_dir / "qa.csv").read_text(encoding="utf-8"))
+        store_course(entry["course_id"], concepts, entry["path"], entry["sha256"],
+                     load_extraction(work_dir)["page_texts"], run_id=self.run_ids.pop(key), rebuild_search=False)
+        seconds = round(time.monotonic() - started, 3)
+        self.manifest.complete_stage(key, "store", {"concepts": len(concepts), "seconds": seconds})
+        self.stage_seconds["store"].append(seconds)
+        # The stage outputs are in the database now; the images are no longer needed
+        shutil.rmtree(work_dir, ignore_errors=True)
+        self.outcomes["ingested"].append(key)
+
+    def run(self) -> dict:
+        """
+        Ingest every deck below the root that is not ingested yet.
+
+        Returns:
+            The throughput report (see report())
+        """
+        started = time.monotonic()
+        todo = self._plan(self.discover())
+        print(f"{len(todo)} decks to ingest, {len(self.outcomes['skipped'])} skipped, {self.resumed} resumed")
+
+        # Extraction workers render their pages themselves instead of each starting a render pool
+        extract_pool = ProcessPoolExecutor(max_workers=self.extract_workers, initializer=init_pool_worker)
+        generate_pool = ThreadPoolExecutor(max_workers=self.generate_workers, thread_name_prefix="bulk-generate")
+        pending = {}
+
+        def submit(key: str, stage: str) -> None:
+            entry = self.manifest.entry(key)
+            work_dir = str(self.work_dir(entry["sha256"]))
+            if stage == "extract":
+                pending[extract_pool.submit(extract_deck, entry["path"], work_dir)] = (key, stage)
+            elif stage == "generate":
+                pending[generate_pool.submit(generate_deck, entry["course_id"], work_dir)] = (key, stage)
+            else:
+                try:
+                    self._store(key)
+                except Exception as e:
+                    self._fail(key, "store", e)
+
+        try:
+            for key, entry in todo.items():
+                self.run_ids[key] = course_db.start_ingestion_run(entry["path"], entry["sha256"])
+                submit(key, self._next_stage(entry))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, stage = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._fail(key, stage, e)
+                        continue
+                    self.manifest.complete_stage(key, stage, result)
+                    self.stage_seconds[stage].append(result["seconds"])
+                    submit(key, STAGES[STAGES.index(stage) + 1])
+        except BaseException:
+            # Interrupted: finished stages are in the manifest, the next run resumes from there
+            for key in list(self.run_ids):
+                course_db.finish_ingestion_run(self.run_ids.pop(key), error="interrupted")
+            raise
+        finally:
+            extract_pool.shutdown(wait=False, cancel_futures=True)
+            generate_pool.shutdown(wait=True, cancel_futures=True)
+
+        if self.outcomes["ingested"]:
+            concept_search.rebuild()
+            if self.intro_speech_enabled:
+                # Wait here: the process ends when the command does
+                courses = [self.manifest.entry(key)["course_id"] for key in self.outcomes["ingested"]]
+                wait([intro_speech.schedule_course(course_id) for course_id in courses])
+        return self.report(time.monotonic() - started)
+
+    def report(self, wall_seconds: float) -> dict:
+        """Deck counts, volumes, rates and per-stage timings of this run."""
+        ingested = [self.manifest.entry(key) for key in self.outcomes["ingested"]]
+        pages = sum(entry["stages"]["extract"]["pages"] for entry in ingested)
+        stages = {}
+        for stage, seconds in self.stage_seconds.items():
+            ordered = sorted(seconds)
+            stages[stage] = {
+                "runs": len(ordered),
+                "total_seconds": round(sum(ordered), 2),
+                "avg_seconds": round(statistics.mean(ordered), 2) if ordered else None,
+                "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2) if ordered else None,
+            }
+        return {
+            "root": str(self.root),
+            "manifest": str(self.manifest.path),
+            "decks": {
+                "found": len(self.outcomes["ingested"]) + len(self.outcomes["skipped"]) + len(self.outcomes["failed"]),
+                "ingested": len(self.outcomes["ingested"]),
+                "skipped": len(self.outcomes["skipped"]),
+                "failed": len(self.outcomes["failed"]),
+                "resumed": self.resumed,
+            },
+            "failed": {key: self.manifest.entry(key).get("error") for key in self.outcomes["failed"]},
+            "pages": pages,
+            "images": sum(entry["stages"]["extract"]["images"] for entry in ingested),
+            "concepts": sum(entry["stages"]["store"]["concepts"] for entry in ingested),
+            "wall_seconds": round(wall_seconds, 2),
+            "decks_per_minute": round(60 * len(ingested) / wall_seconds, 2) if wall_seconds else None,
+            "pages_per_second": round(pages / wall_seconds, 2) if wall_seconds else None,
+            "stages": stages,
+            "workers": {"extract": self.extract_workers, "generate": self.generate_workers},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory tree of lecture decks, resuming interrupted runs.")
+    parser.add_argument("root", help="Directory searched recursively for .pdf decks")
+    parser.add_argument("--manifest", help="Checkpoint file (default: under course_data/bulk_ingest/)")
+    parser.add_argument("--extract-workers", type=int, default=settings.bulk_ingest_extract_workers,
+                        help="Decks extracted in parallel (processes)")
+    parser.add_argument("--generate-workers", type=int, default=settings.bulk_ingest_generate_workers,
+                        help="Decks sent to the model in parallel")
+    parser.add_argument("--force", action="store_true", help="Re-ingest decks that were already ingested")
+    parser.add_argument("--no-intro-speech", action="store_true", help="Don't synthesize the new courses' opening questions")
+    parser.add_argument("--report", help="Also write the throughput report to this JSON file")
+    args = parser.parse_args()
+
+    ingestor = BulkIngestor(args.root, Path(args.manifest) if args.manifest else None, args.extract_workers,
+                            args.generate_workers, force=args.force,
+                            intro_speech_enabled=False if args.no_intro_speech else None)
+    report = ingestor.run()
+    print(json.dumps(report, indent=2))
+    if args.report:
+        _write_json(Path(args.report), report)
+    if report["decks"]["failed"]:
+        print(f"{report['decks']['failed']} decks failed; run the command again to retry them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import csv
+import io
+from pathlib import Path
+from typing import Dict, List
+
+CONCEPTS_DIR = Path(__file__).resolve().parent.parent / "extracted_key_concepts"
+CONCEPT_FILE_SUFFIX = "_qa.csv"
+CONCEPT_FIELDS = ("concept_id", "title", "question", "answer")
+
+
+def course_id_for(path: Path) -> str:
+    """Course IDs are the CSV file name without the _qa.csv suffix."""
+    return path.name[:-len(CONCEPT_FILE_SUFFIX)]
+
+
+def parse_concepts_csv(content: str) -> List[Dict[str, str]]:
+    """
+    Parse an LLM-written concepts CSV.
+
+    The files may be wrapped in markdown code fences and may or may not start with the
+    question_number,concept_title,question,answer header. Concept IDs are the 1-based
+    row positions, matching how the follow-up and evaluation endpoints address them.
+
+    Args:
+        content: Raw file content
+
+    Returns:
+        List of concept dicts with the keys in CONCEPT_FIELDS
+    """
+    lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
+    concepts = []
+    for row in csv.reader(io.StringIO("\n".join(lines))):
+        if len(row) < 4 or row[0].strip() == "question_number":
+            continue
+        concepts.append({
+            "concept_id": str(len(concepts) + 1),
+            "title": row[1].strip(),
+            "question": row[2].strip(),
+            "answer": row[3].strip(),
+        })
+    return concepts
@@ -1,4 +1,6 @@
 import os
+from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -15,6 +17,183 @@ class Settings(BaseSettings):
     audio_dir: str = "audio_responses"
     temp_dir: str = "temp_files"
     
+    # Course served when a request does not name one
+    default_course_id: str = "ArtificialIntelligence_2_IntelligentAgents-2"
+    
+    # Slide excerpts retrieved for grandpa's analysis prompt
+    slide_context: bool = True
+    slide_context_top_k: int = 4
+    slide_context_token_budget: int = 600
+    
+    # Optional audio preprocessing before transcription (requires ffmpeg)
+    audio_preprocessing: bool = False
+    ffmpeg_binary: str = "ffmpeg"
+    audio_preprocessing_codec: str = "opus"  # "opus" or "flac"
+    audio_max_silence_seconds: float = 0.6
+    audio_speech_padding_seconds: float = 0.2
+    audio_vad_aggressiveness: int = 2  # only used when webrtcvad is installed
+    
+    # Notepad image optimization before the vision call
+    notepad_image_optimization: bool = True
+    notepad_ink_threshold: int = 40  # per-pixel difference from the blackboard that counts as ink
+    notepad_crop_margin: int = 24
+    notepad_min_stroke_px: float = 2.5  # strokes are not downscaled below this width
+    notepad_min_side: int = 512  # handwriting needs roughly this much width to stay legible
+    notepad_webp_quality: int = 80
+    
+    # Drawings uploaded as stroke vectors (see app/stroke_rasterizer.py)
+    notepad_strokes_max_bytes: int = 2 * 1024 * 1024
+    notepad_max_strokes: int = 5000
+    notepad_max_stroke_points: int = 200_000
+    stroke_supersample: int = 2  # drawn at this multiple of the target size and downsampled (antialiasing)
+    stroke_render_max_pixels: int = 16_000_000  # drawing buffer incl. supersampling (~48 MB RGB)
+    stroke_raster_cache_entries: int = 256
+    
+    # Skip or crop unchanged drawings across turns of a session
+    drawing_change_detection: bool = True
+    drawing_unchanged_hamming: int = 2  # max dHash bit difference for "unchanged"
+    drawing_unchanged_max_pixels: int = 0  # ink-level pixel changes tolerated for "unchanged" (re-encoding noise stays under notepad_ink_threshold)
+    drawing_region_max_fraction: float = 0.5  # send only the changed region if it covers at most this much
+    drawing_tracker_max_sessions: int = 1000
+    
+    # Upstream call resilience (see app/upstream.py)
+    upstream_max_attempts: int = 3
+    upstream_backoff_base_seconds: float = 0.25
+    upstream_backoff_max_seconds: float = 4.0
+    upstream_hedge_workers: int = 16
+    speech_hedge_after_seconds: Optional[float] = None  # e.g. 2.0 to hedge slow TTS calls
+    evaluation_hedge_after_seconds: Optional[float] = None
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_reset_seconds: float = 30.0
+    
+    # Adaptive model routing for analysis and evaluation (see app/model_router.py)
+    model_routing: str = "shadow"  # "off", "shadow" (keep the default model, log what routing would change) or "on"
+    model_routing_tiers: dict = {
+        "analysis": {"easy": "gpt-4o-mini", "hard": "gpt-4o"},
+        "evaluation": {"easy": "gpt-4o-mini", "hard": "gpt-4o"},
+    }
+    routing_long_transcript_words: int = 120  # explanations at least this long are hard
+    routing_drawing_transcript_words: int = 40  # ... or at least this long together with a changed drawing
+    routing_evaluation_hard_chars: int = 4000  # histories at least this long are hard to evaluate
+    routing_latency_limits: dict = {"analysis": 8.0, "evaluation": 4.0}  # average seconds above which a faster model is preferred
+    upstream_latency_alpha: float = 0.2  # weight of the newest call in the per-model latency average
+    upstream_latency_max_age_seconds: float = 300.0  # averages not updated for this long are unknown again
+    
+    # Fair scheduling of upstream requests (see app/scheduler.py)
+    scheduler_enabled: bool = True
+    scheduler_model_limits: dict = {
+        "gpt-4o": {"concurrency": 8, "rpm": 500},
+        "gpt-4o-mini": {"concurrency": 8, "rpm": 500},
+        "gpt-4o-transcribe": {"concurrency": 6, "rpm": 500},
+        "gpt-4o-mini-tts": {"concurrency": 6, "rpm": 500},
+    }
+    scheduler_default_concurrency: int = 8  # models without an entry above
+    scheduler_per_learner_concurrency: int = 3  # slots of one model a single learner may hold
+    scheduler_max_wait_seconds: float = 30.0
+    scheduler_aging_seconds: float = 10.0  # waiting this long moves a request up one priority class
+    scheduler_default_priority: str = "interactive"
+    scheduler_endpoint_priorities: dict = {
+        "ask-follow-up": "interactive",
+        "finalize-stream": "interactive",
+        "speculative-draft": "interactive",
+        "conversation": "interactive",
+        "evaluate": "evaluation",
+        "upload-pdf": "background",
+        "intro-speech": "background",
+        "bulk-ingest": "background",
+    }
+    
+    # Shared OpenAI clients (see app/openai_clients.py)
+    openai_max_connections: int = 50
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_seconds: float = 120.0  # idle pooled connections are kept open this long
+    openai_http2: bool = True  # used when the optional h2 package is installed
+    openai_warm_up_on_startup: bool = True
+    openai_warm_connections: int = 4  # connections opened at startup
+    openai_warm_up_timeout_seconds: float = 5.0
+    
+    # Local pre-scoring of /evaluate (see app/coverage_scorer.py)
+    evaluation_prescoring: bool = True  # answer clear cases locally instead of calling the LLM
+    prescore_lexical_weight: float = 0.6  # weight of word overlap vs. character n-gram similarity
+    prescore_low_coverage: float = 0.15  # no key point above this: confidently "nothing relevant"
+    prescore_high_coverage: float = 0.8  # every key point at least this: confidently "all covered"
+    prescore_min_words: int = 3  # fewer content words from the learner score 0 locally
+    prescore_audit_rate: float = 0.05  # share of confident cases still sent to the LLM to measure agreement
+    prescore_agreement_tolerance: float = 15.0  # score points within which local and LLM scores agree
+    evaluation_log_path: Optional[str] = str(Path(__file__).resolve().parent.parent / "course_data" / "evaluation_log.jsonl")
+    
+    # Course database (see app/course_db.py)
+    course_db_path: str = str(Path(__file__).resolve().parent.parent / "course_data" / "courses.db")
+    course_db_auto_import: bool = True  # import extracted_key_concepts/*_qa.csv into an empty database
+    
+    # Usage accounting and per-session budgets (see app/usage_ledger.py)
+    usage_db_path: str = str(Path(__file__).resolve().parent.parent / "course_data" / "usage.db")
+    session_budget_tokens: Optional[int] = None  # e.g. 200000; None disables the token budget
+    session_budget_usd: Optional[float] = None  # e.g. 0.50; None disables the cost budget
+    budget_fallback_models: dict = {"gpt-4o": "gpt-4o-mini"}  # used once a session is over budget
+    admin_token: Optional[str] = None  # if set, /api/admin endpoints require the X-Admin-Token header
+    
+    # Pre-synthesized opening questions (see app/intro_speech.py)
+    intro_speech_pregeneration: bool = True  # synthesize a course's intros in the background after ingestion
+    intro_speech_format: str = "wav"  # what the frontend's grandmaSpeechService expects
+    intro_speech_workers: int = 2
+    
+    # Speculative feedback during live voice sessions (see app/speculation.py)
+    speculation_enabled: bool = True
+    speculation_min_words: int = 8  # don't draft before the learner has said this much
+    speculation_reuse_similarity: float = 0.9  # word similarity at which the draft is reused unchanged
+    speculation_wait_seconds: float = 4.0  # how long finalize waits for a running draft
+    speculation_workers: int = 4
+    realtime_final_transcript_wait_seconds: float = 3.0  # how long finalize waits for the last segment
+    voice_session_ttl_seconds: float = 900.0  # voice sessions never finalized (abandoned, failed) are dropped with their drafts
+    
+    # Retried turns (see app/idempotency.py and app/transcription_cache.py)
+    idempotency_ttl_seconds: float = 600.0  # how long a response is kept for retries with the same Idempotency-Key
+    idempotency_cache_max_mb: int = 64  # stored responses (mostly base64 audio) per worker
+    transcription_cache: bool = True  # never transcribe the same recording twice
+    transcription_cache_dir: str = str(Path(__file__).resolve().parent.parent / "transcription_cache")
+    
+    # Per-request scratch files (see app/scratch.py)
+    scratch_dir: Optional[str] = None  # default: /dev/shm (RAM-backed) if writable, else temp_dir
+    scratch_sweep_interval_seconds: float = 300.0
+    scratch_orphan_age_seconds: float = 3600.0  # leftovers older than this are removed even if their worker still runs
+    scratch_warn_mb: int = 512  # the sweeper warns when scratch space holds more than this
+    
+    # Persistent conversation channel (see app/conversation.py)
+    conversation_history_turns: int = 6  # history entries kept in the analysis prompt
+    conversation_sentence_min_chars: int = 40  # shorter sentences are spoken together with the next one
+    conversation_tts_workers: int = 3  # sentences synthesized in parallel per connection
+    conversation_max_turn_audio_bytes: int = 25 * 1024 * 1024  # transcription upload limit
+    
+    # PDF uploads (see app/pdf_uploads.py)
+    upload_max_bytes: int = 50 * 1024 * 1024
+    upload_max_pages: int = 300
+    upload_chunk_size: int = 1024 * 1024  # bytes read and written per step
+    upload_session_ttl_seconds: float = 24 * 3600  # resumable uploads not completed by then are swept
+    
+    # Slide images for concept extraction (see app/page_rasterizer.py)
+    slide_image_token_budget: int = 12000  # estimated vision tokens per extraction request
+    slide_image_max_count: int = 30
+    raster_min_paths: int = 6  # vector paths (outside the slide template) that make a page a diagram
+    raster_min_coverage: float = 0.1  # fraction of the page the diagram must span
+    raster_template_page_fraction: float = 0.3  # drawings repeated on this share of pages are template
+    raster_target_long_side: int = 1024
+    raster_dense_path_count: int = 100
+    raster_min_dpi: int = 72
+    raster_max_dpi: int = 200
+    raster_workers: int = min(4, os.cpu_count() or 1)
+    
+    # Page-by-page PDF extraction (see app/pdf_stream.py)
+    pdf_extraction_max_rss_mb: int = 1536  # worker RSS above which extraction is aborted (0 = no limit)
+    pdf_mupdf_cache_mb: int = 32  # growth during extraction after which MuPDF's cache is emptied
+    pdf_spill_dir: Optional[str] = None  # scratch space for extracted slide images (default: system temp)
+    pdf_prompt_images_max_mb: int = 64  # base64 slide images per extraction request; the request holds them all at once
+    
+    # Bulk course ingestion (see app/bulk_ingest.py)
+    bulk_ingest_dir: str = str(Path(__file__).resolve().parent.parent / "course_data" / "bulk_ingest")  # manifests and stage outputs
+    bulk_ingest_extract_workers: int = min(4, os.cpu_count() or 1)  # processes
+    bulk_ingest_generate_workers: int = 4  # concurrent model requests (still subject to the scheduler)
+    
     # Create necessary directories
     def create_directories(self):
         """Create necessary directories if they don't exist."""
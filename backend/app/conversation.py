@@ -0,0 +1,366 @@
+import asyncio
+import base64
+import binascii
+import contextvars
+import hashlib
+import json
+import re
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from .api import (load_conversation_history, new_learning_session_id, prepare_notepad_image, resolve_concept,
+                  retrieve_slide_excerpts, save_conversation_to_history)
+from .config import settings
+from .core import AUDIO_FORMATS, DEFAULT_AUDIO_QUALITY, analyze_image, negotiate_audio_format, synthesize_speech, transcribe_speech_bytes
+from .drawing_tracker import drawing_tracker
+from .openai_clients import openai_clients
+from .scratch import scratch_space
+from .stroke_rasterizer import STROKE_SUFFIX, StrokeFormatError, parse_strokes
+from .transcription_cache import transcription_cache
+from .upstream import UpstreamUnavailableError
+from .usage_ledger import attribute_usage
+
+router = APIRouter()
+
+HISTORY_ENTRY_MARKER = "\n\n--- Conversation at "
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+
+# Messages emitted by a turn are queued for the socket; None ends the turn
+Emit = Callable[[Optional[object]], None]
+
+
+def history_window(history: str, turns: int) -> str:
+    """The last `turns` entries of a conversation history in the history file's format."""
+    entries = history.split(HISTORY_ENTRY_MARKER)[1:]
+    return "".join(HISTORY_ENTRY_MARKER + entry for entry in entries[-turns:]) if turns > 0 else ""
+
+
+def split_sentences(text: str, min_chars: int) -> Tuple[List[str], str]:
+    """
+    Cut the complete sentences off the front of streamed text.
+
+    Sentences shorter than min_chars are merged with the next one so grandpa does
+    not speak in tiny clips.
+
+    Returns:
+        tuple: (complete sentences, the unfinished rest)
+    """
+    sentences, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        if match.end() - start >= min_chars:
+            sentences.append(text[start:match.end()].strip())
+            start = match.end()
+    return sentences, text[start:]
+
+
+class Conversation:
+    """
+    Warm state of one learning session on the conversation channel.
+
+    The concept, the history window and the last drawing live here for the whole
+    connection, so a turn only carries what is new: the recorded audio and, when
+    the learner drew something, the drawing.
+    """
+
+    def __init__(self, concept_id: str, course_id: str, concept: dict, session_id: str, audio_format: str):
+        self.concept_id = concept_id
+        self.course_id = course_id
+        self.concept = concept
+        self.session_id = session_id
+        self.audio_format = audio_format
+        self.client = openai_clients.sync()
+        self.history = history_window(load_conversation_history(), settings.conversation_history_turns)
+        self.audio = bytearray()
+        self.drawing = None  # prepared drawing of the current turn, or None if unchanged since the last one
+        self.drawing_key = None
+        self.turns = 0
+        self._speech_executor = ThreadPoolExecutor(max_workers=settings.conversation_tts_workers, thread_name_prefix="conversation-tts")
+
+    def add_audio(self, chunk: bytes) -> None:
+        if len(self.audio) + len(chunk) > settings.conversation_max_turn_audio_bytes:
+            raise ValueError(f"A turn's audio may not exceed {settings.conversation_max_turn_audio_bytes} bytes")
+        self.audio.extend(chunk)
+
+    def take_audio(self) -> bytes:
+        """Hand the recorded audio to a turn; frames arriving from now on belong to the next one."""
+        audio, self.audio = bytes(self.audio), bytearray()
+        return audio
+
+    def update_drawing(self, image: bytes, suffix: str = ".webp") -> str:
+        """
+        Prepare a new drawing for the vision call (compared with what grandpa saw last).
+
+        Args:
+            image: The drawing as WebP, or as canonical stroke JSON with suffix STROKE_SUFFIX
+            suffix: File suffix telling prepare_notepad_image which of the two it is
+
+        Returns:
+            The drawing change: "new", "changed", "region" or "unchanged"
+        """
+        key = hashlib.sha1(image).hexdigest()
+        if key == self.drawing_key:
+            return self.drawing["drawing_change"] if self.drawing else "unchanged"
+        with scratch_space.workspace("conversation-drawing"):
+            image_path = scratch_space.path(f"notepad{suffix}")
+            with open(image_path, "wb") as f:
+                f.write(image)
+            image_url, image_detail, drawing_change, drawing_fingerprint = prepare_notepad_image(image_path, self.session_id)
+        self.drawing_key = key
+        self.drawing = {"image_url": image_url, "image_detail": image_detail,
+                        "drawing_change": drawing_change, "fingerprint": drawing_fingerprint}
+        return drawing_change
+
+    def take_turn(self, audio: bytes, last_explanation: bool, emit: Emit) -> dict:
+        """
+        Answer one turn, streaming grandpa's text and spoken sentences through emit.
+
+        Every complete sentence is synthesized as soon as it is generated and its
+        audio is emitted in order as a self-contained clip.
+
+        Returns:
+            Summary of the turn (transcription, feedback, timings)
+        """
+        started = time.monotonic()
+        with attribute_usage(endpoint="conversation", session_id=self.session_id,
+                             concept_id=self.concept_id, course_id=self.course_id):
+            transcription = transcription_cache.transcribe(hashlib.sha256(audio).hexdigest(),
+                                                           lambda: transcribe_speech_bytes(self.client, audio).text)
+            emit({"type": "transcript", "text": transcription})
+            transcribed = time.monotonic()
+
+            slide_excerpts = None
+            if settings.slide_context:
+                slide_excerpts = retrieve_slide_excerpts(self.course_id, f"{self.concept['title']} {transcription}")
+
+            speech = SentenceSpeech(self, emit)
+            drawing = self.drawing
+            feedback = analyze_image(
+                client=self.client,
+                transcription=transcription,
+                image_url=drawing["image_url"] if drawing else None,
+                concept_explanation=self.concept["answer"],
+                concept_text=self.concept["title"],
+                conversation_history=self.history,
+                last_explanation=last_explanation,
+                image_detail=drawing["image_detail"] if drawing else "auto",
+                drawing_change=drawing["drawing_change"] if drawing else ("unchanged" if self.drawing_key else "pending"),
+                slide_excerpts=slide_excerpts,
+                on_delta=speech.feed
+            )
+            speech.finish()
+
+        if drawing is not None and drawing["fingerprint"] is not None:
+            drawing_tracker.remember(self.session_id, drawing["fingerprint"])
+        # Until the learner draws again, grandpa has already seen the drawing
+        # (unless a new one arrived while this turn was answered)
+        if self.drawing is drawing:
+            self.drawing = None
+        save_conversation_to_history(transcription, feedback)
+        self.history = history_window(self.history + self._history_entry(transcription, feedback),
+                                      settings.conversation_history_turns)
+        self.turns += 1
+        return {
+            "type": "turn_complete",
+            "turn": self.turns,
+            "transcription": transcription,
+            "feedback": feedback,
+            "audio_clips": speech.emitted,
+            "transcription_ms": round((transcribed - started) * 1000),
+            "first_audio_ms": round((speech.first_audio_at - started) * 1000) if speech.first_audio_at else None,
+            "total_ms": round((time.monotonic() - started) * 1000),
+        }
+
+    @staticmethod
+    def _history_entry(transcription: str, feedback: str) -> str:
+        return f"{HISTORY_ENTRY_MARKER}{time.strftime('%Y-%m-%d %H:%M:%S')} ---\nUSER: {transcription}\n\nGRANDPA: {feedback}\n--- End of conversation ---"
+
+    def close(self) -> None:
+        self._speech_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SentenceSpeech:
+    """Synthesizes grandpa's answer sentence by sentence while it is being generated."""
+
+    def __init__(self, conversation: Conversation, emit: Emit):
+        self.conversation = conversation
+        self.emit = emit
+        self.attempt = 1
+        self.text = ""
+        self.pending: List[Future] = []
+        self.emitted = 0
+        self.first_audio_at = None
+
+    def feed(self, delta: str, attempt: int) -> None:
+        if attempt != self.attempt:
+            # The analysis was retried: drop what the failed attempt said
+            for future in self.pending:
+                future.cancel()
+            self.pending, self.text, self.attempt = [], "", attempt
+            self.emit({"type": "feedback_reset", "attempt": attempt})
+        self.emit({"type": "feedback_delta", "delta": delta, "attempt": attempt})
+        self.text += delta
+        sentences, self.text = split_sentences(self.text, settings.conversation_sentence_min_chars)
+        for sentence in sentences:
+            self._synthesize(sentence)
+        self._flush(block=False)
+
+    def finish(self) -> None:
+        if self.text.strip():
+            self._synthesize(self.text.strip())
+            self.text = ""
+        self._flush(block=True)
+
+    def _synthesize(self, sentence: str) -> None:
+        # Copy the context so the speech calls keep the turn's usage attribution
+        context = contextvars.copy_context()
+        self.pending.append(self.conversation._speech_executor.submit(
+            context.run, synthesize_speech, self.conversation.client, sentence, self.conversation.audio_format))
+
+    def _flush(self, block: bool) -> None:
+        """Emit finished clips in order; with block, wait for all of them."""
+        while self.pending and (block or self.pending[0].done()):
+            audio = self.pending.pop(0).result()
+            if self.first_audio_at is None:
+                self.first_audio_at = time.monotonic()
+            self.emit(audio)
+            self.emitted += 1
+
+
+async def run_turn(websocket: WebSocket, conversation: Conversation, last_explanation: bool):
+    """Run a turn on a worker thread and relay what it emits to the socket in order."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(message):
+        loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    async def work():
+        try:
+            summary = await run_in_threadpool(conversation.take_turn, conversation.take_audio(), last_explanation, emit)
+            emit(summary)
+        except UpstreamUnavailableError as e:
+            emit({"type": "error", "status": 503, "detail": f"Grandpa is temporarily unavailable, please try again: {str(e)}"})
+        except Exception as e:
+            print(f"ERROR in conversation turn: {str(e)}")
+            print(f"Traceback: {traceback.format_exc()}")
+            emit({"type": "error", "status": 500, "detail": f"Error processing turn: {str(e)}"})
+        finally:
+            emit(None)
+
+    worker = asyncio.create_task(work())
+    while True:
+        message = await queue.get()
+        if message is None:
+            break
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_json(message)
+    await worker
+
+
+@router.websocket("/conversation")
+async def conversation_channel(
+    websocket: WebSocket,
+    concept_id: str = Query(...),
+    course_id: str = Query(None),
+    session_id: str = Query(None, description="Learning session to continue; a new one is started (and announced in ready) without it"),
+    audio_format: str = Query(None, description="Comma-separated audio formats the client can play, most preferred first"),
+    audio_quality: str = Query(DEFAULT_AUDIO_QUALITY)
+):
+    """
+    Long-lived, full-duplex channel for a whole learning session.
+
+    Client to server:
+        binary frames: the recorded audio of the current turn (e.g. MediaRecorder WebM chunks)
+        {"type": "drawing", "image": <base64 WebP>}: the learner's current drawing
+        {"type": "drawing", "strokes": {...}}: the same as stroke vectors (see app/stroke_rasterizer.py)
+        {"type": "end_turn", "last_explanation": false}: answer the recorded turn
+        {"type": "cancel_turn"}: discard the audio recorded so far
+
+    Server to client:
+        {"type": "ready", ...} once, then per turn {"type": "transcript"},
+        {"type": "feedback_delta"} pieces of grandpa's text (restarting after a
+        {"type": "feedback_reset"}), binary frames with one spoken sentence each in
+        the announced audio format, and finally {"type": "turn_complete"} or
+        {"type": "error"}.
+
+    The learner can keep talking and drawing while a turn is answered; that input
+    belongs to the next turn.
+    """
+    await websocket.accept()
+    course_id = course_id or settings.default_course_id
+    try:
+        concept = resolve_concept(course_id, concept_id)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=4000 + e.status_code)
+        return
+
+    response_format = negotiate_audio_format(audio_format, audio_quality)
+    # The connection is one learner's, so an issued session is safe to track drawings in
+    conversation = Conversation(concept_id, course_id, concept, session_id or new_learning_session_id(), response_format)
+    await websocket.send_json({
+        "type": "ready",
+        "session_id": conversation.session_id,
+        "concept": {"concept_id": concept["concept_id"], "title": concept["title"], "question": concept["question"]},
+        "audio_format": response_format,
+        "audio_mime_type": AUDIO_FORMATS[response_format],
+    })
+    print(f"Conversation channel opened for session {conversation.session_id} (concept {concept_id})")
+
+    turn = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                try:
+                    conversation.add_audio(message["bytes"])
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "status": 413, "detail": str(e)})
+                continue
+
+            try:
+                command = json.loads(message.get("text") or "")
+            except ValueError:
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Messages must be JSON"})
+                continue
+            kind = command.get("type")
+            if kind == "drawing" and command.get("strokes") is not None:
+                try:
+                    strokes = parse_strokes(command["strokes"])
+                except StrokeFormatError as e:
+                    await websocket.send_json({"type": "error", "status": 400, "detail": f"Invalid strokes: {str(e)}"})
+                    continue
+                change = await run_in_threadpool(conversation.update_drawing, strokes.to_json(), STROKE_SUFFIX)
+                await websocket.send_json({"type": "drawing_received", "drawing_change": change})
+            elif kind == "drawing":
+                try:
+                    image = base64.b64decode(command.get("image", ""), validate=True)
+                except (binascii.Error, ValueError):
+                    await websocket.send_json({"type": "error", "status": 400, "detail": "Drawing must be base64-encoded"})
+                    continue
+                change = await run_in_threadpool(conversation.update_drawing, image)
+                await websocket.send_json({"type": "drawing_received", "drawing_change": change})
+            elif kind == "end_turn":
+                if turn is not None and not turn.done():
+                    await websocket.send_json({"type": "error", "status": 409, "detail": "Grandpa is still answering the previous turn"})
+                elif not conversation.audio:
+                    await websocket.send_json({"type": "error", "status": 400, "detail": "No audio was recorded for this turn"})
+                else:
+                    turn = asyncio.create_task(run_turn(websocket, conversation, bool(command.get("last_explanation", False))))
+            elif kind == "cancel_turn":
+                conversation.take_audio()
+            else:
+                await websocket.send_json({"type": "error", "status": 400, "detail": f"Unknown message type: {kind}"})
+    finally:
+        if turn is not None and not turn.done():
+            turn.cancel()
+        conversation.close()
+        print(f"Conversation channel closed for session {conversation.session_id} after {conversation.turns} turns")
@@ -1,5 +1,88 @@
+import time
 from openai import OpenAI
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+from .model_router import model_router
+from .upstream import client_for_attempt, upstream
+from .usage_ledger import usage_from_response, usage_ledger
+
+# Output formats the speech endpoint can produce, with the MIME type the browser needs to play them.
+AUDIO_FORMATS = {
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+}
+
+# The speech endpoint has no bitrate knob, so a quality tier only names the codec used
+# when the client lists none we can produce: a speech codec for low bandwidth, lossless for high.
+AUDIO_QUALITY_TIERS = {
+    "low": "opus",
+    "standard": "aac",
+    "high": "flac",
+}
+
+TRANSCRIPTION_MODEL = "gpt-4o-transcribe"
+ANALYSIS_MODEL = "gpt-4o"
+REVISION_MODEL = "gpt-4o-mini"
+GRANDPA_TTS_MODEL = "gpt-4o-mini-tts"
+GRANDPA_VOICE = "verse"
+# The speech endpoint reports no usage. Audio output is billed per token, about
+# 1250 per minute of speech ($0.015/min at gpt-4o-mini-tts prices), and grandpa
+# speaks roughly 15 characters per second.
+SPEECH_CHARS_PER_SECOND = 15
+SPEECH_AUDIO_TOKENS_PER_SECOND = 1250 / 60
+GRANDPA_VOICE_INSTRUCTIONS = """Accent/Affect: Warm, slightly gruff with occasional thoughtful pauses; embody a curious 75-year-old grandfather trying to understand.
+
+Tone: Gentle but direct, with a paternal quality; genuinely interested but slightly no-nonsense.
+
+Pacing: Slightly slower than average with brief pauses; use occasional "hmm" or "well now" as thinking sounds.
+
+Emotion: Warmly interested, sometimes puzzled, pleased when understanding clicks.
+
+Pronunciation: Slightly simplified for complex terms, occasionally repeating technical words carefully.
+
+Personality Affect: Kind but straightforward, occasionally using phrases like "Let me see if I've got this right..." or "That's interesting, but I'm wondering..." to create a feeling of a wise grandfather figure who doesn't waste words."""
+
+# How the drawing is presented to grandpa, depending on how it changed since the previous turn.
+# Each entry is (note in the system prompt, sentence in the grandchild's message).
+DRAWING_CHANGE_PROMPTS = {
+    "changed": ("(Drawing is provided as an image input)",
+                "I also updated my drawing."),
+    "unchanged": ("(Drawing is UNCHANGED since the previous turn, so no image is attached this time. Judge the verbal explanation; refer to the drawing only as far as your earlier replies in the conversation history describe it.)",
+                  "My drawing is the same as before."),
+    "region": ("(Only the part of the drawing that changed since the previous turn is provided as an image input)",
+               "Here's the part of my drawing I changed."),
+    "pending": ("(No drawing is available yet, so judge the verbal explanation only.)",
+                ""),
+}
+
+DEFAULT_AUDIO_FORMAT = "mp3"
+DEFAULT_AUDIO_QUALITY = "standard"
+
+
+def negotiate_audio_format(preferred: str = None, quality: str = DEFAULT_AUDIO_QUALITY) -> str:
+    """Pick the TTS output format for a response.
+    
+    Args:
+        preferred: Comma-separated list of formats the client can play, most preferred
+            first, e.g. "opus,aac,mp3". When empty, the legacy mp3 output is used.
+        quality: Quality tier ("low", "standard" or "high") whose format is used when
+            none of the preferred formats can be produced; unknown tiers count as standard.
+        
+    Returns:
+        The name of a format from AUDIO_FORMATS.
+    """
+    if not preferred:
+        return DEFAULT_AUDIO_FORMAT
+    
+    for fmt in preferred.split(","):
+        fmt = fmt.strip().lower()
+        if fmt in AUDIO_FORMATS:
+            return fmt
+    return AUDIO_QUALITY_TIERS.get(quality, AUDIO_QUALITY_TIERS[DEFAULT_AUDIO_QUALITY])
 
 def transcribe_speech_input(client: OpenAI, audio_file_path: str):
     """
@@ -12,30 +95,70 @@ def transcribe_speech_input(client: OpenAI, audio_file_path: str):
     Returns:
         Transcription of the audio
     """
-    with open(audio_file_path, "rb") as audio_file:
-        transcription = client.audio.transcriptions.create(
-            model="gpt-4o-transcribe", 
-            file=audio_file,
-        )
-    return transcription
+    def attempt(timeout):
+        # Re-open per attempt so a retry uploads the file from the start
+        with open(audio_file_path, "rb") as audio_file:
+            return client_for_attempt(client, timeout).audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL, 
+                file=audio_file,
+            )
+    return upstream.call("transcription", attempt, model=TRANSCRIPTION_MODEL)
+
+
+def transcribe_speech_bytes(client: OpenAI, audio: bytes, filename: str = "speech.webm"):
+    """
+    Transcribe an in-memory recording, e.g. one assembled from websocket frames.
+    
+    Args:
+        client: OpenAI client instance
+        audio: The encoded recording
+        filename: Name whose extension tells the API the container format
+        
+    Returns:
+        Transcription of the audio
+    """
+    return upstream.call("transcription", lambda timeout: client_for_attempt(client, timeout).audio.transcriptions.create(
+        model=TRANSCRIPTION_MODEL,
+        file=(filename, audio),
+    ), model=TRANSCRIPTION_MODEL)
 
 
-def analyze_image(client: OpenAI, transcription: str, image_url: str, concept_explanation: str, concept_text: str, conversation_history: str, last_explanation: bool) -> str:
+def analyze_image(client: OpenAI, transcription: str, image_url: str, concept_explanation: str, concept_text: str, conversation_history: str, last_explanation: bool, image_detail: str = "auto", drawing_change: str = "changed", slide_excerpts: str = None, usage_out: dict = None, on_delta: Callable[[str, int], None] = None) -> str:
     """Analyze user's explanation, considering past interactions and if this is the final attempt.
     
+    The model is picked per turn by model_router from the transcript length, the
+    drawing change and whether this is the final turn (see settings.model_routing).
+    
     Args:
         client: OpenAI client instance
         transcription: Text transcription of user's current audio explanation
-        image_url: URL of the user's current drawn notes/diagram
+        image_url: URL of the user's current drawn notes/diagram, or None if the drawing is unchanged
         concept_explanation: Expert explanation of the concept for comparison
         concept_text: Name of the concept being explained
         conversation_history: String containing the history of the conversation so far.
         last_explanation: Boolean indicating if this is the user's final explanation attempt.
+        image_detail: Vision detail level for the drawing ("low", "high" or "auto")
+        drawing_change: "changed", "unchanged", "region" or "pending" (see DRAWING_CHANGE_PROMPTS)
+        slide_excerpts: Lecture slide text relevant to the current explanation, if available
+        usage_out: If given, filled with the call's token counts
+        on_delta: If given, the answer is streamed and on_delta(text, attempt) is called
+            for every piece; a retry starts over with a higher attempt number
         
     Returns:
         Grandpa's analysis, potentially concluding if last_explanation is True.
     """
     
+    drawing_note, drawing_sentence = DRAWING_CHANGE_PROMPTS.get(drawing_change, DRAWING_CHANGE_PROMPTS["changed"])
+    
+    slide_section = ""
+    if slide_excerpts:
+        slide_section = f"""
+LECTURE SLIDE EXCERPTS (Reference Only - DO NOT REVEAL, use them to make your questions precise):
+--- START SLIDES ---
+{slide_excerpts}
+--- END SLIDES ---
+"""
+    
     # Base system prompt setup
     system_prompt_base = f"""You are a kind, elderly grandfather who is eager to learn about '{concept_text}' from his grandchild. Your role in the conversation history provided below is "GRANDPA".
 
@@ -49,10 +172,10 @@ EXPERT EXPLANATION (Reference Only - DO NOT REVEAL):
 --- START EXPERT INFO ---
 {concept_explanation}
 --- END EXPERT INFO ---
-
+{slide_section}
 CURRENT GRANDCHILD INPUT:
 Verbal: '{transcription}'
-(Drawing is provided as an image input)
+{drawing_note}
 
 YOUR TASK:
 Analyze the grandchild's CURRENT input in context of HISTORY and EXPERT EXPLANATION.
@@ -92,59 +215,159 @@ IMPORTANT RULES (Intermediate explanation):
 
     # Combine base prompt and logic
     final_system_prompt = system_prompt_base + "\n\n" + system_prompt_logic
-
-    response = client.chat.completions.create(
-        model="gpt-4o", 
-        messages=[
-            {
-                "role": "system",
-                "content": final_system_prompt
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text", 
-                        "text": f"Okay Grandpa, I'm trying to explain '{concept_text}'. Here's what I said this time: '{transcription}'. I also updated my drawing."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": image_url,
-                        },
-                    },
-                ],
+    
+    user_content = [
+        {
+            "type": "text", 
+            "text": f"Okay Grandpa, I'm trying to explain '{concept_text}'. Here's what I said this time: '{transcription}'. {drawing_sentence}"
+        },
+    ]
+    if image_url:
+        user_content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_url,
+                "detail": image_detail,
             },
-        ],
-    )
+        })
+
+    messages = [
+        {
+            "role": "system",
+            "content": final_system_prompt
+        },
+        {
+            "role": "user",
+            "content": user_content,
+        },
+    ]
+    # Easy turns may go to a smaller model; sessions over their budget always do
+    decision = model_router.route_analysis(ANALYSIS_MODEL, transcription, drawing_change, last_explanation)
+    model = usage_ledger.model_for(decision.model)
+    started = time.monotonic()
+    if on_delta is None:
+        response = upstream.call("analysis", lambda timeout: client_for_attempt(client, timeout).chat.completions.create(
+            model=model, 
+            messages=messages,
+        ), model=model)
+    else:
+        attempts = []
+        
+        def attempt(timeout):
+            attempts.append(timeout)
+            stream = client_for_attempt(client, timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            pieces, usage = [], None
+            for chunk in stream:
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    on_delta(chunk.choices[0].delta.content, len(attempts))
+            # Shaped like a completion so usage accounting and the caller need not care
+            message = SimpleNamespace(content="".join(pieces))
+            return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=message)])
+        
+        response = upstream.call("analysis", attempt, model=model)
+    usage = usage_from_response(response)
+    model_router.settle(decision, model, usage, time.monotonic() - started)
+    if usage_out is not None:
+        usage_out.update(usage)
     return response.choices[0].message.content
 
 
-def generate_answer_audio(client: OpenAI, feedback: str, output_path: str = "speech.mp3") -> None:
-    """Generate grandpa's audio response to the user's explanation.
+def revise_analysis(client: OpenAI, draft_feedback: str, draft_transcription: str, transcription: str, concept_text: str, image_url: str = None, image_detail: str = "low", usage_out: dict = None) -> str:
+    """Adapt a reply drafted while the grandchild was still talking to everything they said.
+    
+    Much cheaper than a full analysis: a small model edits the draft instead of
+    reasoning about the explanation from scratch.
     
     Args:
         client: OpenAI client instance
-        feedback: Text analysis of the user's explanation
-        output_path: Path to save the generated audio response
+        draft_feedback: Grandpa's reply drafted from the partial transcription
+        draft_transcription: What the grandchild had said when the draft was made
+        transcription: Everything the grandchild said
+        concept_text: Name of the concept being explained
+        image_url: The final drawing, only if it changed since the draft
+        image_detail: Vision detail level for the drawing
+        usage_out: If given, filled with the call's token counts
+        
+    Returns:
+        The revised reply
     """
-    speech_file_path = Path(output_path)
-    
-    with client.audio.speech.with_streaming_response.create(
-        model="gpt-4o-mini-tts",
-        voice="verse",  # Using fable for an older masculine voice
-        input=feedback,
-        instructions="""Accent/Affect: Warm, slightly gruff with occasional thoughtful pauses; embody a curious 75-year-old grandfather trying to understand.
+    system_prompt = f"""You are a kind, elderly grandfather learning about '{concept_text}' from his grandchild.
+While your grandchild was still talking you drafted a reply. They have now finished.
 
-Tone: Gentle but direct, with a paternal quality; genuinely interested but slightly no-nonsense.
+Revise the draft so it fits EVERYTHING they said{" and their final drawing" if image_url else ""}:
+*   Drop questions about points they have since explained, and react to anything new.
+*   Keep the draft's warm, direct grandpa voice, its length (max 4-5 sentences) and at most 1-2 questions.
+*   If the draft still fits, return it unchanged.
+Return only the reply, nothing else."""
+    user_content = [{
+        "type": "text",
+        "text": f"WHAT THEY HAD SAID WHEN YOU DRAFTED: '{draft_transcription}'\n\n"
+                f"YOUR DRAFT REPLY: {draft_feedback}\n\n"
+                f"EVERYTHING THEY SAID: '{transcription}'",
+    }]
+    if image_url:
+        user_content.append({"type": "image_url", "image_url": {"url": image_url, "detail": image_detail}})
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+    model = usage_ledger.model_for(REVISION_MODEL)
+    response = upstream.call("revision", lambda timeout: client_for_attempt(client, timeout).chat.completions.create(
+        model=model,
+        messages=messages,
+    ), model=model)
+    if usage_out is not None:
+        usage_out.update(usage_from_response(response))
+    return response.choices[0].message.content
 
-Pacing: Slightly slower than average with brief pauses; use occasional "hmm" or "well now" as thinking sounds.
 
-Emotion: Warmly interested, sometimes puzzled, pleased when understanding clicks.
+def estimate_speech_usage(text: str) -> dict:
+    """Estimated token counts of speaking text: the input text and the audio output (see SPEECH_CHARS_PER_SECOND)."""
+    audio_tokens = max(1, round(len(text) / SPEECH_CHARS_PER_SECOND * SPEECH_AUDIO_TOKENS_PER_SECOND))
+    return {"prompt_tokens": max(1, len(text) // 4), "completion_tokens": audio_tokens, "audio_output_tokens": audio_tokens}
 
-Pronunciation: Slightly simplified for complex terms, occasionally repeating technical words carefully.
 
-Personality Affect: Kind but straightforward, occasionally using phrases like "Let me see if I've got this right..." or "That's interesting, but I'm wondering..." to create a feeling of a wise grandfather figure who doesn't waste words.""",
-    ) as response:
-        response.stream_to_file(speech_file_path)
+def synthesize_speech(client: OpenAI, text: str, audio_format: str = DEFAULT_AUDIO_FORMAT) -> bytes:
+    """Speak text in grandpa's voice.
+    
+    Args:
+        client: OpenAI client instance
+        text: What grandpa says
+        audio_format: Output format, one of AUDIO_FORMATS
+        
+    Returns:
+        The encoded audio
+    """
+    # Each attempt returns the audio bytes instead of streaming to a file, so a
+    # hedged duplicate request can never write to the same file concurrently
+    def attempt(timeout):
+        response = client_for_attempt(client, timeout).audio.speech.create(
+            model=GRANDPA_TTS_MODEL,
+            voice=GRANDPA_VOICE,
+            input=text,
+            response_format=audio_format,
+            instructions=GRANDPA_VOICE_INSTRUCTIONS,
+        )
+        return response.content
+    
+    # The audio response carries no usage, so bill the input text and the audio by estimate
+    return upstream.call("speech", attempt, model=GRANDPA_TTS_MODEL, usage_hint=estimate_speech_usage(text))
+
 
+def generate_answer_audio(client: OpenAI, feedback: str, output_path: str = "speech.mp3", audio_format: str = DEFAULT_AUDIO_FORMAT) -> None:
+    """Generate grandpa's audio response to the user's explanation.
+    
+    Args:
+        client: OpenAI client instance
+        feedback: Text analysis of the user's explanation
+        output_path: Path to save the generated audio response
+        audio_format: Output format, one of AUDIO_FORMATS (see negotiate_audio_format)
+    """
+    Path(output_path).write_bytes(synthesize_speech(client, feedback, audio_format))
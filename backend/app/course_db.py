@@ -0,0 +1,311 @@
+import argparse
+import datetime
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import settings
+from .concepts import CONCEPTS_DIR, CONCEPT_FILE_SUFFIX, course_id_for, parse_concepts_csv
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    id INTEGER PRIMARY KEY,
+    course_key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    source_path TEXT,
+    content_hash TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS concepts (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    concept_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_concepts_course_concept ON concepts(course_id, concept_id);
+CREATE INDEX IF NOT EXISTS idx_concepts_course_position ON concepts(course_id, position);
+CREATE INDEX IF NOT EXISTS idx_concepts_title ON concepts(title);
+
+CREATE TABLE IF NOT EXISTS source_pages (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_source_pages_course_page ON source_pages(course_id, page_number);
+
+CREATE TABLE IF NOT EXISTS ingestion_runs (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER REFERENCES courses(id) ON DELETE SET NULL,
+    source_path TEXT NOT NULL,
+    content_hash TEXT,
+    status TEXT NOT NULL,
+    concept_count INTEGER,
+    error TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ingestion_runs_hash ON ingestion_runs(content_hash, status);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def open_wal_connection(db_path: str) -> sqlite3.Connection:
+    """A connection in WAL mode, so readers never block on the single writer."""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class CourseDatabase:
+    """
+    Embedded SQLite store for courses, concepts, source pages and ingestion runs.
+
+    Runs in WAL mode so the API's readers never block on an ingestion writer. Each
+    thread gets its own connection. Every write bumps a catalog version kept in the
+    meta table, which the concept endpoints use for their ETags.
+
+    Implements the same read interface as concepts.ConceptCatalog (version,
+    list_courses, get_concepts, get_concept).
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = str(db_path or settings.course_db_path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_wal_connection(self.db_path)
+            self._local.conn = conn
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.executescript(SCHEMA)
+            conn.commit()
+            self._initialized = True
+        # Deployments that only have the CSV files get them imported once
+        if settings.course_db_auto_import and self.course_count() == 0:
+            imported = import_concept_csvs(self)
+            if imported:
+                print(f"Imported {imported} courses from {CONCEPTS_DIR} into {self.db_path}")
+
+    def _bump_version(self, conn: sqlite3.Connection) -> None:
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('catalog_version', ?)", (uuid.uuid4().hex[:16],))
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('catalog_updated_at', ?)", (str(time.time()),))
+
+    # Reads
+
+    def version(self):
+        """
+        Current catalog version.
+
+        Returns:
+            tuple: (version string, last modification time as a UNIX timestamp)
+        """
+        rows = dict(self.connection().execute(
+            "SELECT key, value FROM meta WHERE key IN ('catalog_version', 'catalog_updated_at')").fetchall())
+        return rows.get("catalog_version", "empty"), float(rows.get("catalog_updated_at", 0.0))
+
+    def course_count(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+
+    def has_course(self, course_id: str) -> bool:
+        return self.connection().execute("SELECT 1 FROM courses WHERE course_key = ?", (course_id,)).fetchone() is not None
+
+    def list_courses(self) -> List[Dict]:
+        rows = self.connection().execute("""
+            SELECT c.course_key, c.title, COUNT(k.id) AS concept_count
+            FROM courses c LEFT JOIN concepts k ON k.course_id = c.id
+            GROUP BY c.id ORDER BY c.course_key
+        """).fetchall()
+        return [{"course_id": row["course_key"], "title": row["title"], "concept_count": row["concept_count"]}
+                for row in rows]
+
+    def get_concepts(self, course_id: str, offset: int = 0, limit: int = -1) -> Optional[List[Dict[str, str]]]:
+        """Concepts of a course in order (optionally one page of them), or None if the course does not exist."""
+        conn = self.connection()
+        course = conn.execute("SELECT id FROM courses WHERE course_key = ?", (course_id,)).fetchone()
+        if course is None:
+            return None
+        rows = conn.execute("""
+            SELECT concept_id, title, question, answer FROM concepts
+            WHERE course_id = ? ORDER BY position LIMIT ? OFFSET ?
+        """, (course["id"], limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_concept(self, course_id: str, concept_id: str) -> Optional[Dict[str, str]]:
+        """A single concept, looked up through the (course, concept_id) index."""
+        concept_id = str(concept_id).strip()
+        if concept_id.isdigit():
+            concept_id = str(int(concept_id))
+        row = self.connection().execute("""
+            SELECT k.concept_id, k.title, k.question, k.answer
+            FROM concepts k JOIN courses c ON c.id = k.course_id
+            WHERE c.course_key = ? AND k.concept_id = ?
+        """, (course_id, concept_id)).fetchone()
+        return dict(row) if row else None
+
+    def find_concept_by_title(self, course_id: str, title: str) -> Optional[Dict[str, str]]:
+        """A concept by its exact title, looked up through the title index."""
+        row = self.connection().execute("""
+            SELECT k.concept_id, k.title, k.question, k.answer
+            FROM concepts k JOIN courses c ON c.id = k.course_id
+            WHERE k.title = ? AND c.course_key = ?
+        """, (title.strip(), course_id)).fetchone()
+        return dict(row) if row else None
+
+    def get_source_pages(self, course_id: str) -> List[str]:
+        """Page texts of a course's source deck in page order (empty if none were stored)."""
+        rows = self.connection().execute("""
+            SELECT p.text FROM source_pages p JOIN courses c ON c.id = p.course_id
+            WHERE c.course_key = ? ORDER BY p.page_number
+        """, (course_id,)).fetchall()
+        return [row["text"] for row in rows]
+
+    def get_course(self, course_id: str) -> Optional[Dict]:
+        """A course's title, source deck and the deck's content hash, or None if there is no such course."""
+        row = self.connection().execute(
+            "SELECT course_key, title, source_path, content_hash FROM courses WHERE course_key = ?", (course_id,)).fetchone()
+        if row is None:
+            return None
+        return {"course_id": row["course_key"], "title": row["title"], "source_path": row["source_path"],
+                "content_hash": row["content_hash"]}
+
+    def get_content_hash(self, course_id: str) -> Optional[str]:
+        """Hash of the deck a course was generated from (None if unknown or there is no such course)."""
+        row = self.connection().execute("SELECT content_hash FROM courses WHERE course_key = ?", (course_id,)).fetchone()
+        return row["content_hash"] if row else None
+
+    def find_completed_run(self, content_hash: str) -> Optional[Dict]:
+        """The latest successful ingestion of a deck with this content hash, if any."""
+        row = self.connection().execute("""
+            SELECT r.*, c.course_key FROM ingestion_runs r LEFT JOIN courses c ON c.id = r.course_id
+            WHERE r.content_hash = ? AND r.status = 'completed' ORDER BY r.id DESC LIMIT 1
+        """, (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    # Writes
+
+    def upsert_course(self, course_id: str, concepts: List[Dict[str, str]], title: str = None,
+                      source_path: str = None, content_hash: str = None, page_texts: List[str] = None) -> None:
+        """
+        Replace a course's concepts (and source pages, if given) in one transaction.
+
+        Args:
+            course_id: Course key, e.g. the deck's file name without extension
+            concepts: Concept dicts with concept_id, title, question and answer
+            title: Display title, defaults to the course key
+            source_path: Deck the course was generated from
+            content_hash: Hash of the deck's content
+            page_texts: Text of every page of the deck
+        """
+        conn = self.connection()
+        now = _now()
+        with conn:
+            conn.execute("""
+                INSERT INTO courses(course_key, title, source_path, content_hash, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(course_key) DO UPDATE SET
+                    title = excluded.title,
+                    source_path = COALESCE(excluded.source_path, courses.source_path),
+                    content_hash = COALESCE(excluded.content_hash, courses.content_hash),
+                    updated_at = excluded.updated_at
+            """, (course_id, title or course_id, source_path, content_hash, now, now))
+            course_row_id = conn.execute("SELECT id FROM courses WHERE course_key = ?", (course_id,)).fetchone()[0]
+            conn.execute("DELETE FROM concepts WHERE course_id = ?", (course_row_id,))
+            conn.executemany("""
+                INSERT INTO concepts(course_id, concept_id, position, title, question, answer)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(course_row_id, concept["concept_id"], position, concept["title"], concept["question"], concept["answer"])
+                  for position, concept in enumerate(concepts, start=1)])
+            if page_texts is not None:
+                conn.execute("DELETE FROM source_pages WHERE course_id = ?", (course_row_id,))
+                conn.executemany("INSERT INTO source_pages(course_id, page_number, text) VALUES (?, ?, ?)",
+                                 [(course_row_id, page, text) for page, text in enumerate(page_texts, start=1)])
+            self._bump_version(conn)
+
+    def start_ingestion_run(self, source_path: str, content_hash: str = None) -> int:
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute("""
+                INSERT INTO ingestion_runs(source_path, content_hash, status, started_at)
+                VALUES (?, ?, 'running', ?)
+            """, (source_path, content_hash, _now()))
+        return cursor.lastrowid
+
+    def finish_ingestion_run(self, run_id: int, course_id: str = None, concept_count: int = None, error: str = None) -> None:
+        conn = self.connection()
+        with conn:
+            conn.execute("""
+                UPDATE ingestion_runs SET
+                    status = ?, error = ?, concept_count = ?, finished_at = ?,
+                    course_id = (SELECT id FROM courses WHERE course_key = ?)
+                WHERE id = ?
+            """, ("failed" if error else "completed", error, concept_count, _now(), course_id, run_id))
+
+
+def import_concept_csvs(db: CourseDatabase, concepts_dir: Path = CONCEPTS_DIR) -> int:
+    """
+    Import every *_qa.csv file into the database, replacing courses with the same key.
+
+    Returns:
+        Number of imported courses
+    """
+    imported = 0
+    for path in sorted(Path(concepts_dir).glob(f"*{CONCEPT_FILE_SUFFIX}")):
+        with open(path, "r", encoding="utf-8") as f:
+            concepts = parse_concepts_csv(f.read())
+        db.upsert_course(course_id_for(path), concepts, source_path=str(path))
+        print(f"Imported {len(concepts)} concepts from {path.name}")
+        imported += 1
+    return imported
+
+
+course_db = CourseDatabase()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the course database.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    import_parser = subcommands.add_parser("import-csv", help="Import *_qa.csv concept files")
+    import_parser.add_argument("directory", nargs="?", default=str(CONCEPTS_DIR), help="Directory with *_qa.csv files")
+    subcommands.add_parser("list", help="List courses and concept counts")
+    args = parser.parse_args()
+
+    if args.command == "import-csv":
+        count = import_concept_csvs(course_db, Path(args.directory))
+        print(f"Imported {count} courses into {course_db.db_path}")
+    elif args.command == "list":
+        for course in course_db.list_courses():
+            print(f"{course['course_id']}: {course['concept_count']} concepts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+
+from .config import settings
+from .search_index import tokenize
+
+KEY_POINT_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+\s*(?:[-*•]|\d+[.)])?\s*")
+USER_TURN = re.compile(r"^USER:\s*(.*?)(?=\n\s*\nGRANDPA:|\n--- End of conversation|\Z)", re.S | re.M)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+NGRAM_DIMENSIONS = 4096
+
+
+def split_key_points(answer: str, min_tokens: int = 2) -> List[str]:
+    """Split an expected answer into key points: sentences, clauses after semicolons and list items."""
+    points = [point.strip(" -*•\t") for point in KEY_POINT_SPLIT.split(answer or "")]
+    return [point for point in points if len(tokenize(point)) >= min_tokens]
+
+
+def user_turns(chat_history: str) -> List[str]:
+    """What the learner (USER) said in a conversation history."""
+    return [turn.strip() for turn in USER_TURN.findall(chat_history or "") if turn.strip()]
+
+
+def ngram_vectors(texts: List[str], n: int = 3) -> np.ndarray:
+    """
+    L2-normalized hashed character n-gram counts, one row per text.
+
+    Cosine similarity of these rows matches paraphrases that share word stems and
+    morphology ("perceive"/"perception") where exact token overlap does not.
+    """
+    vectors = np.zeros((len(texts), NGRAM_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        padded = f" {' '.join(tokenize(text))} "
+        if len(padded) < n:
+            continue
+        buckets = [zlib.crc32(padded[i:i + n].encode("utf-8")) % NGRAM_DIMENSIONS for i in range(len(padded) - n + 1)]
+        np.add.at(vectors[row], buckets, 1.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+@dataclass
+class CoverageResult:
+    """
+    Local estimate of how well the learner covered the expected answer.
+
+    confident is True when the estimate is clear enough to stand in for the LLM
+    evaluation (nothing relevant said, or every key point covered).
+    """
+    score: float
+    confident: bool
+    reason: str
+    point_coverage: List[float] = field(default_factory=list)
+
+
+class CoverageScorer:
+    """
+    Key-point coverage of the learner's turns, computed with NumPy.
+
+    Each key point of the expected answer gets a coverage in [0, 1], a weighted mix of
+    - lexical coverage: the share of the point's content words the learner used, and
+    - semantic coverage: the best character n-gram cosine between the point and any
+      sentence the learner said.
+    """
+
+    def coverage(self, answer: str, chat_history: str) -> np.ndarray:
+        points = split_key_points(answer)
+        sentences = [sentence for turn in user_turns(chat_history) for sentence in SENTENCE_SPLIT.split(turn) if sentence]
+        if not points:
+            return np.zeros(0, dtype=np.float32)
+        if not sentences:
+            return np.zeros(len(points), dtype=np.float32)
+
+        point_tokens = [set(tokenize(point)) for point in points]
+        spoken = set(tokenize(" ".join(sentences)))
+        vocabulary = {token: i for i, token in enumerate(sorted(set().union(*point_tokens)))}
+        point_matrix = np.zeros((len(points), len(vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(point_tokens):
+            point_matrix[row, [vocabulary[token] for token in tokens]] = 1.0
+        spoken_vector = np.zeros(len(vocabulary), dtype=np.float32)
+        spoken_vector[[vocabulary[token] for token in spoken if token in vocabulary]] = 1.0
+        lexical = (point_matrix @ spoken_vector) / np.maximum(point_matrix.sum(axis=1), 1.0)
+
+        semantic = (ngram_vectors(points) @ ngram_vectors(sentences).T).max(axis=1)
+        weight = settings.prescore_lexical_weight
+        return np.clip(weight * lexical + (1 - weight) * semantic, 0.0, 1.0)
+
+    def score(self, answer: str, chat_history: str) -> CoverageResult:
+        """
+        Provisional 0-100 score and whether it is confident enough to skip the LLM.
+
+        Args:
+            answer: The concept's expected answer
+            chat_history: The conversation history (USER/GRANDPA entries)
+        """
+        point_coverage = self.coverage(answer, chat_history)
+        if point_coverage.size == 0:
+            return CoverageResult(0.0, False, "no key points")
+        spoken_words = sum(len(tokenize(turn)) for turn in user_turns(chat_history))
+        mean = float(point_coverage.mean())
+        low, high = settings.prescore_low_coverage, settings.prescore_high_coverage
+
+        if spoken_words < settings.prescore_min_words:
+            return CoverageResult(0.0, True, f"learner said {spoken_words} content words", point_coverage.tolist())
+        if float(point_coverage.max()) <= low:
+            return CoverageResult(round(100 * mean, 1), True, "no key point covered", point_coverage.tolist())
+        if float(point_coverage.min()) >= high:
+            # Everything covered: map [high, 1] onto the top of the scale
+            score = 85 + 15 * (mean - high) / max(1 - high, 1e-9)
+            return CoverageResult(round(min(100.0, score), 1), True, "all key points covered", point_coverage.tolist())
+        covered = int((point_coverage >= high).sum())
+        return CoverageResult(round(100 * mean, 1), False, f"{covered}/{point_coverage.size} key points covered",
+                              point_coverage.tolist())
+
+
+coverage_scorer = CoverageScorer()
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from .config import settings
+
+THUMBNAIL_WIDTH = 512
+
+
+@dataclass
+class DrawingFingerprint:
+    """
+    Compact summary of a drawing: a 64-bit difference hash plus a grayscale thumbnail for region diffs.
+
+    Drawings uploaded as stroke vectors also list their strokes (stroke hash to
+    bounding box in canvas pixels).
+    """
+    dhash: int
+    thumbnail: Image.Image
+    size: Tuple[int, int]
+    strokes: Optional[Dict[str, Tuple[int, int, int, int]]] = None
+
+
+@dataclass
+class DrawingChange:
+    """
+    How a drawing differs from the session's previous one.
+
+    kind is "new" (no previous drawing), "unchanged", "region" (only bbox changed,
+    in full-resolution pixel coordinates) or "changed".
+    """
+    kind: str
+    bbox: Optional[Tuple[int, int, int, int]] = None
+    hamming_distance: Optional[int] = None
+    changed_fraction: float = 1.0
+    strokes_added: Optional[int] = None
+    strokes_removed: Optional[int] = None
+
+
+def difference_hash(image: Image.Image) -> int:
+    """64-bit dHash: compares horizontally adjacent pixels of a 9x8 grayscale thumbnail."""
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def fingerprint(image: Image.Image) -> DrawingFingerprint:
+    """Build the fingerprint stored per session for an RGB drawing."""
+    height = max(1, round(THUMBNAIL_WIDTH * image.height / image.width))
+    thumbnail = image.convert("L").resize((THUMBNAIL_WIDTH, height), Image.BILINEAR)
+    return DrawingFingerprint(difference_hash(image), thumbnail, image.size)
+
+
+def compare_strokes(previous: DrawingFingerprint, current: DrawingFingerprint) -> DrawingChange:
+    """
+    Classify the change between two stroke drawings by the strokes added and removed.
+
+    Pixels can only change where a stroke was added or removed, so the union of
+    their bounding boxes is the changed region.
+    """
+    added = current.strokes.keys() - previous.strokes.keys()
+    removed = previous.strokes.keys() - current.strokes.keys()
+    if not added and not removed:
+        return DrawingChange("unchanged", changed_fraction=0.0, strokes_added=0, strokes_removed=0)
+
+    boxes = [current.strokes[key] for key in added] + [previous.strokes[key] for key in removed]
+    width, height = current.size
+    margin = settings.notepad_crop_margin
+    bbox = (
+        max(0, min(box[0] for box in boxes) - margin),
+        max(0, min(box[1] for box in boxes) - margin),
+        min(width, max(box[2] for box in boxes) + margin),
+        min(height, max(box[3] for box in boxes) + margin),
+    )
+    changed_fraction = max(0, bbox[2] - bbox[0]) * max(0, bbox[3] - bbox[1]) / (width * height)
+    kind = "region" if changed_fraction <= settings.drawing_region_max_fraction else "changed"
+    return DrawingChange(kind, bbox=bbox if kind == "region" else None, changed_fraction=changed_fraction,
+                         strokes_added=len(added), strokes_removed=len(removed))
+
+
+def compare_fingerprints(previous: DrawingFingerprint, current: DrawingFingerprint) -> DrawingChange:
+    """
+    Classify the change between two drawings.
+
+    The hash catches global changes cheaply; the thumbnail diff finds small edits
+    the hash is blind to and localizes them. Two stroke drawings are compared by
+    their strokes instead.
+    """
+    if previous.size != current.size:
+        return DrawingChange("changed")
+    if previous.strokes is not None and current.strokes is not None:
+        return compare_strokes(previous, current)
+
+    hamming = bin(previous.dhash ^ current.dhash).count("1")
+    threshold = settings.notepad_ink_threshold
+    diff = ImageChops.difference(previous.thumbnail, current.thumbnail).point(lambda v: 255 if v > threshold else 0)
+    bbox = diff.getbbox()
+    changed_pixels = diff.histogram()[255]
+    changed_fraction = changed_pixels / (diff.width * diff.height)
+
+    # Even a single new word changes a few thumbnail pixels, so "unchanged" tolerates only noise
+    if hamming <= settings.drawing_unchanged_hamming and changed_pixels <= settings.drawing_unchanged_max_pixels:
+        return DrawingChange("unchanged", hamming_distance=hamming, changed_fraction=changed_fraction)
+
+    if bbox is not None:
+        left, top, right, bottom = bbox
+        area_fraction = (right - left) * (bottom - top) / (diff.width * diff.height)
+        if area_fraction <= settings.drawing_region_max_fraction:
+            scale = current.size[0] / diff.width
+            margin = settings.notepad_crop_margin
+            full_bbox = (
+                max(0, int(left * scale) - margin),
+                max(0, int(top * scale) - margin),
+                min(current.size[0], int(right * scale) + margin),
+                min(current.size[1], int(bottom * scale) + margin),
+            )
+            return DrawingChange("region", bbox=full_bbox, hamming_distance=hamming, changed_fraction=changed_fraction)
+
+    return DrawingChange("changed", hamming_distance=hamming, changed_fraction=changed_fraction)
+
+
+class DrawingTracker:
+    """Remembers the last drawing fingerprint of each learning session (bounded, least recently used evicted)."""
+
+    def __init__(self, max_sessions: int = None):
+        self.max_sessions = max_sessions or settings.drawing_tracker_max_sessions
+        self._fingerprints = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compare(self, session_id: str, current: DrawingFingerprint) -> DrawingChange:
+        """Compare a drawing with the session's last remembered drawing without updating it."""
+        with self._lock:
+            previous = self._fingerprints.get(session_id)
+        if previous is None:
+            return DrawingChange("new")
+        return compare_fingerprints(previous, current)
+
+    def remember(self, session_id: str, current: DrawingFingerprint) -> None:
+        """Store a drawing as the session's latest, once the turn that used it succeeded."""
+        with self._lock:
+            self._fingerprints[session_id] = current
+            self._fingerprints.move_to_end(session_id)
+            while len(self._fingerprints) > self.max_sessions:
+                self._fingerprints.popitem(last=False)
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._fingerprints.pop(session_id, None)
+
+
+drawing_tracker = DrawingTracker()
@@ -1,8 +1,19 @@
 from typing import Dict, Tuple, List, Optional
+import json
 import os
+import random
+import threading
+import time
 from pathlib import Path
-import openai
 from dotenv import load_dotenv
+from .config import settings
+from .coverage_scorer import CoverageResult, coverage_scorer
+from .model_router import model_router
+from .openai_clients import openai_clients
+from .upstream import client_for_attempt, upstream
+from .usage_ledger import usage_from_response, usage_ledger
+
+EVALUATION_MODEL = "gpt-4o-mini"
 
 class Evaluator:
     def __init__(self):
@@ -11,7 +22,9 @@ class Evaluator:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in .env file")
-        self.client = openai.OpenAI(api_key=api_key)
+        self.client = openai_clients.sync()
+        self._lock = threading.Lock()
+        self.stats = dict.fromkeys(("evaluations", "local", "escalated", "audited", "audit_agreements"), 0)
     
     def evaluate(self, 
                 concept: Dict,
@@ -19,6 +32,10 @@ class Evaluator:
         """
         Evaluate the user's overall understanding of a concept based on the conversation history.
         
+        With settings.evaluation_prescoring, the local key-point coverage scorer answers
+        the clear cases (nothing relevant said, everything covered) without an LLM call;
+        only ambiguous histories, and a sample of clear ones for auditing, go to the LLM.
+        
         Args:
             concept (Dict): The concept being explained, containing 'title' and 'description' (expected answer).
             chat_history (str): The complete conversation history between the user (grandchild) and the AI (grandpa).
@@ -26,6 +43,60 @@ class Evaluator:
         Returns:
             float: A score between 0 and 100 representing the user's understanding demonstrated in the history.
         """
+        self._count("evaluations")
+        if not settings.evaluation_prescoring:
+            return self.evaluate_with_llm(concept, chat_history)
+        
+        local = coverage_scorer.score(concept["description"], chat_history)
+        print(f"Local coverage score: {local.score} (confident: {local.confident}, {local.reason})")
+        if local.confident and random.random() >= settings.prescore_audit_rate:
+            self._count("local")
+            return local.score
+        
+        score = self.evaluate_with_llm(concept, chat_history)
+        if local.confident:
+            self._count("audited")
+            if abs(score - local.score) <= settings.prescore_agreement_tolerance:
+                self._count("audit_agreements")
+        else:
+            self._count("escalated")
+        self.record(concept, chat_history, local, score)
+        return score
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+    
+    def snapshot(self) -> dict:
+        """Evaluation counters with the fraction of LLM calls avoided and the audited agreement rate."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["avoided_fraction"] = round(stats["local"] / stats["evaluations"], 3) if stats["evaluations"] else None
+        stats["audit_agreement_rate"] = round(stats["audit_agreements"] / stats["audited"], 3) if stats["audited"] else None
+        return stats
+    
+    def record(self, concept: Dict, chat_history: str, local: CoverageResult, llm_score: float) -> None:
+        """Keep an LLM-scored history with the local estimate, for offline agreement reports."""
+        if not settings.evaluation_log_path:
+            return
+        entry = {
+            "created_at": time.time(),
+            "title": concept["title"],
+            "answer": concept["description"],
+            "history": chat_history,
+            "llm_score": llm_score,
+            "local_score": local.score,
+            "local_confident": local.confident,
+        }
+        try:
+            Path(settings.evaluation_log_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(settings.evaluation_log_path, "a", encoding="utf-8") as log:
+                log.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Warning: could not record evaluation: {str(e)}")
+    
+    def evaluate_with_llm(self, concept: Dict, chat_history: str) -> float:
+        """Score the history with the evaluation model (see evaluate)."""
         
         # Prepare the evaluation prompt
         evaluation_prompt = f"""You are an AI evaluator assessing a student's understanding of a concept based on their conversation with their AI grandpa.
@@ -48,14 +119,18 @@ class Evaluator:
         Format your response ONLY as:
         SCORE: [number between 0 and 100]"""
         
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        decision = model_router.route_evaluation(EVALUATION_MODEL, chat_history)
+        model = usage_ledger.model_for(decision.model)
+        started = time.monotonic()
+        response = upstream.call("evaluation", lambda timeout: client_for_attempt(self.client, timeout).chat.completions.create(
+            model=model,
             messages=[
                 {"role": "system", "content": "You are an expert evaluator. Provide only the score as requested."}, # Simplified system message
                 {"role": "user", "content": evaluation_prompt}
             ],
             temperature=0.5 # Slightly reduced temperature for more consistent scoring
-        )
+        ), model=model)
+        model_router.settle(decision, model, usage_from_response(response), time.monotonic() - started)
         
         # Parse the response
         result = response.choices[0].message.content.strip()
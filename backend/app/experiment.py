@@ -2,8 +2,9 @@ from openai import OpenAI
 import requests
 from pathlib import Path
 import base64
-from core import transcribe_speech_input, analyze_image, generate_answer_audio
-import pandas as pd
+from .core import transcribe_speech_input, analyze_image, generate_answer_audio
+from .config import settings
+from .course_db import course_db
 
 
 def main():
@@ -52,12 +53,12 @@ def main():
 
 
 
-def get_concept(concept_id):
-    concepts = pd.read_csv("backend/extracted_key_concepts/ArtificialIntelligence_2_IntelligentAgents-2_qa.csv")
-    concept_row = concepts.iloc[int(concept_id) - 1]
-    concept_explanation = concept_row.iloc[0]
-    concept_text = concept_row._name[1]
+def get_concept(concept_id, course_id=None):
+    concept = course_db.get_concept(course_id or settings.default_course_id, concept_id)
+    print(concept)
+    return concept
 
 
+# Run from the backend directory: python -m app.experiment
 if __name__ == "__main__":
    get_concept("1")
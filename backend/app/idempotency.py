@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .config import settings
+
+
+class IdempotencyConflictError(Exception):
+    """An idempotency key was reused for a request with different content."""
+
+
+def request_fingerprint(*parts, files=()) -> str:
+    """
+    Hash of what makes a request the same request: form values and uploaded file contents.
+
+    Args:
+        parts: Form values (converted with str)
+        files: Paths of uploaded files, hashed by content
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    for path in files:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _response_size(result) -> int:
+    """Rough size of a cached response; the base64 audio dominates."""
+    if isinstance(result, dict):
+        return sum(len(value) if isinstance(value, (str, bytes)) else 64 for value in result.values())
+    return 1024
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    future: asyncio.Future
+    created_at: float
+    size: int = 0
+
+
+class IdempotencyCache:
+    """
+    Short-lived responses of expensive endpoints, by client-chosen idempotency key.
+
+    The first request with a key runs; a retry with the same key gets the stored
+    response, or, if the first is still running (the client timed out, the server did
+    not), waits for it instead of starting the turn again. Failed requests are not
+    stored, so a retry after an error runs again. Entries expire after
+    settings.idempotency_ttl_seconds and the oldest are evicted beyond
+    settings.idempotency_cache_max_mb. The cache lives in the worker process.
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_bytes: int = None, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.idempotency_ttl_seconds
+        self.max_bytes = max_bytes if max_bytes is not None else settings.idempotency_cache_max_mb * 1024 * 1024
+        self.clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.stats = {"executed": 0, "replayed": 0, "joined_in_flight": 0, "conflicts": 0, "evicted": 0}
+
+    def _expire(self) -> None:
+        now = self.clock()
+        for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]:
+            if self._entries[key].future.done():
+                del self._entries[key]
+        stored = sum(entry.size for entry in self._entries.values())
+        while stored > self.max_bytes:
+            key = next((key for key, entry in self._entries.items() if entry.future.done()), None)
+            if key is None:
+                break
+            stored -= self._entries.pop(key).size
+            self.stats["evicted"] += 1
+
+    async def run(self, key: str, fingerprint: str, compute: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """
+        The response for a key: stored, joined while in flight, or computed now.
+
+        Args:
+            key: Endpoint-scoped idempotency key
+            fingerprint: request_fingerprint of the request
+            compute: Produces the response when the key is new
+
+        Returns:
+            tuple: (response, whether it was replayed rather than computed by this call)
+
+        Raises:
+            IdempotencyConflictError: if the key was used for a different request
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.stats["conflicts"] += 1
+                raise IdempotencyConflictError(f"Idempotency key '{key}' was already used for a different request")
+            self.stats["replayed" if entry.future.done() else "joined_in_flight"] += 1
+            # Shielded: a retry that gives up must not cancel the original request
+            return await asyncio.shield(entry.future), True
+
+        entry = _Entry(fingerprint, asyncio.get_running_loop().create_future(), self.clock())
+        self._entries[key] = entry
+        self.stats["executed"] += 1
+        try:
+            result = await compute()
+        except BaseException as e:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                entry.future.cancel()
+            else:
+                entry.future.set_exception(e)
+                # Retries waiting on the future re-raise it; mark it retrieved for when there are none
+                entry.future.exception()
+            raise
+        entry.future.set_result(result)
+        entry.size = _response_size(result)
+        self._expire()
+        return result, False
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, entries=len(self._entries),
+                    stored_bytes=sum(entry.size for entry in self._entries.values()))
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def scoped_key(endpoint: str, idempotency_key: Optional[str]) -> Optional[str]:
+    """Keys are per endpoint, so a client may use the same key for a follow-up and a finalize."""
+    return f"{endpoint}:{idempotency_key.strip()}" if idempotency_key and idempotency_key.strip() else None
@@ -0,0 +1,204 @@
+import base64
+import io
+import math
+import os
+from dataclasses import dataclass
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat, features
+
+from .config import settings
+
+# The vision model downsizes low-detail images to fit 512x512 and bills a flat 85 tokens.
+LOW_DETAIL_MAX_SIDE = 512
+LOW_DETAIL_TOKENS = 85
+HIGH_DETAIL_BASE_TOKENS = 85
+HIGH_DETAIL_TILE_TOKENS = 170
+
+
+@dataclass
+class OptimizedImage:
+    """A notepad image ready for the vision call, plus what the optimization saved."""
+    image_url: str
+    detail: str
+    width: int
+    height: int
+    original_bytes: int
+    optimized_bytes: int
+    original_tokens: int
+    optimized_tokens: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.optimized_bytes
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.optimized_tokens
+
+
+def estimate_vision_tokens(width: int, height: int, detail: str) -> int:
+    """
+    Estimate the input tokens the vision model bills for an image.
+
+    High detail first fits the image into 2048x2048, then scales the shortest side
+    down to 768 and charges per 512px tile.
+    """
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return HIGH_DETAIL_BASE_TOKENS + HIGH_DETAIL_TILE_TOKENS * tiles
+
+
+def background_color(image: Image.Image) -> tuple:
+    """Estimate the blackboard colour as the median of the border pixels."""
+    width, height = image.size
+    border = Image.new("RGB", (2 * width + 2 * height, 1))
+    border.paste(image.crop((0, 0, width, 1)), (0, 0))
+    border.paste(image.crop((0, height - 1, width, height)), (width, 0))
+    border.paste(image.crop((0, 0, 1, height)).rotate(90, expand=True), (2 * width, 0))
+    border.paste(image.crop((width - 1, 0, width, height)).rotate(90, expand=True), (2 * width + height, 0))
+    return tuple(int(v) for v in ImageStat.Stat(border).median)
+
+
+def ink_mask(image: Image.Image) -> Image.Image:
+    """Binary mask ("L" mode, 0/255) of pixels that differ clearly from the background."""
+    background = Image.new("RGB", image.size, background_color(image))
+    difference = ImageChops.difference(image, background).convert("L")
+    threshold = settings.notepad_ink_threshold
+    return difference.point(lambda v: 255 if v > threshold else 0)
+
+
+def estimate_stroke_width(mask: Image.Image) -> float:
+    """
+    Estimate the average stroke width in pixels.
+
+    A stroke of width w and length l covers about w*l pixels and has about 2*l
+    edge pixels, so the width is roughly 2 * area / edge pixels.
+    """
+    area = ImageStat.Stat(mask).sum[0] / 255
+    eroded = mask.filter(ImageFilter.MinFilter(3))
+    edges = ImageStat.Stat(ImageChops.subtract(mask, eroded)).sum[0] / 255
+    if edges == 0:
+        return 1.0
+    return max(1.0, 2 * area / edges)
+
+
+def encode_image(image: Image.Image) -> tuple:
+    """Encode as WebP when Pillow supports it, PNG otherwise. Returns (bytes, mime type)."""
+    buffer = io.BytesIO()
+    if features.check("webp"):
+        image.save(buffer, format="WEBP", quality=settings.notepad_webp_quality)
+        return buffer.getvalue(), "image/webp"
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue(), "image/png"
+
+
+def choose_scale(width: int, height: int, stroke_width: float) -> float:
+    """
+    Downscale factor for a cropped drawing: as small as strokes stay readable.
+
+    Args:
+        width: Width of the cropped drawing in pixels
+        height: Height of the cropped drawing in pixels
+        stroke_width: Typical stroke width in pixels at that size
+
+    Returns:
+        Scale factor, at most 1.0
+    """
+    # Shrink until strokes would get thinner than the readable minimum
+    scale = min(1.0, settings.notepad_min_stroke_px / max(stroke_width, 1e-6))
+    longest = max(width, height)
+    scale = max(scale, min(1.0, settings.notepad_min_side / longest))
+    if longest * scale > LOW_DETAIL_MAX_SIDE and longest * scale <= LOW_DETAIL_MAX_SIDE * 1.25:
+        # Close enough to the low-detail size that the small loss in stroke width is worth 85 tokens
+        scale = LOW_DETAIL_MAX_SIDE / longest
+    return scale
+
+
+def finish_image(image: Image.Image, original_bytes: int = None, original_tokens: int = None) -> OptimizedImage:
+    """
+    Choose the vision detail level for a drawing already cropped and scaled, and encode it.
+
+    Args:
+        image: RGB image as it should be sent
+        original_bytes: Size of the upload this image came from, for reporting
+        original_tokens: Tokens the unoptimized image would have cost, for reporting
+    """
+    # A drawing that stays readable at 512px loses nothing in low-detail mode
+    detail = "low" if max(image.size) <= LOW_DETAIL_MAX_SIDE else "high"
+    data, mime_type = encode_image(image)
+    base64_image = base64.b64encode(data).decode("utf-8")
+
+    return OptimizedImage(
+        image_url=f"data:{mime_type};base64,{base64_image}",
+        detail=detail,
+        width=image.width,
+        height=image.height,
+        original_bytes=original_bytes if original_bytes is not None else len(data),
+        optimized_bytes=len(data),
+        original_tokens=original_tokens if original_tokens is not None else estimate_vision_tokens(image.width, image.height, "high"),
+        optimized_tokens=estimate_vision_tokens(image.width, image.height, detail),
+    )
+
+
+def prepare_image(image: Image.Image, original_bytes: int = None, original_tokens: int = None) -> OptimizedImage:
+    """
+    Crop an RGB drawing to its ink, downscale it and choose the vision detail level.
+
+    Args:
+        image: RGB image of the drawing
+        original_bytes: Size of the upload this image came from, for reporting
+        original_tokens: Tokens the unoptimized image would have cost, for reporting
+
+    Returns:
+        OptimizedImage with a data URL for the vision call
+    """
+    if original_tokens is None:
+        original_tokens = estimate_vision_tokens(image.width, image.height, "high")
+
+    mask = ink_mask(image)
+    bbox = mask.getbbox()
+    if bbox is None:
+        # Blank blackboard: a thumbnail is enough to show there is nothing on it
+        image = image.resize((64, max(1, round(64 * image.height / image.width))))
+        mask = None
+    else:
+        margin = settings.notepad_crop_margin
+        left, top, right, bottom = bbox
+        crop_box = (max(0, left - margin), max(0, top - margin),
+                    min(image.width, right + margin), min(image.height, bottom + margin))
+        image = image.crop(crop_box)
+        mask = mask.crop(crop_box)
+
+    if mask is not None:
+        scale = choose_scale(image.width, image.height, estimate_stroke_width(mask))
+        if scale < 1.0:
+            new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(new_size, Image.LANCZOS)
+
+    return finish_image(image, original_bytes, original_tokens)
+
+
+def load_notepad_image(image_path: str) -> Image.Image:
+    """Decode an uploaded notepad image into RGB."""
+    with Image.open(image_path) as uploaded:
+        return uploaded.convert("RGB")
+
+
+def optimize_notepad_image(image_path: str) -> OptimizedImage:
+    """
+    Optimize an uploaded DrawingCanvas image for the vision call.
+
+    Args:
+        image_path: Path to the uploaded notepad image (WebP format)
+
+    Returns:
+        OptimizedImage with a data URL, the chosen detail level and the savings
+    """
+    image = load_notepad_image(image_path)
+    original_tokens = estimate_vision_tokens(image.width, image.height, "high")
+    return prepare_image(image, os.path.getsize(image_path), original_tokens)
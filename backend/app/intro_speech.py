@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from openai import OpenAI
+
+from .config import settings
+from .core import AUDIO_FORMATS, GRANDPA_TTS_MODEL, GRANDPA_VOICE, GRANDPA_VOICE_INSTRUCTIONS, synthesize_speech
+from .course_db import course_db
+from .openai_clients import openai_clients
+from .usage_ledger import attribute_usage
+
+AUDIO_STORE_DIR = Path(__file__).resolve().parent.parent / "audio_store"
+ADDRESS_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def speech_address(text: str, audio_format: str) -> str:
+    """
+    Address of the audio for a text.
+
+    Derived from everything that determines the audio (text, model, voice, voice
+    instructions, format), so an address always names the same bytes and a file,
+    once written, never changes.
+    """
+    digest = hashlib.sha256()
+    for part in (GRANDPA_TTS_MODEL, GRANDPA_VOICE, GRANDPA_VOICE_INSTRUCTIONS, audio_format, text.strip()):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AudioStore:
+    """Immutable store of synthesized speech, one file per address under audio_store/<aa>/."""
+
+    def __init__(self, root: Path = AUDIO_STORE_DIR):
+        self.root = Path(root)
+
+    def path(self, address: str, audio_format: str) -> Optional[Path]:
+        """Path of an address, or None if the address or format is malformed."""
+        if not ADDRESS_PATTERN.fullmatch(address or "") or audio_format not in AUDIO_FORMATS:
+            return None
+        return self.root / address[:2] / f"{address}.{audio_format}"
+
+    def exists(self, address: str, audio_format: str) -> bool:
+        path = self.path(address, audio_format)
+        return path is not None and path.exists()
+
+    def put(self, address: str, audio_format: str, data: bytes) -> Path:
+        """Write audio atomically; concurrent writers of the same address write identical bytes."""
+        path = self.path(address, audio_format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        return path
+
+
+class IntroSpeech:
+    """
+    Grandpa's opening question for every concept, synthesized ahead of time.
+
+    Ingestion schedules a course in the background; the /grandmaspeech/ endpoint then
+    only looks the audio up. A concept whose audio is missing (e.g. added before this
+    existed) is synthesized on first request and stored like the rest.
+    """
+
+    def __init__(self, store: AudioStore = None):
+        self.store = store or AudioStore()
+        self._executor = ThreadPoolExecutor(max_workers=settings.intro_speech_workers, thread_name_prefix="intro-speech")
+        self._client = None
+
+    def client(self) -> OpenAI:
+        return self._client or openai_clients.sync()
+
+    def ensure(self, text: str, audio_format: str = None, course_id: str = None, concept_id: str = None) -> str:
+        """
+        Make sure the audio for a text is in the store.
+
+        Returns:
+            The audio's address
+        """
+        audio_format = audio_format or settings.intro_speech_format
+        address = speech_address(text, audio_format)
+        if not self.store.exists(address, audio_format):
+            with attribute_usage(endpoint="intro-speech", course_id=course_id, concept_id=concept_id):
+                audio = synthesize_speech(self.client(), text, audio_format)
+            self.store.put(address, audio_format, audio)
+            print(f"Stored intro speech {address[:12]}.{audio_format} for concept {concept_id} of '{course_id}'")
+        return address
+
+    def synthesize_course(self, course_id: str, audio_format: str = None) -> dict:
+        """
+        Pre-synthesize the opening question of every concept of a course.
+
+        Returns:
+            Counts of synthesized, already stored and failed concepts
+        """
+        audio_format = audio_format or settings.intro_speech_format
+        counts = {"synthesized": 0, "stored": 0, "failed": 0}
+        for concept in course_db.get_concepts(course_id) or []:
+            if self.store.exists(speech_address(concept["question"], audio_format), audio_format):
+                counts["stored"] += 1
+                continue
+            try:
+                self.ensure(concept["question"], audio_format, course_id, concept["concept_id"])
+                counts["synthesized"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Intro speech for concept {concept['concept_id']} of '{course_id}' failed: {str(e)}")
+        print(f"Intro speech for '{course_id}': {counts}")
+        return counts
+
+    def schedule_course(self, course_id: str):
+        """Synthesize a course's intros in the background (used right after ingestion)."""
+        return self._executor.submit(self.synthesize_course, course_id)
+
+
+intro_speech = IntroSpeech()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-synthesize grandpa's opening questions.")
+    parser.add_argument("course_ids", nargs="*", help="Courses to synthesize (default: all)")
+    parser.add_argument("--format", default=settings.intro_speech_format, choices=sorted(AUDIO_FORMATS))
+    args = parser.parse_args()
+
+    course_ids = args.course_ids or [course["course_id"] for course in course_db.list_courses()]
+    for course_id in course_ids:
+        intro_speech.synthesize_course(course_id, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import statistics
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .config import settings
+from .upstream import UpstreamLatency, upstream
+from .usage_ledger import estimate_cost
+
+ROUTING_MODES = ("off", "shadow", "on")
+CHANGED_DRAWINGS = ("changed", "region")
+
+
+@dataclass
+class RoutingDecision:
+    """
+    The model for one call and why.
+
+    model is what the caller uses (before the session budget fallback), routed what
+    the policy chose and default what the caller asked for. They differ only in
+    shadow mode (model is the default) or when routing moved a call off the default.
+    """
+    operation: str
+    model: str
+    routed: str
+    default: str
+    difficulty: str  # "easy" or "hard"
+    reason: str
+    mode: str
+
+    @property
+    def alternative(self) -> Optional[str]:
+        """The model not called: the routed one in shadow mode, the default one when routing is on."""
+        other = self.routed if self.model == self.default else self.default
+        return other if other != self.model else None
+
+
+def classify_analysis(transcription: str, drawing_change: str, last_explanation: bool) -> tuple:
+    """
+    Difficulty of an analysis turn from signals available before the call.
+
+    Returns:
+        ("easy" or "hard", reason)
+    """
+    words = len((transcription or "").split())
+    if last_explanation:
+        return "hard", "final summary turn"
+    if words >= settings.routing_long_transcript_words:
+        return "hard", f"long explanation ({words} words)"
+    if drawing_change in CHANGED_DRAWINGS and words >= settings.routing_drawing_transcript_words:
+        return "hard", f"{drawing_change} drawing with {words} words"
+    return "easy", f"{words} words, drawing {drawing_change}"
+
+
+def classify_evaluation(chat_history: str) -> tuple:
+    """Difficulty of an evaluation: long histories spread the key points over many turns."""
+    chars = len(chat_history or "")
+    if chars >= settings.routing_evaluation_hard_chars:
+        return "hard", f"long history ({chars} chars)"
+    return "easy", f"{chars} chars of history"
+
+
+class ModelRouter:
+    """
+    Picks the model per analysis or evaluation call from cheap local signals instead
+    of always using the operation's default model.
+
+    Easy calls (short explanations, unchanged drawings) go to the easy tier of
+    settings.model_routing_tiers, hard ones (the final summary, long explanations of
+    a new drawing) to the hard tier. If the chosen model's recent average latency
+    (see UpstreamLatency) is above settings.routing_latency_limits and the other tier
+    is currently faster, the call goes there instead.
+
+    In shadow mode every call keeps its default model and the router only logs what
+    the alternative would have cost (same token counts at its prices) and how long
+    it would have taken (its recent average latency), so the savings can be judged
+    before routing is switched on.
+    """
+
+    def __init__(self, latency: UpstreamLatency = None, samples: int = 200):
+        self.latency = latency or upstream.latency
+        self._stats = defaultdict(lambda: dict.fromkeys(
+            ("calls", "easy", "hard", "latency_switches", "off_default", "cost_usd", "alternative_cost_usd",
+             "wall_seconds", "alternative_wall_seconds", "alternative_wall_known"), 0))
+        self._walls = defaultdict(lambda: deque(maxlen=samples))
+        self._lock = threading.Lock()
+
+    def route(self, operation: str, default: str, difficulty: str, reason: str) -> RoutingDecision:
+        """
+        Decide the model for a call of known difficulty.
+
+        Args:
+            operation: Upstream operation, a key of settings.model_routing_tiers
+            default: The model the caller uses without routing
+            difficulty: "easy" or "hard" (see classify_analysis and classify_evaluation)
+            reason: Why, for the logs
+
+        Returns:
+            The decision; call decision.model and report back with settle()
+        """
+        mode = settings.model_routing if settings.model_routing in ROUTING_MODES else "off"
+        tiers = settings.model_routing_tiers.get(operation)
+        if mode == "off" or not tiers:
+            return RoutingDecision(operation, default, default, default, difficulty, reason, "off")
+        routed = tiers[difficulty]
+        other = tiers["hard" if difficulty == "easy" else "easy"]
+        limit = settings.routing_latency_limits.get(operation)
+        routed_latency, other_latency = self.latency.current(operation, routed), self.latency.current(operation, other)
+        if (limit is not None and routed_latency is not None and routed_latency > limit
+                and other_latency is not None and other_latency < routed_latency):
+            reason = f"{reason}; {routed} averages {routed_latency:.1f}s, {other} {other_latency:.1f}s"
+            routed = other
+            self._count(operation, "latency_switches")
+        return RoutingDecision(operation, routed if mode == "on" else default, routed, default, difficulty, reason, mode)
+
+    def route_analysis(self, default: str, transcription: str, drawing_change: str, last_explanation: bool) -> RoutingDecision:
+        """Route one of grandpa's analysis turns (see classify_analysis)."""
+        return self.route("analysis", default, *classify_analysis(transcription, drawing_change, last_explanation))
+
+    def route_evaluation(self, default: str, chat_history: str) -> RoutingDecision:
+        """Route one LLM evaluation (see classify_evaluation)."""
+        return self.route("evaluation", default, *classify_evaluation(chat_history))
+
+    def settle(self, decision: RoutingDecision, model: str, usage: Dict[str, int], wall_seconds: float) -> None:
+        """
+        Record the outcome of a routed call and compare it with the alternative.
+
+        Args:
+            decision: What route() decided
+            model: The model that actually served the call (after the budget fallback)
+            usage: Token counts of the call (see usage_from_response)
+            wall_seconds: Wall time of the call
+        """
+        if decision.mode == "off":
+            return
+        alternative = decision.alternative
+        cost = estimate_cost(model, usage)
+        alternative_cost = estimate_cost(alternative, usage) if alternative else cost
+        alternative_wall = self.latency.current(decision.operation, alternative) if alternative else wall_seconds
+        with self._lock:
+            stats = self._stats[decision.operation]
+            stats["calls"] += 1
+            stats[decision.difficulty] += 1
+            stats["off_default"] += model != decision.default
+            stats["cost_usd"] += cost
+            stats["alternative_cost_usd"] += alternative_cost
+            if alternative_wall is not None:
+                stats["wall_seconds"] += wall_seconds
+                stats["alternative_wall_seconds"] += alternative_wall
+                stats["alternative_wall_known"] += 1
+            self._walls[(decision.operation, decision.difficulty)].append(wall_seconds)
+        if alternative:
+            expected = f"~{alternative_wall:.1f}s" if alternative_wall is not None else "unknown latency"
+            print(f"Routing ({decision.mode}) {decision.operation}: {decision.difficulty} ({decision.reason}); "
+                  f"{model} took {wall_seconds:.1f}s for ${cost:.5f}, "
+                  f"{alternative} would have cost ~${alternative_cost:.5f} with {expected}")
+
+    def _count(self, operation: str, name: str) -> None:
+        with self._lock:
+            self._stats[operation][name] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Per-operation routing counters, the cost of the calls made and of their
+        alternatives, median wall time per difficulty and the per-model latencies.
+        """
+        with self._lock:
+            stats = {operation: dict(counts) for operation, counts in self._stats.items()}
+            walls = {key: list(values) for key, values in self._walls.items()}
+        for operation, counts in stats.items():
+            for name in ("cost_usd", "alternative_cost_usd", "wall_seconds", "alternative_wall_seconds"):
+                counts[name] = round(counts[name], 6 if name.endswith("usd") else 2)
+            counts["median_wall_seconds"] = {difficulty: round(statistics.median(walls[(operation, difficulty)]), 3)
+                                             for difficulty in ("easy", "hard") if walls.get((operation, difficulty))}
+        return {"mode": settings.model_routing, "operations": stats, "latency": self.latency.snapshot()}
+
+
+model_router = ModelRouter()
@@ -0,0 +1,136 @@
+import importlib.util
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+from .config import settings
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ConnectionStats:
+    """
+    Connection reuse of the shared clients, measured with httpcore's trace extension.
+
+    Every request either reuses a pooled connection or opens a new one (TCP connect
+    plus TLS handshake); the reuse rate is the share of requests that did not pay
+    for a handshake.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(("requests", "new_connections", "http2_requests"), 0)
+        self.handshake_ms = 0.0
+
+    def _event(self, name: str, state: dict) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            if name.endswith("send_request_headers.started"):
+                self.counters["requests"] += 1
+                if name.startswith("http2."):
+                    self.counters["http2_requests"] += 1
+            elif name == "connection.connect_tcp.started":
+                state["connect_started"] = now
+            elif name == "connection.connect_tcp.complete":
+                self.counters["new_connections"] += 1
+            elif name == "connection.start_tls.complete" and "connect_started" in state:
+                self.handshake_ms += (now - state.pop("connect_started")) * 1000
+
+    def trace(self):
+        """A trace callback for one request."""
+        state = {}
+
+        def callback(name, info):
+            self._event(name, state)
+        return callback
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            handshake_ms = self.handshake_ms
+        requests = counters["requests"]
+        counters["reuse_rate"] = round(1 - min(counters["new_connections"], requests) / requests, 3) if requests else None
+        counters["avg_handshake_ms"] = round(handshake_ms / counters["new_connections"], 1) if counters["new_connections"] else None
+        return counters
+
+
+class ClientRegistry:
+    """
+    The process-wide OpenAI client and its tuned connection pool.
+
+    Every part of the backend uses it instead of constructing its own client, so
+    a turn's calls ride on connections that are already open (keep-alive, HTTP/2
+    multiplexing when h2 is installed) instead of paying a TLS handshake each.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.stats = ConnectionStats()
+        self._lock = threading.Lock()
+        self._sync = None
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_seconds,
+        )
+
+    @property
+    def http2(self) -> bool:
+        return settings.openai_http2 and HTTP2_AVAILABLE
+
+    def sync(self) -> OpenAI:
+        with self._lock:
+            if self._sync is None:
+                def trace_request(request):
+                    request.extensions["trace"] = self.stats.trace()
+                http_client = DefaultHttpxClient(limits=self._limits(), http2=self.http2,
+                                                 event_hooks={"request": [trace_request]})
+                self._sync = OpenAI(api_key=self.api_key or settings.openai_api_key, base_url=self.base_url,
+                                    http_client=http_client)
+            return self._sync
+
+    def warm_up(self, connections: int = None) -> int:
+        """
+        Open pooled connections ahead of the first turn.
+
+        Sends concurrent lightweight GET /models requests so that many connections
+        complete their handshake and stay in the keep-alive pool.
+
+        Returns:
+            Number of warm-up requests that succeeded
+        """
+        connections = settings.openai_warm_connections if connections is None else connections
+        if connections <= 0:
+            return 0
+        client = self.sync().with_options(timeout=settings.openai_warm_up_timeout_seconds, max_retries=0)
+
+        def ping(_):
+            try:
+                client.models.with_raw_response.list()
+                return True
+            except Exception as e:
+                print(f"Warm-up request failed: {str(e)}")
+                return False
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            succeeded = sum(executor.map(ping, range(connections)))
+        print(f"Warmed up {succeeded}/{connections} upstream connections in {time.perf_counter() - started:.2f}s "
+              f"(HTTP/2: {self.http2})")
+        return succeeded
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sync is not None:
+                self._sync.close()
+                self._sync = None
+
+
+openai_clients = ClientRegistry()
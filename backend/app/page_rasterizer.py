@@ -0,0 +1,348 @@
+import hashlib
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import fitz  # PyMuPDF
+
+from .config import settings
+from .image_optimizer import estimate_vision_tokens
+
+RENDER_CACHE_DIR = Path(__file__).resolve().parent.parent / "render_cache"
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_in_pool_worker = False
+
+
+@dataclass
+class PageImage:
+    """
+    An image prepared for the concept extraction prompt.
+
+    The PNG is held in memory, or as a file (a render in the cache, an embedded image
+    spilled to scratch space) that is only read when png is accessed. Selected
+    embedded images have no payload until they are extracted.
+    """
+    page_number: int  # 0-based
+    payload: Union[bytes, Path, None]
+    width: int
+    height: int
+    source: str  # "render" (whole page) or "embedded"
+    priority: float = 0.0
+    xref: int = 0  # embedded images: the image object in the PDF
+
+    @property
+    def tokens(self) -> int:
+        return estimate_vision_tokens(self.width, self.height, "high")
+
+    @property
+    def size(self) -> int:
+        """Size of the PNG in bytes, without reading a spilled file."""
+        if self.payload is None:
+            return 0
+        return len(self.payload) if isinstance(self.payload, bytes) else Path(self.payload).stat().st_size
+
+    @property
+    def png(self) -> bytes:
+        if self.payload is None:
+            raise ValueError(f"Image on page {self.page_number} has not been extracted")
+        return self.payload if isinstance(self.payload, bytes) else Path(self.payload).read_bytes()
+
+
+def _drawing_key(drawing: dict) -> tuple:
+    return tuple(round(value) for value in drawing["rect"]), drawing["type"]
+
+
+def page_outline(page: fitz.Page) -> List[dict]:
+    """The page's drawings reduced to what diagram detection needs (rect and type, without the path items)."""
+    return [{"rect": drawing["rect"], "type": drawing["type"]} for drawing in page.get_drawings()]
+
+
+def template_drawings(drawings_per_page: List[List[dict]]) -> set:
+    """
+    Drawings that repeat on many pages (header bars, footers, logos drawn as paths).
+
+    They belong to the slide template, not to a diagram, and are ignored when
+    deciding whether a page is worth rendering.
+    """
+    counts = Counter(key for drawings in drawings_per_page for key in {_drawing_key(d) for d in drawings})
+    min_pages = max(3, settings.raster_template_page_fraction * len(drawings_per_page))
+    return {key for key, count in counts.items() if count >= min_pages}
+
+
+def diagram_drawings(page: fitz.Page, drawings: List[dict], template: set) -> List[dict]:
+    """The page's vector drawings without template decoration and full-page backgrounds."""
+    page_area = abs(page.rect)
+    return [d for d in drawings if _drawing_key(d) not in template and abs(d["rect"]) < 0.9 * page_area]
+
+
+def drawing_coverage(page: fitz.Page, drawings: List[dict]) -> float:
+    """Fraction of the page covered by the bounding box of the drawings."""
+    if not drawings:
+        return 0.0
+    bounds = fitz.Rect()
+    for drawing in drawings:
+        bounds |= drawing["rect"]
+    return abs(bounds & page.rect) / abs(page.rect)
+
+
+def adaptive_dpi(page: fitz.Page, path_count: int) -> int:
+    """
+    DPI that renders the page at the target long side, more for dense diagrams.
+
+    Simple diagrams stay readable at settings.raster_target_long_side; pages with many
+    paths (plots, detailed architectures) get 1.5x. The result is clamped to the
+    configured DPI range.
+    """
+    target = settings.raster_target_long_side * (1.5 if path_count >= settings.raster_dense_path_count else 1.0)
+    long_side_inches = max(page.rect.width, page.rect.height) / 72
+    return int(max(settings.raster_min_dpi, min(settings.raster_max_dpi, target / long_side_inches)))
+
+
+def page_content_hash(page: fitz.Page, dpi: int) -> str:
+    """Cache key for a render: the page's content stream, geometry, resources and the DPI."""
+    digest = hashlib.sha256()
+    digest.update(page.read_contents())
+    digest.update(repr((tuple(page.rect), page.rotation, dpi)).encode("utf-8"))
+    digest.update(repr(page.get_fonts(full=True)).encode("utf-8"))
+    digest.update(repr(page.get_images(full=True)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def render_page(file_path: str, page_number: int, dpi: int) -> bytes:
+    """Render one page to PNG. Runs in a worker process, so it opens the document itself."""
+    with fitz.open(file_path) as doc:
+        return doc[page_number].get_pixmap(dpi=dpi).tobytes("png")
+
+
+def render_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    The process-wide pool for page renders, or None if pages are rendered in-process.
+
+    Created once and kept for the life of the process. Workers are spawned, not
+    forked: forking a server with live threads can deadlock the child.
+    """
+    global _render_pool
+    if _in_pool_worker or settings.raster_workers <= 1:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=settings.raster_workers, mp_context=get_context("spawn"))
+        return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
+
+
+def init_pool_worker() -> None:
+    """
+    Initializer for processes of another pool (e.g. bulk ingestion's extraction
+    workers): they render in-process, so extract x render workers do not
+    oversubscribe the CPU.
+    """
+    global _in_pool_worker
+    _in_pool_worker = True
+
+
+def render_size(page: fitz.Page, dpi: int) -> tuple:
+    """Width and height in pixels of the page rendered at dpi (as get_pixmap will produce it)."""
+    zoom = dpi / 72
+    rect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+    return rect.width, rect.height
+
+
+def embedded_candidates(page: fitz.Page) -> List[PageImage]:
+    """The page's embedded raster images, described by their dimensions only (nothing is decoded)."""
+    return [PageImage(page.number, None, img[2], img[3], "embedded", xref=img[0]) for img in page.get_images(full=True)]
+
+
+def extract_embedded(doc: fitz.Document, image: PageImage, spill_dir: Path = None) -> bool:
+    """
+    Convert an embedded image to PNG (same conversion as before this stage existed).
+
+    With spill_dir the PNG is written there and only its path is kept, so the decoded
+    pixels are released as soon as the image is converted.
+
+    Returns:
+        False if the image could not be converted
+    """
+    try:
+        pix = fitz.Pixmap(doc, image.xref)
+        if pix.n != 3 or pix.alpha:
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        image.width, image.height = pix.width, pix.height
+        if spill_dir is None:
+            image.payload = pix.tobytes("png")
+        else:
+            image.payload = Path(spill_dir) / f"page{image.page_number:05d}_xref{image.xref}.png"
+            pix.save(str(image.payload))
+        return True
+    except Exception as e:
+        print(f"Warning: Could not process image {image.xref} on page {image.page_number}: {str(e)}")
+        return False
+
+
+class PageRasterizer:
+    """
+    Turns a deck into the images for the concept extraction prompt.
+
+    Pages with significant vector drawings (diagrams drawn as paths, which
+    page.get_images never sees) are rendered whole at an adaptive DPI; all other
+    pages contribute their embedded images as before. The selection is fitted into
+    settings.slide_image_token_budget, diagrams first, from image dimensions alone:
+    only selected pages are rendered and only selected embedded images are decoded.
+    Renders are cached on disk by page content hash, cache misses are rendered in the
+    shared render_pool, and renders are referenced by their cache file rather than
+    held in memory.
+    """
+
+    def __init__(self, cache_dir: Path = RENDER_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.last_stats = {}
+
+    def _cache_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.png"
+
+    def _store(self, key: str, png: bytes) -> Path:
+        cache_path = self._cache_path(key)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+        temp_path.write_bytes(png)
+        os.replace(temp_path, cache_path)
+        return cache_path
+
+    def _render_all(self, file_path: str, jobs: Dict[int, tuple]) -> Dict[int, Path]:
+        """Render (page_number -> (dpi, cache key)) jobs, using the cache and a process pool for misses."""
+        renders = {}
+        misses = []
+        for page_number, (dpi, key) in jobs.items():
+            cache_path = self._cache_path(key)
+            if cache_path.exists():
+                renders[page_number] = cache_path
+            else:
+                misses.append((page_number, dpi))
+
+        pool = render_pool() if len(misses) > 1 else None
+        if pool is not None:
+            futures = {pool.submit(render_page, file_path, page_number, dpi): page_number
+                       for page_number, dpi in misses}
+            # Each render goes to the cache as soon as it arrives instead of piling up
+            for future in as_completed(futures):
+                page_number = futures[future]
+                renders[page_number] = self._store(jobs[page_number][1], future.result())
+        else:
+            for page_number, dpi in misses:
+                renders[page_number] = self._store(jobs[page_number][1], render_page(file_path, page_number, dpi))
+
+        self.last_stats.update(cache_hits=len(jobs) - len(misses), rendered=len(misses))
+        return renders
+
+    def select(self, file_path: str, on_page: Callable[[int], None] = None) -> List[PageImage]:
+        """
+        Choose the images for a deck within the image budget and render the chosen pages.
+
+        Renders come back with their cache file as payload; embedded images come back
+        without a payload (see extract_embedded).
+
+        Args:
+            file_path: Path to the PDF
+            on_page: Called with the page number after each page is inspected
+
+        Returns:
+            Selected images in page order
+        """
+        file_path = str(file_path)
+        with fitz.open(file_path) as doc:
+            outlines = []
+            for page in doc:
+                outlines.append(page_outline(page))
+                if on_page:
+                    on_page(page.number)
+            template = template_drawings(outlines)
+
+            jobs = {}
+            candidates = []
+            for page, drawings in zip(doc, outlines):
+                diagram = diagram_drawings(page, drawings, template)
+                coverage = drawing_coverage(page, diagram)
+                if len(diagram) >= settings.raster_min_paths and coverage >= settings.raster_min_coverage:
+                    dpi = adaptive_dpi(page, len(diagram))
+                    jobs[page.number] = (dpi, page_content_hash(page, dpi))
+                    # Rendered pages include their embedded images, so those are not sent twice
+                    width, height = render_size(page, dpi)
+                    candidates.append(PageImage(page.number, None, width, height, "render", len(diagram) * coverage))
+                else:
+                    candidates.extend(embedded_candidates(page))
+                if on_page:
+                    on_page(page.number)
+
+        selected = self.fit_budget(candidates)
+        renders = self._render_all(file_path, {image.page_number: jobs[image.page_number]
+                                               for image in selected if image.source == "render"})
+        for image in selected:
+            if image.source == "render":
+                image.payload = renders[image.page_number]
+
+        self.last_stats.update(
+            pages=len(outlines),
+            diagram_pages=len(jobs),
+            candidates=len(candidates),
+            selected=len(selected),
+            tokens=sum(image.tokens for image in selected),
+        )
+        print(f"Page images for {Path(file_path).name}: {self.last_stats}")
+        return selected
+
+    def collect(self, file_path: str, spill_dir: Path = None) -> List[PageImage]:
+        """
+        Images for a deck within the image budget, all with their PNG available.
+
+        Args:
+            file_path: Path to the PDF
+            spill_dir: Where embedded images are written; None keeps them in memory
+
+        Returns:
+            Selected images in page order
+        """
+        selected = self.select(file_path)
+        with fitz.open(str(file_path)) as doc:
+            return [image for image in selected if image.source == "render" or extract_embedded(doc, image, spill_dir)]
+
+    @staticmethod
+    def fit_budget(images: List[PageImage], token_budget: int = None, max_images: int = None) -> List[PageImage]:
+        """
+        Greedily keep the most valuable images that fit the budget.
+
+        Renders go first, highest priority (paths x coverage) first; embedded images
+        fill what is left in page order. An image that does not fit is skipped in
+        favour of smaller ones.
+        """
+        token_budget = token_budget or settings.slide_image_token_budget
+        max_images = max_images or settings.slide_image_max_count
+        ranked = sorted((image for image in images if image.source == "render"), key=lambda image: -image.priority)
+        ranked += [image for image in images if image.source != "render"]
+
+        selected = []
+        used_tokens = 0
+        for image in ranked:
+            if len(selected) == max_images:
+                break
+            if used_tokens + image.tokens > token_budget:
+                continue
+            selected.append(image)
+            used_tokens += image.tokens
+        return sorted(selected, key=lambda image: image.page_number)
+
+
+page_rasterizer = PageRasterizer()
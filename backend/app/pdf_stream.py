@@ -0,0 +1,113 @@
+import gc
+import os
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List
+
+import fitz  # PyMuPDF
+
+from .config import settings
+from .page_rasterizer import PageImage, PageRasterizer, extract_embedded, page_rasterizer
+
+
+class MemoryLimitError(Exception):
+    """Raised when extraction cannot stay below settings.pdf_extraction_max_rss_mb."""
+
+
+@dataclass
+class PageRecord:
+    """One page of a deck: its text and the images selected from it (PNGs on disk, read lazily)."""
+    page_number: int  # 0-based
+    text: str
+    images: List[PageImage] = field(default_factory=list)
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, or 0 where it cannot be read (which disables the guard)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak rather than current RSS, so an upper bound; macOS reports bytes, Linux kilobytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryGuard:
+    """
+    Keeps a worker's RSS below a limit while it walks a deck.
+
+    Called after every page. MuPDF keeps decoded images and fonts in its store in case
+    a later page reuses them, up to 256 MB by default; once the process has grown by
+    settings.pdf_mupdf_cache_mb since the guard was created, the store is emptied
+    (emptying it on every page would re-load the fonts for every page). Above the
+    limit, Python garbage is collected as well; if that does not bring the process
+    back under the limit, extraction stops with MemoryLimitError instead of the
+    worker being killed by the OS.
+    """
+
+    def __init__(self, limit_bytes: int = None):
+        self.limit_bytes = limit_bytes if limit_bytes is not None else settings.pdf_extraction_max_rss_mb * 1024 * 1024
+        self.start_bytes = current_rss_bytes()
+        self.peak_bytes = self.start_bytes
+        self.store_flushes = 0
+        self.collections = 0
+
+    def check(self, page_number: int = None) -> None:
+        rss = current_rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, rss)
+        if rss - self.start_bytes > settings.pdf_mupdf_cache_mb * 1024 * 1024:
+            fitz.TOOLS.store_shrink(100)
+            self.store_flushes += 1
+            rss = current_rss_bytes()
+        if not self.limit_bytes or rss <= self.limit_bytes:
+            return
+        gc.collect()
+        self.collections += 1
+        rss = current_rss_bytes()
+        if rss > self.limit_bytes:
+            where = f" at page {page_number}" if page_number is not None else ""
+            raise MemoryLimitError(f"PDF extraction uses {rss // 2**20} MB{where}, "
+                                   f"above the limit of {self.limit_bytes // 2**20} MB")
+
+
+def iter_pdf_pages(file_path, spill_dir, rasterizer: PageRasterizer = None, guard: MemoryGuard = None) -> Iterator[PageRecord]:
+    """
+    Walk a deck page by page, yielding its text and selected images.
+
+    The image selection is made up front from page outlines and image dimensions (see
+    PageRasterizer.select). Embedded images are then decoded one page at a time and
+    spilled to spill_dir as PNG files; renders point at the render cache. Nothing but
+    the current page is held in memory (see MemoryGuard for MuPDF's own cache), so
+    memory use does not grow with the deck.
+
+    Args:
+        file_path: Path to the PDF
+        spill_dir: Scratch directory for embedded images; the caller owns (and removes) it
+        rasterizer: Image selection and rendering (default: the shared page_rasterizer)
+        guard: RSS limit checked after every page (default: settings.pdf_extraction_max_rss_mb)
+
+    Yields:
+        PageRecord for every page, in page order
+    """
+    rasterizer = rasterizer or page_rasterizer
+    guard = guard or MemoryGuard()
+    Path(spill_dir).mkdir(parents=True, exist_ok=True)
+
+    images_by_page = defaultdict(list)
+    for image in rasterizer.select(file_path, on_page=guard.check):
+        images_by_page[image.page_number].append(image)
+
+    with fitz.open(str(file_path)) as doc:
+        for page in doc:
+            images = [image for image in images_by_page.pop(page.number, [])
+                      if image.source == "render" or extract_embedded(doc, image, spill_dir)]
+            yield PageRecord(page.number, page.get_text(), images)
+            guard.check(page.number)
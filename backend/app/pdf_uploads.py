@@ -0,0 +1,350 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import fitz  # PyMuPDF
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; the per-process session lock is all there is
+    fcntl = None
+
+UPLOAD_DIR = Path(__file__).resolve().parent.parent / "uploads"
+PARTIAL_DIR = UPLOAD_DIR / ".partial"
+PDF_MAGIC = b"%PDF-"
+
+
+class UploadRejectedError(Exception):
+    """An upload violated a limit or is not a PDF. status_code is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    course_id: str
+    sha256: str
+    size: int
+    pages: int
+
+
+def safe_pdf_name(filename: str) -> str:
+    """
+    A file name that is safe to create in uploads/, derived from the client's name.
+
+    Directory parts and unusual characters are dropped; the stem is kept because it
+    becomes the course ID.
+
+    Raises:
+        UploadRejectedError: 400 if no usable name is left or it is not a .pdf
+    """
+    name = Path((filename or "").replace("\\", "/")).name
+    stem, extension = os.path.splitext(name)
+    stem = re.sub(r"[^\w .()-]", "_", stem).strip(" .")[:120]
+    if not stem or extension.lower() != ".pdf":
+        raise UploadRejectedError(400, "Only .pdf files can be uploaded")
+    return f"{stem}.pdf"
+
+
+def file_sha256(path, chunk_size: int = None) -> str:
+    """SHA-256 of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size or settings.upload_chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_declared_size(content_length: Optional[str]) -> None:
+    """Reject a request up front if its Content-Length already exceeds the upload limit."""
+    try:
+        declared = int(content_length) if content_length else None
+    except ValueError:
+        return
+    if declared is not None and declared > settings.upload_max_bytes:
+        raise UploadRejectedError(413, f"Upload exceeds the limit of {settings.upload_max_bytes} bytes")
+
+
+def count_pages(path: Path) -> int:
+    """
+    Page count of a PDF, enforcing settings.upload_max_pages.
+
+    Opening a document only parses its cross-reference table, so this is cheap even
+    for large decks and happens before any page is extracted.
+
+    Raises:
+        UploadRejectedError: 400 if the file is not a readable PDF, 413 if it has too many pages
+    """
+    try:
+        with fitz.open(path) as doc:
+            pages = doc.page_count
+    except Exception as e:
+        raise UploadRejectedError(400, f"Not a readable PDF: {e}")
+    if pages > settings.upload_max_pages:
+        raise UploadRejectedError(413, f"PDF has {pages} pages, the limit is {settings.upload_max_pages}")
+    return pages
+
+
+def _finalize(temp_path: Path, filename: str, sha256: str, size: int) -> StoredUpload:
+    """Check the page limit and move a fully received upload into place."""
+    try:
+        pages = count_pages(temp_path)
+    except UploadRejectedError:
+        temp_path.unlink(missing_ok=True)
+        raise
+    final_path = UPLOAD_DIR / filename
+    os.replace(temp_path, final_path)
+    print(f"Stored upload {final_path.name}: {size} bytes, {pages} pages, sha256 {sha256[:12]}")
+    return StoredUpload(final_path, final_path.stem, sha256, size, pages)
+
+
+async def store_upload(chunks: AsyncIterator[bytes], filename: str) -> StoredUpload:
+    """
+    Stream an upload to disk in one pass.
+
+    Bytes are hashed as they are written, the PDF signature is checked on the first
+    bytes and the size limit on every chunk, so an oversized or non-PDF upload is
+    aborted without buffering it. Memory use does not depend on the file size.
+
+    Args:
+        chunks: Async iterator of byte chunks (e.g. read from an UploadFile)
+        filename: Client-supplied file name
+
+    Returns:
+        StoredUpload with the final path, course ID, hash, size and page count
+
+    Raises:
+        UploadRejectedError: If a limit is exceeded or the file is not a PDF
+    """
+    filename = safe_pdf_name(filename)
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    temp_path = UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            async for chunk in chunks:
+                if size == 0 and not chunk.startswith(PDF_MAGIC[:len(chunk)]):
+                    raise UploadRejectedError(400, "File is not a PDF")
+                size += len(chunk)
+                if size > settings.upload_max_bytes:
+                    raise UploadRejectedError(413, f"Upload exceeds the limit of {settings.upload_max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    if size == 0:
+        temp_path.unlink(missing_ok=True)
+        raise UploadRejectedError(400, "Empty upload")
+    return _finalize(temp_path, filename, digest.hexdigest(), size)
+
+
+async def iter_upload_file(upload_file, chunk_size: int = None) -> AsyncIterator[bytes]:
+    """Read a FastAPI UploadFile in fixed-size chunks."""
+    while True:
+        chunk = await upload_file.read(chunk_size or settings.upload_chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class ResumableUploads:
+    """
+    Resumable chunked uploads for decks too large to send in one request.
+
+    A session is created with the file name and total size, then chunks are appended
+    at the current offset; a client that lost its connection asks for the offset and
+    continues from there. State lives next to the partial file in uploads/.partial, so
+    sessions survive a restart. The running hash is kept in memory together with the
+    offset it covers, and recomputed from the partial file when that is not the
+    session's offset (the process restarted, or another worker appended a chunk).
+    An exclusive lock on the partial file keeps workers from appending at once.
+    """
+
+    def __init__(self, partial_dir: Path = PARTIAL_DIR):
+        self.partial_dir = Path(partial_dir)
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.json"
+
+    def _data_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.part"
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _write_meta(self, meta: dict) -> None:
+        meta_path = self._meta_path(meta["upload_id"])
+        temp_path = meta_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+    def create(self, filename: str, total_size: int) -> dict:
+        """
+        Start a resumable upload.
+
+        Raises:
+            UploadRejectedError: If the name is not a PDF or the declared size exceeds the limit
+        """
+        filename = safe_pdf_name(filename)
+        if total_size <= 0:
+            raise UploadRejectedError(400, "total_size must be positive")
+        if total_size > settings.upload_max_bytes:
+            raise UploadRejectedError(413, f"Upload exceeds the limit of {settings.upload_max_bytes} bytes")
+        self.sweep()
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta = {"upload_id": upload_id, "filename": filename, "total_size": total_size,
+                "offset": 0, "created_at": time.time()}
+        self._data_path(upload_id).touch()
+        self._write_meta(meta)
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """
+        Current state of an upload, including the offset to resume from.
+
+        Raises:
+            UploadRejectedError: 404 if the session does not exist (or expired)
+        """
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            raise UploadRejectedError(404, "Upload session not found")
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadRejectedError(404, "Upload session not found")
+        return dict(meta, chunk_size=settings.upload_chunk_size)
+
+    def _hasher(self, upload_id: str, offset: int):
+        """The running hash of the first offset bytes of the upload."""
+        hasher, covered = self._hashers.get(upload_id, (None, None))
+        if covered != offset:
+            # Restarted, or another worker appended since: rebuild the running hash from disk
+            hasher = hashlib.sha256()
+            with open(self._data_path(upload_id), "rb") as f:
+                remaining = offset
+                while remaining > 0:
+                    chunk = f.read(min(settings.upload_chunk_size, remaining))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+            self._hashers[upload_id] = (hasher, offset)
+        return hasher
+
+    @staticmethod
+    def _lock_partial_file(f) -> None:
+        """Hold an exclusive lock on an open partial file until it is closed (other workers get a 409)."""
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadRejectedError(409, "Another chunk of this upload is in progress")
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+        """
+        Append a chunk that starts at the given offset.
+
+        Raises:
+            UploadRejectedError: 404 for an unknown session, 409 if offset is not the
+                current end of the upload (the response tells the client where to resume),
+                413 if the chunk runs past the declared total size
+        """
+        lock = self._session_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadRejectedError(409, "Another chunk of this upload is in progress")
+        try:
+            self.status(upload_id)  # 404 before touching the file
+            with open(self._data_path(upload_id), "r+b") as f:
+                self._lock_partial_file(f)
+                # Read the offset under the lock: another worker may have just appended
+                meta = self.status(upload_id)
+                if offset != meta["offset"]:
+                    raise UploadRejectedError(409, f"Expected offset {meta['offset']}")
+                hasher = self._hasher(upload_id, meta["offset"])
+                received = meta["offset"]
+                f.seek(received)
+                try:
+                    async for chunk in chunks:
+                        if received == 0 and not chunk.startswith(PDF_MAGIC[:len(chunk)]):
+                            raise UploadRejectedError(400, "File is not a PDF")
+                        if received + len(chunk) > meta["total_size"]:
+                            raise UploadRejectedError(413, "Chunk runs past the declared total size")
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        received += len(chunk)
+                finally:
+                    # Keep what was written, so an interrupted chunk can be resumed where it stopped
+                    f.truncate(received)
+                    self._hashers[upload_id] = (hasher, received)
+                    meta.pop("chunk_size", None)
+                    meta["offset"] = received
+                    self._write_meta(meta)
+            return self.status(upload_id)
+        finally:
+            lock.release()
+
+    def complete(self, upload_id: str, expected_sha256: str = None) -> StoredUpload:
+        """
+        Finish an upload: check size, hash and page count and move the file into uploads/.
+
+        Raises:
+            UploadRejectedError: 409 if bytes are missing, 400 on a hash mismatch or
+                non-PDF, 413 if the page limit is exceeded
+        """
+        meta = self.status(upload_id)
+        if meta["offset"] != meta["total_size"]:
+            raise UploadRejectedError(409, f"Upload incomplete: {meta['offset']} of {meta['total_size']} bytes")
+        sha256 = self._hasher(upload_id, meta["offset"]).hexdigest()
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            self.discard(upload_id)
+            raise UploadRejectedError(400, "Content hash mismatch")
+        data_path = self._data_path(upload_id)
+        temp_path = UPLOAD_DIR / f".{upload_id}.part"
+        os.replace(data_path, temp_path)
+        self.discard(upload_id)
+        return _finalize(temp_path, meta["filename"], sha256, meta["total_size"])
+
+    def discard(self, upload_id: str) -> None:
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        self._data_path(upload_id).unlink(missing_ok=True)
+
+    def sweep(self) -> int:
+        """Delete sessions older than settings.upload_session_ttl_seconds. Returns how many were removed."""
+        if not self.partial_dir.exists():
+            return 0
+        cutoff = time.time() - settings.upload_session_ttl_seconds
+        removed = 0
+        for meta_path in self.partial_dir.glob("*.json"):
+            if meta_path.stat().st_mtime < cutoff:
+                self.discard(meta_path.stem)
+                removed += 1
+        return removed
+
+
+resumable_uploads = ResumableUploads()
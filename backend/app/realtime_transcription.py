@@ -0,0 +1,114 @@
+import asyncio
+import base64
+from typing import Dict, List, Optional
+
+from .core import TRANSCRIPTION_MODEL
+
+# The realtime API expects 16-bit little-endian mono PCM at 24 kHz
+REALTIME_SAMPLE_RATE = 24000
+
+
+def transcription_session_update(prompt: str = "") -> dict:
+    """
+    First client event on a realtime transcription connection.
+
+    Server VAD splits the stream at pauses; every pause commits the buffered audio
+    as one segment, which is then transcribed while the learner keeps talking.
+    """
+    return {
+        "type": "transcription_session.update",
+        "session": {
+            "input_audio_format": "pcm16",
+            "input_audio_transcription": {"model": TRANSCRIPTION_MODEL, "prompt": prompt, "language": "en"},
+            "turn_detection": {"type": "server_vad", "threshold": 0.5, "prefix_padding_ms": 300, "silence_duration_ms": 500},
+            "input_audio_noise_reduction": {"type": "near_field"},
+        },
+    }
+
+
+def audio_append_event(pcm: bytes) -> dict:
+    return {"type": "input_audio_buffer.append", "audio": base64.b64encode(pcm).decode("ascii")}
+
+
+class TranscriptBuffer:
+    """
+    The live transcript of a voice session, assembled from realtime server events.
+
+    Segments are kept in commit order, so the transcript reads correctly even when
+    their transcriptions complete out of order.
+    """
+
+    def __init__(self):
+        self._order: List[str] = []
+        self._completed: Dict[str, str] = {}
+        self._partial: Dict[str, str] = {}
+        self._awaiting_commit = False
+        self._settled = asyncio.Event()
+        self._settled.set()
+
+    def apply(self, event: dict) -> Optional[str]:
+        """
+        Update the transcript with one server event.
+
+        Returns:
+            "segment" when a segment's transcription completed (the learner paused),
+            "delta" for partial text, "error" for error events, otherwise None
+        """
+        event_type = event.get("type", "")
+        item_id = event.get("item_id")
+        if event_type == "input_audio_buffer.committed":
+            self._awaiting_commit = False
+            if item_id not in self._order:
+                self._order.append(item_id)
+            self._update_settled()
+            return None
+        if event_type == "conversation.item.input_audio_transcription.delta":
+            self._partial[item_id] = self._partial.get(item_id, "") + event.get("delta", "")
+            return "delta"
+        if event_type in ("conversation.item.input_audio_transcription.completed",
+                          "conversation.item.input_audio_transcription.failed"):
+            if item_id not in self._order:
+                self._order.append(item_id)
+            self._completed[item_id] = (event.get("transcript") or "").strip()
+            self._partial.pop(item_id, None)
+            self._update_settled()
+            return "segment" if event_type.endswith("completed") else "error"
+        if event_type == "error":
+            # e.g. committing an empty buffer at the end of the stream
+            self._awaiting_commit = False
+            self._update_settled()
+            return "error"
+        return None
+
+    def expect_commit(self) -> None:
+        """Call after sending input_audio_buffer.commit: the transcript is unsettled until it is acknowledged."""
+        self._awaiting_commit = True
+        self._settled.clear()
+
+    @property
+    def pending(self) -> List[str]:
+        return [item_id for item_id in self._order if item_id not in self._completed]
+
+    def _update_settled(self) -> None:
+        if self._awaiting_commit or self.pending:
+            self._settled.clear()
+        else:
+            self._settled.set()
+
+    async def wait_settled(self, timeout: float) -> bool:
+        """Wait until every committed segment is transcribed; False on timeout."""
+        try:
+            await asyncio.wait_for(self._settled.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def text(self, include_partial: bool = False) -> str:
+        """The transcript so far; with include_partial, unfinished segments contribute their partial text."""
+        parts = []
+        for item_id in self._order:
+            if item_id in self._completed:
+                parts.append(self._completed[item_id])
+            elif include_partial:
+                parts.append(self._partial.get(item_id, "").strip())
+        return " ".join(part for part in parts if part)
@@ -0,0 +1,247 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from .config import settings
+from .usage_ledger import current_attribution
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "evaluation": 1, "background": 2}
+
+
+class QueueTimeoutError(Exception):
+    """Raised when an upstream request waited longer than allowed for a slot."""
+
+
+@dataclass
+class ModelLimit:
+    """Concurrency and request-rate limit for one model; rpm=None means no rate limit."""
+    concurrency: int
+    rpm: Optional[float] = None
+    burst: Optional[int] = None  # requests that may start back to back (default: concurrency)
+
+
+@dataclass
+class Waiter:
+    model: str
+    priority: int
+    learner: str
+    enqueued_at: float
+    sequence: int
+    priority_name: str = "interactive"
+    capped: bool = True  # subject to scheduler_per_learner_concurrency
+    granted: bool = False
+
+
+@dataclass
+class ModelState:
+    limit: ModelLimit
+    tokens: float
+    refilled_at: float
+    running: int = 0
+    running_by_learner: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # priority -> learner -> waiters, learners in round-robin order
+    queues: Dict[int, "OrderedDict[str, deque]"] = field(default_factory=lambda: defaultdict(OrderedDict))
+
+
+def request_class(attribution: Dict[str, str] = None) -> tuple:
+    """
+    Priority class and learner of the current request, from its usage attribution.
+
+    The endpoint decides the class (settings.scheduler_endpoint_priorities), the
+    learning session (one per learner) identifies the learner. Requests without a
+    session share one round-robin bucket per endpoint; it stands for many learners,
+    so the per-learner cap does not apply to it.
+
+    Returns:
+        tuple: (priority, learner, whether the per-learner cap applies)
+    """
+    attribution = current_attribution() if attribution is None else attribution
+    endpoint = attribution.get("endpoint", "")
+    priority = settings.scheduler_endpoint_priorities.get(endpoint, settings.scheduler_default_priority)
+    session_id = attribution.get("session_id")
+    if session_id:
+        return priority, session_id, True
+    return priority, f"endpoint:{endpoint or 'none'}", False
+
+
+class FairScheduler:
+    """
+    Admission control in front of the upstream models.
+
+    Each model has a concurrency limit and an optional requests-per-minute token
+    bucket. Waiting requests are served by priority class (interactive turns before
+    evaluation before background ingestion), with aging so background work is never
+    starved for good, and round-robin across learners within a class. A learner can
+    hold at most scheduler_per_learner_concurrency slots of a model, so one learning
+    session cannot take the whole pool.
+    """
+
+    def __init__(self, limits: Dict[str, ModelLimit] = None, default_limit: ModelLimit = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits = limits if limits is not None else {
+            model: ModelLimit(**limit) for model, limit in settings.scheduler_model_limits.items()}
+        self.default_limit = default_limit or ModelLimit(concurrency=settings.scheduler_default_concurrency)
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._models: Dict[str, ModelState] = {}
+        self._sequence = itertools.count()
+        self._waits = defaultdict(lambda: {"requests": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0, "timeouts": 0})
+
+    def _state(self, model: str) -> ModelState:
+        state = self._models.get(model)
+        if state is None:
+            limit = self.limits.get(model, self.default_limit)
+            state = ModelState(limit, tokens=float(limit.burst or limit.concurrency), refilled_at=self.clock())
+            self._models[model] = state
+        return state
+
+    def _refill(self, state: ModelState, now: float) -> None:
+        if state.limit.rpm is None:
+            return
+        capacity = float(state.limit.burst or state.limit.concurrency)
+        state.tokens = min(capacity, state.tokens + (now - state.refilled_at) * state.limit.rpm / 60.0)
+        state.refilled_at = now
+
+    def _effective_priority(self, waiter: Waiter, now: float) -> int:
+        aging = settings.scheduler_aging_seconds
+        promoted = int((now - waiter.enqueued_at) // aging) if aging else 0
+        return max(0, waiter.priority - promoted)
+
+    def _next_waiter(self, state: ModelState, now: float) -> Optional[Waiter]:
+        """The head waiter of the best class, round-robin over learners below their cap."""
+        best = None
+        for _, queues in sorted(state.queues.items()):
+            # Within a class the first eligible learner in rotation order is the candidate
+            head = next((waiters[0] for learner, waiters in queues.items()
+                         if waiters and (not waiters[0].capped
+                                         or state.running_by_learner.get(learner, 0) < settings.scheduler_per_learner_concurrency)), None)
+            if head is not None and (best is None or self._effective_priority(head, now) < self._effective_priority(best, now)):
+                best = head
+        return best
+
+    def _dispatch(self, state: ModelState) -> bool:
+        """Grant slots while the model has capacity; returns whether anything was granted."""
+        granted = False
+        now = self.clock()
+        self._refill(state, now)
+        while state.running < state.limit.concurrency and (state.limit.rpm is None or state.tokens >= 1):
+            waiter = self._next_waiter(state, now)
+            if waiter is None:
+                break
+            queues = state.queues[waiter.priority]
+            queues[waiter.learner].popleft()
+            # Rotate: the served learner goes to the back of its class
+            remaining = queues.pop(waiter.learner)
+            if remaining:
+                queues[waiter.learner] = remaining
+            state.running += 1
+            state.running_by_learner[waiter.learner] += 1
+            if state.limit.rpm is not None:
+                state.tokens -= 1
+            waiter.granted = True
+            granted = True
+            self._observe(waiter, now)
+        return granted
+
+    def _observe(self, waiter: Waiter, now: float) -> None:
+        key = (waiter.model, waiter.priority_name)
+        wait_ms = (now - waiter.enqueued_at) * 1000
+        stats = self._waits[key]
+        stats["requests"] += 1
+        stats["total_wait_ms"] += wait_ms
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+
+    def _refill_delay(self, state: ModelState) -> Optional[float]:
+        if state.limit.rpm is None or state.tokens >= 1:
+            return None
+        return (1 - state.tokens) * 60.0 / state.limit.rpm
+
+    def acquire(self, model: str, priority: str = "interactive", learner: str = "anonymous", timeout: float = None,
+                capped: bool = True) -> Waiter:
+        """
+        Wait for a slot of a model.
+
+        Blocks the calling thread, so call it from worker threads, never on the event loop.
+
+        Raises:
+            QueueTimeoutError: if no slot was granted within timeout seconds
+        """
+        timeout = settings.scheduler_max_wait_seconds if timeout is None else timeout
+        with self._cond:
+            state = self._state(model)
+            waiter = Waiter(model, PRIORITIES[priority], learner, self.clock(), next(self._sequence), priority, capped)
+            state.queues[waiter.priority].setdefault(learner, deque()).append(waiter)
+            deadline = waiter.enqueued_at + timeout
+            if self._dispatch(state):
+                self._cond.notify_all()
+            while not waiter.granted:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    state.queues[waiter.priority][learner].remove(waiter)
+                    if not state.queues[waiter.priority][learner]:
+                        del state.queues[waiter.priority][learner]
+                    self._waits[(model, priority)]["timeouts"] += 1
+                    raise QueueTimeoutError(f"No '{model}' slot within {timeout:.1f}s ({priority}, learner {learner})")
+                refill = self._refill_delay(state)
+                self._cond.wait(min(remaining, refill) if refill is not None else remaining)
+                if self._dispatch(state):
+                    self._cond.notify_all()
+            return waiter
+
+    def release(self, waiter: Waiter) -> None:
+        with self._cond:
+            state = self._models[waiter.model]
+            state.running -= 1
+            state.running_by_learner[waiter.learner] -= 1
+            if not state.running_by_learner[waiter.learner]:
+                del state.running_by_learner[waiter.learner]
+            self._dispatch(state)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model: str, priority: str = "interactive", learner: str = "anonymous", capped: bool = True):
+        waiter = self.acquire(model, priority, learner, capped=capped)
+        try:
+            yield waiter
+        finally:
+            self.release(waiter)
+
+    def wrap(self, fn: Callable, model: str) -> Callable:
+        """
+        Bind a request function to a slot of its model.
+
+        The class and learner are read from the caller's attribution now, so the
+        wrapper also schedules correctly on hedge threads that lack the context.
+        """
+        priority, learner, capped = request_class()
+
+        def scheduled(*args, **kwargs):
+            with self.slot(model or "default", priority, learner, capped):
+                return fn(*args, **kwargs)
+        return scheduled
+
+    def snapshot(self) -> dict:
+        """Running and queued requests per model, and queue-wait statistics per model and class."""
+        with self._cond:
+            models = {
+                model: {
+                    "running": state.running,
+                    "queued": sum(len(waiters) for queues in state.queues.values() for waiters in queues.values()),
+                    "concurrency": state.limit.concurrency,
+                    "rpm": state.limit.rpm,
+                }
+                for model, state in self._models.items()
+            }
+            waits = {}
+            for (model, priority), stats in self._waits.items():
+                entry = dict(stats)
+                entry["avg_wait_ms"] = round(stats["total_wait_ms"] / stats["requests"], 1) if stats["requests"] else None
+                entry["total_wait_ms"] = round(stats["total_wait_ms"], 1)
+                entry["max_wait_ms"] = round(stats["max_wait_ms"], 1)
+                waits.setdefault(model, {})[priority] = entry
+        return {"models": models, "queue_wait": waits}
@@ -0,0 +1,237 @@
+import contextvars
+import functools
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .config import settings
+
+RAM_FILESYSTEMS = ("tmpfs", "ramfs")
+SHM_DIR = Path("/dev/shm")
+
+_workspace = contextvars.ContextVar("scratch_workspace", default=None)
+
+
+def default_scratch_root() -> Path:
+    """settings.scratch_dir, else a directory in /dev/shm (RAM-backed) if writable, else settings.temp_dir."""
+    if settings.scratch_dir:
+        return Path(settings.scratch_dir)
+    if SHM_DIR.is_dir() and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR / "learning-companion"
+    return Path(settings.temp_dir).resolve()
+
+
+def filesystem_type(path: Path) -> Optional[str]:
+    """Type of the filesystem a path is on, from /proc/mounts (None where that is not available)."""
+    try:
+        with open("/proc/mounts", "r") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = str(Path(path).resolve())
+    best, fstype = "", None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) > len(best):
+            best, fstype = mount_point, mount_type
+    return fstype
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+class ScratchSpace:
+    """
+    Short-lived request files (uploads, preprocessed audio, synthesized answers) in one
+    scratch root, preferably RAM-backed, instead of the working directory.
+
+    A request opens a workspace, a directory removed with everything in it when the
+    request ends, however it ends. Code running inside it (also in worker threads,
+    which inherit the context) gets its file names from path(). Entries are named
+    "<pid>-<id>-<label>", so a background sweeper can remove what killed workers left
+    behind, plus anything older than settings.scratch_orphan_age_seconds.
+    """
+
+    def __init__(self, root: Path = None, orphan_age_seconds: float = None):
+        self._root = Path(root) if root else None
+        self.orphan_age_seconds = orphan_age_seconds if orphan_age_seconds is not None else settings.scratch_orphan_age_seconds
+        self._active = set()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+        self.stats = {"workspaces_opened": 0, "workspaces_removed": 0, "sweeps": 0, "swept_entries": 0,
+                      "swept_bytes": 0, "peak_bytes": 0}
+        self._ram_backed = None
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = default_scratch_root()
+        self._root.mkdir(parents=True, exist_ok=True)
+        return self._root
+
+    @property
+    def ram_backed(self) -> bool:
+        if self._ram_backed is None:
+            self._ram_backed = filesystem_type(self.root) in RAM_FILESYSTEMS
+        return self._ram_backed
+
+    def _entry_name(self, label: str) -> str:
+        return f"{os.getpid()}-{uuid.uuid4().hex[:12]}-{label}"
+
+    @contextmanager
+    def workspace(self, label: str) -> Iterator[Path]:
+        """
+        A directory for one request's files, current for path() inside the block and removed after it.
+
+        Args:
+            label: What the workspace is for (e.g. the endpoint), part of its name
+        """
+        path = self.root / self._entry_name(label)
+        path.mkdir()
+        with self._lock:
+            self._active.add(path.name)
+            self.stats["workspaces_opened"] += 1
+        token = _workspace.set(path)
+        try:
+            yield path
+        finally:
+            _workspace.reset(token)
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self._active.discard(path.name)
+                self.stats["workspaces_removed"] += 1
+
+    def scoped(self, label: str):
+        """Decorator running an async endpoint inside a workspace of its own."""
+        def decorate(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                with self.workspace(label):
+                    return await endpoint(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def path(self, name: str) -> str:
+        """
+        A new file path for name (e.g. "audio.webm") in the current workspace.
+
+        Outside a workspace the file goes to the scratch root itself; the caller removes
+        it, or the sweeper does once it is old.
+        """
+        workspace = _workspace.get()
+        if workspace is not None:
+            return str(workspace / f"{uuid.uuid4().hex[:8]}-{name}")
+        return str(self.root / self._entry_name(name))
+
+    def _owner_alive(self, name: str) -> bool:
+        pid = name.split("-", 1)[0]
+        return not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid))
+
+    def sweep(self) -> int:
+        """
+        Remove orphaned entries: those of dead processes and those older than the orphan age.
+
+        Workspaces open in this process are never removed.
+
+        Returns:
+            Number of entries removed
+        """
+        now = time.time()
+        removed = 0
+        for entry in self.root.iterdir():
+            with self._lock:
+                if entry.name in self._active:
+                    continue
+            try:
+                age = now - entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if self._owner_alive(entry.name) and age <= self.orphan_age_seconds:
+                continue
+            size = _tree_size(entry)[0]
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            removed += 1
+            self.stats["swept_bytes"] += size
+        self.stats["sweeps"] += 1
+        self.stats["swept_entries"] += removed
+        if removed:
+            print(f"Scratch sweeper removed {removed} orphaned entries from {self.root}")
+        return removed
+
+    def usage(self) -> dict:
+        """Bytes and files in scratch space, open workspaces and the free space left on its filesystem."""
+        size, files = _tree_size(self.root)
+        self.stats["peak_bytes"] = max(self.stats["peak_bytes"], size)
+        disk = shutil.disk_usage(self.root)
+        with self._lock:
+            active = len(self._active)
+        return dict(self.stats, root=str(self.root), ram_backed=self.ram_backed, bytes=size, files=files,
+                    active_workspaces=active, filesystem_free_bytes=disk.free, filesystem_total_bytes=disk.total)
+
+    def _sweep_periodically(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+                usage = self.usage()
+                if usage["bytes"] > settings.scratch_warn_mb * 1024 * 1024:
+                    print(f"WARNING: scratch space {usage['root']} holds {usage['bytes'] // (1024 * 1024)} MB "
+                          f"in {usage['files']} files ({usage['active_workspaces']} open workspaces)")
+            except Exception as e:
+                print(f"Scratch sweep failed: {str(e)}")
+
+    def start_sweeper(self, interval: float = None) -> None:
+        """Sweep once now (leftovers of a previous run) and then periodically in a daemon thread."""
+        if self._sweeper is not None:
+            return
+        if not self.ram_backed:
+            print(f"Scratch space {self.root} is not RAM-backed; set SCRATCH_DIR to a tmpfs mount to keep request files in memory")
+        self.sweep()
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_periodically, name="scratch-sweeper", daemon=True,
+                                         args=(interval or settings.scratch_sweep_interval_seconds,))
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._stop.set()
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+
+def _tree_size(path: Path) -> tuple:
+    """(bytes, files) under a file or directory, ignoring entries removed meanwhile."""
+    if not path.is_dir():
+        try:
+            return path.stat().st_size, 1
+        except FileNotFoundError:
+            return 0, 0
+    size = files = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.stat(os.path.join(directory, name)).st_size
+                files += 1
+            except FileNotFoundError:
+                pass
+    return size, files
+
+
+scratch_space = ScratchSpace()
@@ -0,0 +1,257 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .course_db import course_db
+
+INDEX_ROOT = Path(__file__).resolve().parent.parent / "search_index"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+our ours ourselves out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yourself yourselves also like well okay um uh
+""".split())
+
+
+def stem(token: str) -> str:
+    """Very light suffix stripping so 'agents'/'agent' and 'properties'/'property' meet."""
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of documents, stored as term-major postings.
+
+    The BM25 weight of every (term, document) pair is precomputed at build time, so a
+    query is a gather over the query terms' posting ranges plus one np.bincount. The
+    arrays are saved as .npy files and loaded memory-mapped, so opening an index is
+    cheap and pages are shared between worker processes.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], term_offsets: np.ndarray, posting_docs: np.ndarray,
+                 posting_weights: np.ndarray, documents: List[dict], meta: dict = None):
+        self.vocabulary = vocabulary
+        self.term_offsets = term_offsets
+        self.posting_docs = posting_docs
+        self.posting_weights = posting_weights
+        self.documents = documents
+        self.meta = meta or {}
+        self._field_arrays = {}
+
+    @classmethod
+    def build(cls, texts: List[str], documents: List[dict], meta: dict = None, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Build an index.
+
+        Args:
+            texts: Text of each document
+            documents: Metadata returned with each hit, same order as texts
+            meta: Extra information saved with the index (e.g. the source version)
+            k1, b: BM25 parameters
+        """
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        doc_lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+
+        vocabulary = {}
+        postings = {}
+        for doc_index, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                postings.setdefault(term_id, []).append((doc_index, count))
+
+        doc_count = len(texts)
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        posting_docs = []
+        posting_freqs = []
+        for term_id in range(len(vocabulary)):
+            entries = postings[term_id]
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(entries)
+            posting_docs.extend(doc for doc, _ in entries)
+            posting_freqs.extend(count for _, count in entries)
+
+        posting_docs = np.array(posting_docs, dtype=np.int32)
+        freqs = np.array(posting_freqs, dtype=np.float32)
+        doc_freqs = np.diff(term_offsets).astype(np.float32)
+        idf = np.log1p((doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        posting_idf = np.repeat(idf, np.diff(term_offsets))
+        norm = k1 * (1 - b + b * doc_lengths[posting_docs] / average_length) if len(posting_docs) else np.zeros(0, np.float32)
+        posting_weights = (posting_idf * freqs * (k1 + 1) / (freqs + norm)).astype(np.float32)
+
+        return cls(vocabulary, term_offsets, posting_docs, posting_weights, documents, meta)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def field_mask(self, field: str, value) -> np.ndarray:
+        """Boolean mask of documents whose metadata field equals value (the field column is cached)."""
+        if field not in self._field_arrays:
+            self._field_arrays[field] = np.array([doc.get(field) for doc in self.documents], dtype=object)
+        return self._field_arrays[field] == value
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for a query (zeros if no query term is indexed)."""
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not term_ids or not len(self.documents):
+            return np.zeros(len(self.documents), dtype=np.float32)
+        ranges = [np.arange(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids]
+        positions = np.concatenate(ranges)
+        return np.bincount(self.posting_docs[positions], weights=self.posting_weights[positions],
+                           minlength=len(self.documents)).astype(np.float32)
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[dict, float]]:
+        """
+        Top-k documents for a query.
+
+        Args:
+            query: Free text
+            k: Maximum number of hits
+            mask: Optional boolean array restricting which documents may be returned
+
+        Returns:
+            List of (document metadata, score), best first, only positive scores
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.documents[i], float(scores[i])) for i in ranked]
+
+    def save(self, index_dir: Path) -> None:
+        """Write the index atomically: build in a temporary directory, then swap it in."""
+        index_dir = Path(index_dir)
+        index_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f".{index_dir.name}-", dir=index_dir.parent))
+        np.save(staging / "term_offsets.npy", self.term_offsets)
+        np.save(staging / "posting_docs.npy", self.posting_docs)
+        np.save(staging / "posting_weights.npy", self.posting_weights)
+        with open(staging / "vocabulary.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f)
+        with open(staging / "documents.json", "w", encoding="utf-8") as f:
+            json.dump(self.documents, f)
+        with open(staging / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+        previous = None
+        if index_dir.exists():
+            previous = index_dir.with_name(f".{index_dir.name}-old-{uuid.uuid4().hex[:12]}")
+            os.replace(index_dir, previous)
+        os.replace(staging, index_dir)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, index_dir: Path) -> Optional["BM25Index"]:
+        """Open a saved index with memory-mapped arrays, or return None if there is none."""
+        index_dir = Path(index_dir)
+        if not (index_dir / "meta.json").exists():
+            return None
+        with open(index_dir / "vocabulary.json", "r", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        with open(index_dir / "documents.json", "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        with open(index_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            vocabulary,
+            np.load(index_dir / "term_offsets.npy", mmap_mode="r"),
+            np.load(index_dir / "posting_docs.npy", mmap_mode="r"),
+            np.load(index_dir / "posting_weights.npy", mmap_mode="r"),
+            documents,
+            meta,
+        )
+
+
+class ConceptSearch:
+    """
+    Lexical search over every concept of every course.
+
+    The index is persisted under search_index/concepts and rebuilt after every
+    ingestion (see store_course), or on the next query when the catalog version it
+    was built from is outdated. Rebuilds in a process run one at a time.
+    """
+
+    def __init__(self, catalog, index_dir: Path = INDEX_ROOT / "concepts"):
+        self.catalog = catalog
+        self.index_dir = Path(index_dir)
+        self._index = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.RLock()
+
+    def rebuild(self) -> BM25Index:
+        """Build the index from the current catalog and persist it."""
+        with self._rebuild_lock:
+            return self._rebuild()
+
+    def _rebuild(self) -> BM25Index:
+        version, _ = self.catalog.version()
+        texts = []
+        documents = []
+        for course in self.catalog.list_courses():
+            for concept in self.catalog.get_concepts(course["course_id"]):
+                # The title is repeated so it weighs more than the long answer text
+                texts.append(f"{concept['title']} {concept['title']} {concept['question']} {concept['answer']}")
+                documents.append({"course_id": course["course_id"], "concept_id": concept["concept_id"],
+                                  "title": concept["title"]})
+        index = BM25Index.build(texts, documents, meta={"catalog_version": version})
+        index.save(self.index_dir)
+        print(f"Built concept search index with {len(index)} concepts (catalog version {version})")
+        with self._lock:
+            self._index = index
+        return index
+
+    def index(self) -> BM25Index:
+        """The current index, loading or rebuilding it if the catalog changed."""
+        version, _ = self.catalog.version()
+        with self._lock:
+            index = self._index
+        if index is None:
+            index = BM25Index.load(self.index_dir)
+        if index is None or index.meta.get("catalog_version") != version:
+            with self._rebuild_lock:
+                # Another request may have rebuilt it while this one waited
+                with self._lock:
+                    index = self._index
+                if index is None or index.meta.get("catalog_version") != version:
+                    return self._rebuild()
+                return index
+        with self._lock:
+            self._index = index
+        return index
+
+    def search(self, query: str, k: int = 10, course_id: str = None) -> List[dict]:
+        """
+        Best matching concepts for a query or a learner's transcription.
+
+        Returns:
+            List of dicts with course_id, concept_id, title and score
+        """
+        index = self.index()
+        mask = index.field_mask("course_id", course_id) if course_id is not None else None
+        return [dict(doc, score=round(score, 4)) for doc, score in index.search(query, k, mask)]
+
+
+concept_search = ConceptSearch(course_db)
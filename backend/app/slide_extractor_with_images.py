@@ -1,13 +1,24 @@
 import openai
-import fitz  # PyMuPDF
 import os
 import sys
 import base64
-import csv
 from dotenv import load_dotenv
 from pathlib import Path
-from openai import OpenAI
 import re
+import tempfile
+import time
+from .concepts import parse_concepts_csv
+from .config import settings
+from .course_db import course_db
+from .intro_speech import intro_speech
+from .openai_clients import openai_clients
+from .page_rasterizer import PageImage
+from .pdf_stream import MemoryGuard, iter_pdf_pages
+from .pdf_uploads import file_sha256
+from .search_index import concept_search
+from .slide_index import slide_search
+from .upstream import client_for_attempt, upstream
+from .usage_ledger import attribute_usage
 
 # Load environment variables from .env file
 env_path = Path(__file__).resolve().parent.parent / '.env'
@@ -19,43 +30,62 @@ if not os.getenv("OPENAI_API_KEY"):
     print("Please check that your .env file in the backend directory contains the OPENAI_API_KEY variable.")
     sys.exit(1)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared, pooled OpenAI client
+client = openai_clients.sync()
 
 
 def extract_text_and_images_from_pdf(file_path):
-    """Extract text and images from a PDF."""
-    doc = fitz.open(file_path)
-    text = ""
-    images = []
-
-    for page_number, page in enumerate(doc):
-        text += page.get_text()
-
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            try:
-                xref = img[0]
-                pix = fitz.Pixmap(doc, xref)
-                
-                # Convert to RGB if necessary
-                if pix.n > 4:  # CMYK
-                    pix = fitz.Pixmap(fitz.csRGB, pix)
-                elif pix.n == 4:  # RGBA
-                    pix = fitz.Pixmap(fitz.csRGB, pix)
-                elif pix.n < 3:  # Grayscale
-                    pix = fitz.Pixmap(fitz.csRGB, pix)
-                
-                image_data = pix.tobytes()
-                images.append(image_data)
-            except Exception as e:
-                print(f"Warning: Could not process image {img_index} on page {page_number}: {str(e)}")
-                continue
-
+    """
+    Extract text and images from a PDF (embedded images plus renders of vector-drawn diagram pages).
+
+    Returns every selected image as PNG bytes; ingestion uses iter_pdf_pages, which
+    keeps them on disk until the prompt is built.
+    """
+    with tempfile.TemporaryDirectory(prefix="pdf-spill-", dir=settings.pdf_spill_dir) as spill_dir:
+        pages = list(iter_pdf_pages(file_path, spill_dir))
+        text = "".join(page.text for page in pages)
+        images = [image.png for page in pages for image in page.images]
     return text, images
 
-def generate_questions_answers(text, images=None, model="gpt-4o"):
-    """Use OpenAI API to generate question-answer pairs from text + optional images."""
+def prompt_images(images, guard: MemoryGuard = None):
+    """
+    Image parts of the extraction prompt, within settings.pdf_prompt_images_max_mb.
+    
+    The request holds every image base64-encoded at once (and the HTTP client
+    serializes another copy), so this budget, not the deck, bounds the memory the
+    request needs. Images that no longer fit are left out.
+    The guard is checked after each image.
+    """
+    budget = settings.pdf_prompt_images_max_mb * 1024 * 1024
+    parts, used, skipped = [], 0, 0
+    for image in images:
+        size = image.size if isinstance(image, PageImage) else len(image)
+        encoded = 4 * ((size + 2) // 3)
+        if used + encoded > budget:
+            skipped += 1
+            continue
+        # Spilled images are read from disk only now
+        img_bytes = image.png if isinstance(image, PageImage) else image
+        parts.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/png;base64,{base64.b64encode(img_bytes).decode('utf-8')}"
+            }
+        })
+        used += encoded
+        del img_bytes
+        if guard is not None:
+            guard.check()
+    if skipped:
+        print(f"Left {skipped} slide images out of the prompt: {used // 2**20} MB of {settings.pdf_prompt_images_max_mb} MB used")
+    return parts
+
+def generate_questions_answers(text, images=None, model="gpt-4o", guard: MemoryGuard = None):
+    """
+    Use OpenAI API to generate question-answer pairs from text + optional images (PNG bytes or PageImages).
+    
+    The images sent are limited to settings.pdf_prompt_images_max_mb (see prompt_images).
+    """
     messages = [
         {"role": "system", "content": """You are an expert educational content analyzer that creates comprehensive question-answer pairs from slide decks.
 Your task is to:
@@ -108,21 +138,14 @@ Only return the CSV-formatted output, ensuring ALL information is included and A
 
     # Add images if available
     if images:
-        for img_bytes in images:
-            # Convert bytes to base64
-            base64_image = base64.b64encode(img_bytes).decode('utf-8')
-            messages[1]["content"].append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{base64_image}"
-                }
-            })
-
-    response = client.chat.completions.create(
+        messages[1]["content"].extend(prompt_images(images, guard))
+
+    # Through the shared caller, so bulk ingestion queues behind learners' requests for the model
+    response = upstream.call("extraction", lambda timeout: client_for_attempt(client, timeout).chat.completions.create(
         model=model,
         messages=messages,
         max_tokens=4000  # Increased token limit for more comprehensive output
-    )
+    ), model=model)
 
     content = response.choices[0].message.content
     print("\nRaw GPT output:")
@@ -153,30 +176,54 @@ def parse_qa_pairs(content):
     
     return qa_pairs
 
-def extract_key_concepts_and_generate_qa(file_path):
-    """Main method: Extracts text + images, sends to GPT-4 vision."""
-    text, images = extract_text_and_images_from_pdf(file_path)
-    qa_content = generate_questions_answers(text, images=images)
-    
-    # Save output to CSV file
-    output_dir = Path(__file__).resolve().parent.parent / "extracted_key_concepts"
-    output_dir.mkdir(exist_ok=True)
-    
-    # Create filename based on PDF name
+def extract_key_concepts_and_generate_qa(file_path, content_hash=None):
+    """Main method: Extracts text + images, sends to GPT-4 vision, stores the concepts in the course database."""
     pdf_name = Path(file_path).stem
-    output_file = output_dir / f"{pdf_name}_qa.csv"
+    content_hash = content_hash or file_sha256(file_path)
+    run_id = course_db.start_ingestion_run(str(file_path), content_hash)
     
-    # Write the CSV content directly to file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(qa_content)
+    try:
+        # One pass over the deck; page images stay in scratch space until the prompt is built
+        page_texts, images = [], []
+        guard = MemoryGuard()
+        with tempfile.TemporaryDirectory(prefix="pdf-spill-", dir=settings.pdf_spill_dir) as spill_dir:
+            for page in iter_pdf_pages(file_path, spill_dir, guard=guard):
+                page_texts.append(page.text)
+                images.extend(page.images)
+            with attribute_usage(course_id=pdf_name):
+                qa_content = generate_questions_answers("".join(page_texts), images=images, guard=guard)
+        concepts = parse_concepts_csv(qa_content)
+        store_course(pdf_name, concepts, file_path, content_hash, page_texts, run_id=run_id)
+    except Exception as e:
+        course_db.finish_ingestion_run(run_id, error=str(e))
+        raise
     
-    print(f"\nOutput has been saved to: {output_file}")
+    # Grandpa's opening questions are ready before the first learner opens the course
+    if settings.intro_speech_pregeneration:
+        intro_speech.schedule_course(pdf_name)
     
-    # Count the number of Q&A pairs (excluding header)
-    qa_pairs = qa_content.strip().split('\n')[1:]  # Skip header
-    return len(qa_pairs)
-
-# Example usage:
+    return len(concepts)
+
+def store_course(course_id, concepts, file_path, content_hash, page_texts, run_id=None, rebuild_search=True):
+    """
+    Store generated concepts and the deck's page texts, index the slides and complete the ingestion run.
+
+    The concept search index is rebuilt here, so no learner's query pays for it; a
+    caller storing many courses passes rebuild_search=False and rebuilds once at the end.
+    """
+    # Keep the page texts so the slide index can be rebuilt without the deck
+    course_db.upsert_course(course_id, concepts, source_path=str(file_path),
+                            content_hash=content_hash, page_texts=page_texts)
+    # Keep the slide text for grounding follow-ups
+    slide_search.index_pages(course_id, page_texts, source=str(file_path), content_hash=content_hash)
+    if rebuild_search:
+        concept_search.rebuild()
+    if run_id is not None:
+        course_db.finish_ingestion_run(run_id, course_id=course_id, concept_count=len(concepts))
+    print(f"\nStored {len(concepts)} concepts for course '{course_id}' in {course_db.db_path}")
+
+# Example usage (from the backend directory: python -m app.slide_extractor_with_images);
+# whole directories of decks are better ingested with python -m app.bulk_ingest, which resumes
 if __name__ == "__main__":
     pdf_files = [
         "course_content/ArtificialIntelligence_2_IntelligentAgents-2.pdf",
@@ -0,0 +1,148 @@
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from .config import settings
+from .course_db import course_db
+from .search_index import INDEX_ROOT, BM25Index
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Where decks of already ingested courses can be found when their slide index is missing
+DECK_DIRS = [BACKEND_DIR / "course_content", BACKEND_DIR / "uploads"]
+
+CHUNK_WORDS = 120
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+def extract_page_texts(file_path: str) -> List[str]:
+    """Text of every page of a PDF, in page order."""
+    with fitz.open(file_path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def chunk_pages(page_texts: List[str], chunk_words: int = CHUNK_WORDS) -> List[Dict]:
+    """
+    Split page texts into retrieval chunks.
+
+    Slides are short, so most pages become a single chunk; long pages are split into
+    runs of chunk_words words. Empty pages are skipped.
+
+    Returns:
+        List of dicts with page (1-based) and text
+    """
+    chunks = []
+    for page_number, text in enumerate(page_texts, start=1):
+        words = text.split()
+        for start in range(0, len(words), chunk_words):
+            chunks.append({"page": page_number, "text": " ".join(words[start:start + chunk_words])})
+    return chunks
+
+
+class SlideSearch:
+    """
+    Per-course BM25 indexes over slide text chunks, persisted under search_index/slides/<course_id>.
+
+    The chunk texts are stored with the index, so the deck does not have to be
+    re-parsed at follow-up time. Loaded indexes (and courses without one) are cached
+    per catalog version; when the catalog changed, an index is only reused if it was
+    built from the deck the course now has (its content hash), so a course
+    re-ingested by another worker is re-indexed here too.
+    """
+
+    def __init__(self, index_root: Path = INDEX_ROOT / "slides"):
+        self.index_root = Path(index_root)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index_deck(self, course_id: str, file_path: str, content_hash: str = None) -> BM25Index:
+        """Chunk a deck's pages and (re)build the course's slide index."""
+        return self.index_pages(course_id, extract_page_texts(file_path), source=str(file_path), content_hash=content_hash)
+
+    def index_pages(self, course_id: str, page_texts: List[str], source: str = None, content_hash: str = None) -> BM25Index:
+        """(Re)build the course's slide index from already extracted page texts of the deck with content_hash."""
+        chunks = chunk_pages(page_texts)
+        documents = [dict(chunk, course_id=course_id) for chunk in chunks]
+        index = BM25Index.build([chunk["text"] for chunk in chunks], documents,
+                                meta={"course_id": course_id, "source": source, "pages": len(page_texts),
+                                      "content_hash": content_hash})
+        index.save(self.index_root / course_id)
+        print(f"Built slide index for '{course_id}' with {len(chunks)} chunks from {len(page_texts)} pages")
+        version, _ = course_db.version()
+        with self._lock:
+            self._indexes[course_id] = (version, index)
+        return index
+
+    def _build(self, course_id: str, content_hash: Optional[str]) -> Optional[BM25Index]:
+        """Index the course's stored pages or a known deck; None if there is neither."""
+        page_texts = course_db.get_source_pages(course_id)
+        if page_texts:
+            return self.index_pages(course_id, page_texts, source="course_db", content_hash=content_hash)
+        for deck_dir in DECK_DIRS:
+            deck_path = deck_dir / f"{course_id}.pdf"
+            if deck_path.exists():
+                return self.index_deck(course_id, str(deck_path), content_hash=content_hash)
+        return None
+
+    def index(self, course_id: str) -> Optional[BM25Index]:
+        """The course's slide index, loading it or indexing stored pages or a known deck when needed."""
+        version, _ = course_db.version()
+        with self._lock:
+            cached = self._indexes.get(course_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        content_hash = course_db.get_content_hash(course_id)
+        index = BM25Index.load(self.index_root / course_id)
+        if index is None or index.meta.get("content_hash") != content_hash:
+            # Missing or built from another deck; an outdated index beats none if there is nothing to rebuild from
+            index = self._build(course_id, content_hash) or index
+        with self._lock:
+            self._indexes[course_id] = (version, index)
+        return index
+
+    def top_chunks(self, course_id: str, query: str, k: int = None, token_budget: int = None) -> List[Dict]:
+        """
+        Most relevant slide chunks for a query that fit in a token budget.
+
+        Chunks are taken best first; a chunk that would overflow the budget is skipped
+        in favour of smaller, lower-ranked ones.
+
+        Args:
+            course_id: Course whose deck to search
+            query: Usually the learner's transcription plus the concept title
+            k: Maximum number of chunks (settings.slide_context_top_k by default)
+            token_budget: Maximum estimated tokens (settings.slide_context_token_budget by default)
+
+        Returns:
+            List of dicts with page, text and score, in page order
+        """
+        k = k or settings.slide_context_top_k
+        token_budget = token_budget or settings.slide_context_token_budget
+        index = self.index(course_id)
+        if index is None:
+            return []
+
+        selected = []
+        used_tokens = 0
+        for chunk, score in index.search(query, k=k * 3):
+            tokens = estimate_tokens(chunk["text"])
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append({"page": chunk["page"], "text": chunk["text"], "score": round(score, 4)})
+            used_tokens += tokens
+            if len(selected) == k:
+                break
+        return sorted(selected, key=lambda chunk: chunk["page"])
+
+
+def format_slide_excerpts(chunks: List[Dict]) -> str:
+    """Render retrieved chunks for the analysis prompt."""
+    return "\n".join(f"[Slide {chunk['page']}] {chunk['text']}" for chunk in chunks)
+
+
+slide_search = SlideSearch()
@@ -0,0 +1,216 @@
+import difflib
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+WORD_PATTERN = re.compile(r"[\w']+")
+
+# A draft function takes the transcript so far and the drawing it should look at,
+# and returns (feedback, tokens used).
+DraftFn = Callable[[str, Optional[dict]], Tuple[str, int]]
+
+
+def transcript_words(text: str) -> List[str]:
+    return WORD_PATTERN.findall((text or "").lower())
+
+
+def transcript_similarity(draft_transcript: str, final_transcript: str) -> float:
+    """Word-level similarity of two transcripts in [0, 1]; punctuation and case are ignored."""
+    draft_words, final_words = transcript_words(draft_transcript), transcript_words(final_transcript)
+    if not draft_words and not final_words:
+        return 1.0
+    return difflib.SequenceMatcher(None, draft_words, final_words, autojunk=False).ratio()
+
+
+@dataclass
+class Draft:
+    """A speculative analysis started on the transcript as it was at a pause."""
+    transcript: str
+    drawing: Optional[dict]
+    future: Future
+    started_at: float = field(default_factory=time.monotonic)
+    tokens: Optional[int] = None  # set once the draft has finished
+    superseded: bool = False
+
+
+@dataclass
+class SpeculationOutcome:
+    """
+    What finalize should do with a session's draft.
+
+    kind is "hit" (feedback is the draft, reuse it), "revise" (draft holds a
+    finished draft that needs a cheap revision) or "miss" (run the full analysis).
+    """
+    kind: str
+    feedback: Optional[str] = None
+    draft: Optional[Draft] = None
+    reason: str = ""
+
+
+class SpeculationMetrics:
+    """Counters for speculative drafts: how often they are reused and how many tokens they waste."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys((
+            "drafts_started", "drafts_completed", "drafts_failed", "drafts_superseded",
+            "hits", "revisions", "misses", "draft_tokens", "wasted_tokens", "revision_tokens",
+        ), 0)
+        self.finalize_ms = {"hit": [0, 0.0], "revise": [0, 0.0], "miss": [0, 0.0]}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe_finalize(self, kind: str, seconds: float) -> None:
+        """Time from the end of speech (finalize) until grandpa's audio is ready."""
+        with self._lock:
+            self.finalize_ms[kind][0] += 1
+            self.finalize_ms[kind][1] += seconds * 1000
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            latency = {kind: round(total / count, 1) if count else None for kind, (count, total) in self.finalize_ms.items()}
+        finalized = counters["hits"] + counters["revisions"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / finalized, 3) if finalized else None
+        counters["reuse_rate"] = round((counters["hits"] + counters["revisions"]) / finalized, 3) if finalized else None
+        counters["wasted_token_fraction"] = (round(counters["wasted_tokens"] / counters["draft_tokens"], 3)
+                                             if counters["draft_tokens"] else None)
+        counters["avg_finalize_ms"] = latency
+        return counters
+
+
+class Speculator:
+    """
+    Speculative feedback while the learner is still talking.
+
+    Every pause in the live transcript starts a draft analysis in the background;
+    a newer pause supersedes the previous draft. At finalize the latest draft is
+    reused as is if the final transcript and drawing did not change materially,
+    revised cheaply if they did, and dropped if it is not ready in time. Tokens of
+    drafts that are never used are counted as wasted.
+    """
+
+    def __init__(self, workers: int = None):
+        self._executor = ThreadPoolExecutor(max_workers=workers or settings.speculation_workers, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+        self._drafts: Dict[str, Draft] = {}
+        self.metrics = SpeculationMetrics()
+
+    def latest(self, session_id: str) -> Optional[Draft]:
+        with self._lock:
+            return self._drafts.get(session_id)
+
+    def speculate(self, session_id: str, transcript: str, drawing: Optional[dict], draft_fn: DraftFn) -> Optional[Draft]:
+        """
+        Start a draft for the transcript so far.
+
+        Args:
+            session_id: Voice session the draft belongs to
+            transcript: Everything the learner said so far
+            drawing: The latest drawing as prepared for the vision call (or None)
+            draft_fn: Runs the analysis, returns (feedback, tokens)
+
+        Returns:
+            The new (or an identical running) draft, or None if the transcript is too short
+        """
+        if len(transcript_words(transcript)) < settings.speculation_min_words:
+            return None
+        drawing_key = drawing.get("key") if drawing else None
+        with self._lock:
+            previous = self._drafts.get(session_id)
+            if previous is not None and previous.transcript == transcript and (
+                    (previous.drawing.get("key") if previous.drawing else None) == drawing_key):
+                return previous
+            draft = Draft(transcript, drawing, self._executor.submit(draft_fn, transcript, drawing))
+            self._drafts[session_id] = draft
+            if previous is not None:
+                self._supersede(previous)
+        self.metrics.increment("drafts_started")
+        # Outside the lock: the callback runs right away if the draft already finished
+        draft.future.add_done_callback(lambda future: self._on_done(draft, future))
+        return draft
+
+    def _supersede(self, draft: Draft) -> None:
+        """Mark a draft as unused; its tokens are wasted now or once it finishes. Call with the lock held."""
+        if draft.superseded:
+            return
+        draft.superseded = True
+        self.metrics.increment("drafts_superseded")
+        if draft.tokens is not None:
+            self.metrics.increment("wasted_tokens", draft.tokens)
+
+    def _on_done(self, draft: Draft, future: Future) -> None:
+        try:
+            _, tokens = future.result()
+        except Exception as e:
+            print(f"Speculative draft failed: {str(e)}")
+            self.metrics.increment("drafts_failed")
+            tokens = 0
+        else:
+            self.metrics.increment("drafts_completed")
+            self.metrics.increment("draft_tokens", tokens)
+        with self._lock:
+            draft.tokens = tokens
+            if draft.superseded:
+                self.metrics.increment("wasted_tokens", tokens)
+
+    def resolve(self, session_id: str, final_transcript: str, drawing_unchanged: Callable[[Draft], bool],
+                wait_seconds: float = None) -> SpeculationOutcome:
+        """
+        Decide what to do with a session's draft at finalize and forget it.
+
+        Args:
+            session_id: Voice session being finalized
+            final_transcript: The complete transcript
+            drawing_unchanged: Whether the final drawing matches what the draft looked at
+            wait_seconds: How long to wait for a draft that is still running
+
+        Returns:
+            The outcome; for "revise" the caller reports the revision with record_revision
+        """
+        with self._lock:
+            draft = self._drafts.pop(session_id, None)
+        if draft is None:
+            self.metrics.increment("misses")
+            return SpeculationOutcome("miss", reason="no draft")
+
+        wait_seconds = settings.speculation_wait_seconds if wait_seconds is None else wait_seconds
+        wait([draft.future], timeout=wait_seconds)
+        if not draft.future.done():
+            return self._miss(draft, f"draft not ready after {wait_seconds}s")
+        if draft.future.exception() is not None:
+            return self._miss(draft, "draft failed")
+
+        feedback, _ = draft.future.result()
+        similarity = transcript_similarity(draft.transcript, final_transcript)
+        if similarity >= settings.speculation_reuse_similarity and drawing_unchanged(draft):
+            self.metrics.increment("hits")
+            return SpeculationOutcome("hit", feedback=feedback, draft=draft, reason=f"similarity {similarity:.2f}")
+        self.metrics.increment("revisions")
+        return SpeculationOutcome("revise", feedback=feedback, draft=draft, reason=f"similarity {similarity:.2f}")
+
+    def _miss(self, draft: Draft, reason: str) -> SpeculationOutcome:
+        with self._lock:
+            self._supersede(draft)
+        self.metrics.increment("misses")
+        return SpeculationOutcome("miss", draft=draft, reason=reason)
+
+    def record_revision(self, tokens: int) -> None:
+        self.metrics.increment("revision_tokens", tokens)
+
+    def discard(self, session_id: str) -> None:
+        """Drop a session's draft (e.g. the session ended without finalize)."""
+        with self._lock:
+            draft = self._drafts.pop(session_id, None)
+            if draft is not None:
+                self._supersede(draft)
+
+
+speculator = Speculator()
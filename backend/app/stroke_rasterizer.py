@@ -0,0 +1,339 @@
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image, ImageDraw
+
+from .config import settings
+from .drawing_tracker import THUMBNAIL_WIDTH, DrawingFingerprint, difference_hash
+from .image_optimizer import OptimizedImage, choose_scale, estimate_vision_tokens, finish_image
+
+# Temporary uploads ending in this suffix hold stroke vectors instead of an image
+STROKE_SUFFIX = ".strokes.json"
+# Blackboard colour of DrawingCanvas.tsx
+DEFAULT_BACKGROUND = "#333333"
+MAX_CANVAS_SIDE = 8192
+MAX_STROKE_WIDTH = 200.0
+
+_HEX_COLOR = re.compile(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+
+
+class StrokeFormatError(ValueError):
+    """A stroke upload that is malformed or too large to draw."""
+
+
+def normalize_color(value) -> str:
+    """Lower-case #rrggbb form of a #rgb or #rrggbb colour."""
+    if not isinstance(value, str) or not _HEX_COLOR.match(value):
+        raise StrokeFormatError(f"Colours must be '#rgb' or '#rrggbb', got {value!r}")
+    value = value.lower()
+    if len(value) == 4:
+        value = "#" + "".join(c * 2 for c in value[1:])
+    return value
+
+
+@dataclass(frozen=True)
+class Stroke:
+    """One pen or eraser stroke: a polyline in whole canvas pixels, drawn with round caps and joins."""
+    color: str
+    width: float
+    points: Tuple[Tuple[int, int], ...]
+
+    @property
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """Area the stroke paints, in canvas pixels."""
+        half = self.width / 2
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        return min(xs) - half, min(ys) - half, max(xs) + half, max(ys) + half
+
+    @property
+    def length(self) -> float:
+        return sum(math.dist(a, b) for a, b in zip(self.points, self.points[1:]))
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(json.dumps(self.to_dict(), separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def to_dict(self) -> dict:
+        deltas = []
+        previous_x, previous_y = 0, 0
+        for x, y in self.points:
+            deltas += [x - previous_x, y - previous_y]
+            previous_x, previous_y = x, y
+        width = int(self.width) if self.width == int(self.width) else self.width
+        return {"color": self.color, "width": width, "deltas": deltas}
+
+
+@dataclass(frozen=True)
+class StrokeSet:
+    """
+    A drawing as vectors, as DrawingCanvas records it: strokes in drawing order on a
+    plain blackboard. The eraser is a wide stroke in the background colour.
+    """
+    width: int
+    height: int
+    background: str
+    strokes: Tuple[Stroke, ...]
+
+    def to_json(self) -> bytes:
+        """Canonical encoding: the same drawing always gives the same bytes."""
+        return json.dumps({"width": self.width, "height": self.height, "background": self.background,
+                           "strokes": [stroke.to_dict() for stroke in self.strokes]},
+                          separators=(",", ":")).encode("utf-8")
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(self.to_json()).hexdigest()
+
+    def ink_strokes(self) -> List[Stroke]:
+        """Strokes that leave ink, i.e. not drawn in the background colour."""
+        return [stroke for stroke in self.strokes if stroke.color != self.background]
+
+
+def parse_strokes(data: Union[str, bytes, dict]) -> StrokeSet:
+    """
+    Validate a stroke upload.
+
+    Expected format (coordinates in canvas pixels, rounded to whole pixels):
+        {"width": 1200, "height": 800, "background": "#333333",
+         "strokes": [{"color": "#ffffff", "width": 2, "deltas": [10, 20, 4, 6, 3, 5, ...]}]}
+
+    "deltas" is the first point followed by each point's offset from the previous
+    one, which keeps a sketch to a few bytes per point; "points" with absolute
+    x, y pairs is accepted too.
+
+    Raises:
+        StrokeFormatError: if the upload is malformed or exceeds the configured limits
+    """
+    if isinstance(data, (str, bytes)):
+        if len(data) > settings.notepad_strokes_max_bytes:
+            raise StrokeFormatError(f"Stroke upload exceeds {settings.notepad_strokes_max_bytes} bytes")
+        try:
+            data = json.loads(data)
+        except ValueError as e:
+            raise StrokeFormatError(f"Strokes must be JSON: {str(e)}")
+    if not isinstance(data, dict):
+        raise StrokeFormatError("Strokes must be a JSON object")
+
+    try:
+        width, height = int(data["width"]), int(data["height"])
+    except (KeyError, TypeError, ValueError):
+        raise StrokeFormatError("Strokes need the canvas 'width' and 'height' in pixels")
+    if not (0 < width <= MAX_CANVAS_SIDE and 0 < height <= MAX_CANVAS_SIDE):
+        raise StrokeFormatError(f"Canvas size must be between 1 and {MAX_CANVAS_SIDE} pixels per side")
+    background = normalize_color(data.get("background", DEFAULT_BACKGROUND))
+
+    raw_strokes = data.get("strokes")
+    if not isinstance(raw_strokes, list):
+        raise StrokeFormatError("'strokes' must be a list")
+    if len(raw_strokes) > settings.notepad_max_strokes:
+        raise StrokeFormatError(f"At most {settings.notepad_max_strokes} strokes are accepted")
+
+    strokes = []
+    total_points = 0
+    for index, raw in enumerate(raw_strokes):
+        if not isinstance(raw, dict):
+            raise StrokeFormatError(f"Stroke {index} must be an object")
+        relative = "deltas" in raw
+        values = raw.get("deltas" if relative else "points")
+        if not isinstance(values, list) or not values or len(values) % 2:
+            raise StrokeFormatError(f"Stroke {index} needs a non-empty, even-length 'deltas' or 'points' list")
+        total_points += len(values) // 2
+        if total_points > settings.notepad_max_stroke_points:
+            raise StrokeFormatError(f"At most {settings.notepad_max_stroke_points} points are accepted")
+        try:
+            values = [float(v) for v in values]
+            stroke_width = round(float(raw.get("width", 2)), 1)
+        except (TypeError, ValueError):
+            raise StrokeFormatError(f"Stroke {index} has non-numeric points or width")
+        if not all(math.isfinite(v) for v in values) or not 0 < stroke_width <= MAX_STROKE_WIDTH:
+            raise StrokeFormatError(f"Stroke {index} has invalid points or width")
+        if relative:
+            for i in range(2, len(values)):
+                values[i] += values[i - 2]
+        values = [round(v) for v in values]
+        if any(abs(v) > 2 * MAX_CANVAS_SIDE for v in values):
+            raise StrokeFormatError(f"Stroke {index} lies far outside the canvas")
+        points = tuple(zip(values[::2], values[1::2]))
+        strokes.append(Stroke(normalize_color(raw.get("color", "#ffffff")), stroke_width, points))
+    return StrokeSet(width, height, background, tuple(strokes))
+
+
+def load_strokes(path: str) -> StrokeSet:
+    with open(path, "rb") as f:
+        return parse_strokes(f.read())
+
+
+def write_strokes(stroke_set: StrokeSet, path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(stroke_set.to_json())
+
+
+def is_stroke_upload(path: str) -> bool:
+    return str(path).endswith(STROKE_SUFFIX)
+
+
+def render(stroke_set: StrokeSet, box: Tuple[float, float, float, float] = None, scale: float = 1.0) -> Image.Image:
+    """
+    Draw a region of the canvas at a given scale.
+
+    Strokes are drawn at settings.stroke_supersample times the target size and the
+    result downsampled, which antialiases them like the browser canvas does. The
+    drawing buffer never exceeds settings.stroke_render_max_pixels: large outputs are
+    supersampled less (or not at all) and, if still too large, drawn at a lower scale.
+
+    Args:
+        stroke_set: The drawing
+        box: (left, top, right, bottom) in canvas pixels; the whole canvas by default
+        scale: Output pixels per canvas pixel
+
+    Returns:
+        RGB image of the region
+    """
+    left, top, right, bottom = box or (0, 0, stroke_set.width, stroke_set.height)
+    size = (max(1, round((right - left) * scale)), max(1, round((bottom - top) * scale)))
+    max_pixels = settings.stroke_render_max_pixels
+    if size[0] * size[1] > max_pixels:
+        scale = math.sqrt(max_pixels / ((right - left) * (bottom - top)))
+        size = (max(1, math.floor((right - left) * scale)), max(1, math.floor((bottom - top) * scale)))
+    supersample = max(1, settings.stroke_supersample)
+    while supersample > 1 and size[0] * size[1] * supersample ** 2 > max_pixels:
+        supersample -= 1
+    factor = scale * supersample
+
+    image = Image.new("RGB", (size[0] * supersample, size[1] * supersample), stroke_set.background)
+    draw = ImageDraw.Draw(image)
+    for stroke in stroke_set.strokes:
+        points = [((x - left) * factor, (y - top) * factor) for x, y in stroke.points]
+        width = stroke.width * factor
+        if len(points) > 1:
+            draw.line(points, fill=stroke.color, width=max(1, round(width)), joint="curve")
+        # Round caps (and dots for single-point strokes)
+        radius = max(0.5, width / 2)
+        for x, y in {points[0], points[-1]}:
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=stroke.color)
+    if supersample > 1:
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def _union(boxes) -> Optional[Tuple[float, float, float, float]]:
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _intersect(a, b) -> Optional[Tuple[float, float, float, float]]:
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def rasterize_for_vision(stroke_set: StrokeSet, region: Tuple[int, int, int, int] = None,
+                         original_bytes: int = None) -> OptimizedImage:
+    """
+    Draw a stroke set at exactly the crop and resolution the vision call needs.
+
+    The same choice prepare_image makes for an uploaded image, but from the
+    geometry: the crop is the ink's bounding box plus settings.notepad_crop_margin,
+    and the scale follows from the known stroke widths, so nothing is drawn at full
+    size only to be cropped and downscaled again.
+
+    Args:
+        stroke_set: The drawing
+        region: Only look at this part of the canvas (the region changed since the last turn)
+        original_bytes: Size of the stroke upload, for reporting
+
+    Returns:
+        OptimizedImage with a data URL for the vision call
+    """
+    canvas = (0, 0, stroke_set.width, stroke_set.height)
+    original_tokens = estimate_vision_tokens(stroke_set.width, stroke_set.height, "high")
+    if not settings.notepad_image_optimization:
+        return finish_image(render(stroke_set), original_bytes, original_tokens)
+
+    area = region or canvas
+    ink = [(stroke, _intersect(stroke.bbox, area)) for stroke in stroke_set.ink_strokes()]
+    ink = [(stroke, box) for stroke, box in ink if box is not None]
+    bbox = _union(box for _, box in ink)
+    if bbox is None:
+        # Blank blackboard (or region): a thumbnail is enough to show there is nothing on it
+        width = area[2] - area[0]
+        return finish_image(render(stroke_set, area, 64 / width), original_bytes, original_tokens)
+
+    margin = settings.notepad_crop_margin
+    crop = (math.floor(max(area[0], bbox[0] - margin)), math.floor(max(area[1], bbox[1] - margin)),
+            math.ceil(min(area[2], bbox[2] + margin)), math.ceil(min(area[3], bbox[3] + margin)))
+    # Length-weighted mean width, like estimate_stroke_width measures it on pixels
+    lengths = [max(stroke.length, stroke.width) for stroke, _ in ink]
+    stroke_width = sum(stroke.width * length for (stroke, _), length in zip(ink, lengths)) / sum(lengths)
+    scale = choose_scale(crop[2] - crop[0], crop[3] - crop[1], stroke_width)
+    return finish_image(render(stroke_set, crop, scale), original_bytes, original_tokens)
+
+
+def stroke_fingerprint(stroke_set: StrokeSet) -> DrawingFingerprint:
+    """
+    Fingerprint of a stroke set for the drawing tracker.
+
+    Besides the thumbnail (drawn directly at thumbnail size, so it also compares
+    with fingerprints of uploaded images) it lists the strokes, so the next turn's
+    change is found by comparing stroke lists instead of pixels.
+    """
+    thumbnail = render(stroke_set, scale=THUMBNAIL_WIDTH / stroke_set.width).convert("L")
+    strokes = {stroke.key: tuple(round(v) for v in stroke.bbox) for stroke in stroke_set.strokes}
+    return DrawingFingerprint(difference_hash(thumbnail), thumbnail, (stroke_set.width, stroke_set.height), strokes=strokes)
+
+
+class StrokeRasterizer:
+    """
+    Rasterizations and fingerprints of stroke sets, by stroke-set hash (bounded, least
+    recently used evicted).
+
+    The same drawing often arrives several times: shared while the learner pauses and
+    again with the finished turn, or in a retried request.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.stroke_raster_cache_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _cached(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+            self.stats["misses"] += 1
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def rasterize(self, stroke_set: StrokeSet, region: Tuple[int, int, int, int] = None,
+                  original_bytes: int = None) -> OptimizedImage:
+        """rasterize_for_vision, cached per stroke set and region."""
+        return self._cached(("image", stroke_set.key, region),
+                            lambda: rasterize_for_vision(stroke_set, region, original_bytes))
+
+    def fingerprint(self, stroke_set: StrokeSet) -> DrawingFingerprint:
+        """stroke_fingerprint, cached per stroke set."""
+        return self._cached(("fingerprint", stroke_set.key), lambda: stroke_fingerprint(stroke_set))
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, entries=len(self._entries),
+                    hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else None)
+
+
+stroke_rasterizer = StrokeRasterizer()
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .config import settings
+from .core import TRANSCRIPTION_MODEL
+
+
+def transcription_key(audio_sha256: str) -> str:
+    """
+    Cache key of a recording's transcription.
+
+    Besides the recording's hash it covers everything that changes the text for the
+    same bytes: the model and the preprocessing applied before upload.
+    """
+    preprocessing = (settings.audio_preprocessing, settings.audio_preprocessing_codec,
+                     settings.audio_max_silence_seconds, settings.audio_speech_padding_seconds)
+    digest = hashlib.sha256()
+    for part in (TRANSCRIPTION_MODEL, repr(preprocessing), audio_sha256):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Transcriptions by recording content, one small JSON file per key under <root>/<aa>/.
+
+    A retried or re-sent recording is transcribed once: later requests read the text
+    from disk, and concurrent requests for the same recording wait for the first
+    instead of uploading it again.
+    """
+
+    def __init__(self, root: Path = None):
+        self.root = Path(root or settings.transcription_cache_dir)
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, threading.Lock] = {}
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, audio_sha256: str) -> Optional[str]:
+        path = self._path(transcription_key(audio_sha256))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, audio_sha256: str, text: str) -> None:
+        path = self._path(transcription_key(audio_sha256))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": TRANSCRIPTION_MODEL, "text": text}, f)
+        os.replace(temp_path, path)
+
+    def transcribe(self, audio_sha256: str, transcribe: Callable[[], str]) -> str:
+        """
+        The cached text for a recording, or transcribe it now and remember the result.
+
+        Args:
+            audio_sha256: SHA-256 of the recording as uploaded
+            transcribe: Transcribes the recording, returns the text
+        """
+        if not settings.transcription_cache:
+            return transcribe()
+        with self._lock:
+            key_lock = self._in_flight.setdefault(audio_sha256, threading.Lock())
+        try:
+            with key_lock:
+                text = self.get(audio_sha256)
+                if text is not None:
+                    self.stats["hits"] += 1
+                    print(f"Transcription cache hit for audio {audio_sha256[:12]}")
+                    return text
+                self.stats["misses"] += 1
+                text = transcribe()
+                self.put(audio_sha256, text)
+                return text
+        finally:
+            with self._lock:
+                if self._in_flight.get(audio_sha256) is key_lock and not key_lock.locked():
+                    del self._in_flight[audio_sha256]
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else None)
+
+
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,332 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+
+import openai
+
+from .config import settings
+from .scheduler import FairScheduler, QueueTimeoutError
+from .usage_ledger import usage_from_response, usage_ledger
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when an upstream call cannot be made or did not succeed within its deadline."""
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling upstream while the operation's circuit breaker is open."""
+
+
+@dataclass
+class OperationPolicy:
+    """
+    How calls for one upstream operation are made.
+
+    attempt_timeout bounds a single request, deadline bounds the whole call including
+    retries and backoff. hedge_after, if set, starts a duplicate request when the first
+    has not answered after that many seconds; the first success wins.
+    """
+    attempt_timeout: float
+    deadline: float
+    hedge_after: Optional[float] = None
+
+
+def default_policies() -> dict:
+    """Per-operation policies; hedging is only offered for the short TTS and evaluation calls."""
+    return {
+        "transcription": OperationPolicy(attempt_timeout=20.0, deadline=45.0),
+        "analysis": OperationPolicy(attempt_timeout=30.0, deadline=60.0),
+        "revision": OperationPolicy(attempt_timeout=10.0, deadline=20.0),
+        "speech": OperationPolicy(attempt_timeout=20.0, deadline=40.0, hedge_after=settings.speech_hedge_after_seconds),
+        "evaluation": OperationPolicy(attempt_timeout=15.0, deadline=30.0, hedge_after=settings.evaluation_hedge_after_seconds),
+        # Concept generation from a whole deck: long responses, never on a learner's critical path
+        "extraction": OperationPolicy(attempt_timeout=180.0, deadline=420.0),
+    }
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection problems, rate limits and 5xx responses are worth retrying; 4xx are not."""
+    if isinstance(error, (TimeoutError, ConnectionError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    After failure_threshold consecutive retryable failures the circuit opens and calls
+    fail fast. After reset_timeout one trial call is let through (half-open); its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+
+
+class UpstreamMetrics:
+    """Thread-safe per-operation counters, exposed through the metrics endpoint."""
+
+    COUNTERS = ("calls", "attempts", "retries", "successes", "failures", "timeouts",
+                "hedges_started", "hedges_won", "circuit_rejections")
+
+    def __init__(self):
+        self._counts = defaultdict(lambda: dict.fromkeys(self.COUNTERS, 0))
+        self._lock = threading.Lock()
+
+    def increment(self, operation: str, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[operation][counter] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {operation: dict(counts) for operation, counts in self._counts.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+class UpstreamLatency:
+    """
+    Exponentially weighted moving average of the wall time of recent calls, per
+    operation and model, including queueing in the scheduler and retries.
+
+    An average not updated for max_age seconds is no longer current: a model nobody
+    has called lately is unknown, not still slow.
+    """
+
+    def __init__(self, alpha: float = None, max_age: float = None, clock: Callable[[], float] = time.monotonic):
+        self.alpha = alpha if alpha is not None else settings.upstream_latency_alpha
+        self.max_age = max_age if max_age is not None else settings.upstream_latency_max_age_seconds
+        self.clock = clock
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation: str, model: str, seconds: float) -> None:
+        with self._lock:
+            average, samples, _ = self._averages.get((operation, model), (seconds, 0, 0.0))
+            average += self.alpha * (seconds - average)
+            self._averages[(operation, model)] = (average, samples + 1, self.clock())
+
+    def current(self, operation: str, model: str) -> Optional[float]:
+        """The average wall time in seconds, or None if there is no recent observation."""
+        with self._lock:
+            entry = self._averages.get((operation, model))
+        if entry is None or self.clock() - entry[2] > self.max_age:
+            return None
+        return entry[0]
+
+    def snapshot(self) -> dict:
+        now = self.clock()
+        with self._lock:
+            entries = dict(self._averages)
+        result = defaultdict(dict)
+        for (operation, model), (average, samples, updated) in entries.items():
+            result[operation][model] = {"average_seconds": round(average, 3), "samples": samples,
+                                        "age_seconds": round(now - updated, 1),
+                                        "current": now - updated <= self.max_age}
+        return dict(result)
+
+
+class UpstreamCaller:
+    """
+    Shared call layer for OpenAI requests: deadlines, jittered exponential backoff,
+    optional hedging and a circuit breaker per operation.
+
+    The wrapped function receives the timeout for its attempt in seconds and must
+    pass it on to the client (see client_for_attempt). With a scheduler, every
+    attempt (including hedges) first waits for a slot of its model.
+    """
+
+    def __init__(self, policies: dict = None, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic, ledger=None, scheduler: FairScheduler = None):
+        self.policies = policies or default_policies()
+        self.ledger = ledger
+        self.scheduler = scheduler
+        self.sleep = sleep
+        self.clock = clock
+        self.metrics = UpstreamMetrics()
+        self.latency = UpstreamLatency(clock=clock)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=settings.upstream_hedge_workers, thread_name_prefix="upstream-hedge")
+
+    def breaker(self, operation: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            if operation not in self._breakers:
+                self._breakers[operation] = CircuitBreaker(settings.circuit_breaker_failure_threshold,
+                                                           settings.circuit_breaker_reset_seconds, self.clock)
+            return self._breakers[operation]
+
+    def call(self, operation: str, fn: Callable[[float], T], model: str = None, usage_hint: dict = None) -> T:
+        """
+        Call fn under the operation's policy.
+
+        Args:
+            operation: Policy name, e.g. "transcription", "analysis", "speech" or "evaluation"
+            fn: Function making one upstream request, called with the attempt timeout
+            model: Model the request uses, for the usage ledger
+            usage_hint: Estimated token counts for responses that carry no usage (e.g. TTS audio)
+
+        Returns:
+            The first successful result of fn
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+            UpstreamUnavailableError: if the deadline passed, retries ran out on retryable errors
+                or the scheduler had no slot for the model in time
+            Exception: non-retryable errors from fn are re-raised unchanged
+        """
+        started = time.monotonic()
+        if self.scheduler is not None:
+            fn = self.scheduler.wrap(fn, model)
+        try:
+            result = self._call(operation, fn)
+        except Exception as e:
+            self._record_usage(operation, model, {}, started, "error")
+            if model and isinstance(e.__cause__, (TimeoutError, openai.APITimeoutError)):
+                # A model that times out is at least as slow as the time it took
+                self.latency.observe(operation, model, time.monotonic() - started)
+            raise
+        if model:
+            self.latency.observe(operation, model, time.monotonic() - started)
+        usage = usage_from_response(result)
+        if usage_hint and not any(usage.values()):
+            usage.update(usage_hint)
+        self._record_usage(operation, model, usage, started, "ok")
+        return result
+
+    def _record_usage(self, operation: str, model: str, usage: dict, started: float, status: str) -> None:
+        if self.ledger is not None:
+            self.ledger.record(operation, model, usage, time.monotonic() - started, status=status)
+
+    def _call(self, operation: str, fn: Callable[[float], T]) -> T:
+        policy = self.policies[operation]
+        breaker = self.breaker(operation)
+        self.metrics.increment(operation, "calls")
+
+        if not breaker.allow_request():
+            self.metrics.increment(operation, "circuit_rejections")
+            raise CircuitOpenError(f"Upstream '{operation}' is unavailable (circuit open)")
+
+        deadline = self.clock() + policy.deadline
+        last_error = None
+        for attempt in range(settings.upstream_max_attempts):
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                break
+            if attempt > 0:
+                self.metrics.increment(operation, "retries")
+            timeout = min(policy.attempt_timeout, remaining)
+            try:
+                if policy.hedge_after is not None and policy.hedge_after < timeout:
+                    result = self._hedged_attempt(operation, fn, timeout, policy.hedge_after)
+                else:
+                    self.metrics.increment(operation, "attempts")
+                    result = fn(timeout)
+            except QueueTimeoutError as e:
+                # Our own queue is saturated; the upstream was never asked
+                self.metrics.increment(operation, "failures")
+                raise UpstreamUnavailableError(f"Upstream '{operation}' is saturated: {e}") from e
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered, so it is healthy; the request itself is wrong
+                    breaker.record_success()
+                    self.metrics.increment(operation, "failures")
+                    raise
+                last_error = e
+                if isinstance(e, (TimeoutError, openai.APITimeoutError)):
+                    self.metrics.increment(operation, "timeouts")
+                breaker.record_failure()
+                print(f"Upstream '{operation}' attempt {attempt + 1} failed: {e}")
+                if not breaker.allow_request():
+                    break
+                backoff = self._backoff(attempt)
+                if self.clock() + backoff >= deadline:
+                    break
+                self.sleep(backoff)
+                continue
+            breaker.record_success()
+            self.metrics.increment(operation, "successes")
+            return result
+
+        self.metrics.increment(operation, "failures")
+        raise UpstreamUnavailableError(f"Upstream '{operation}' failed: {last_error or 'deadline exceeded'}") from last_error
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        ceiling = min(settings.upstream_backoff_max_seconds, settings.upstream_backoff_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _hedged_attempt(self, operation: str, fn: Callable[[float], T], timeout: float, hedge_after: float) -> T:
+        """Run fn, start a duplicate if it is slow, and return whichever succeeds first."""
+        started = self.clock()
+        self.metrics.increment(operation, "attempts")
+        primary = self._executor.submit(fn, timeout)
+        pending = {primary}
+        done, pending = wait(pending, timeout=hedge_after, return_when=FIRST_COMPLETED)
+        if not done:
+            self.metrics.increment(operation, "hedges_started")
+            self.metrics.increment(operation, "attempts")
+            pending.add(self._executor.submit(fn, max(0.0, timeout - hedge_after)))
+
+        errors = []
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.metrics.increment(operation, "hedges_won")
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                errors.append(future.exception())
+            if not pending:
+                raise errors[0]
+            remaining = timeout - (self.clock() - started)
+            if remaining <= 0:
+                raise TimeoutError(f"Upstream '{operation}' did not answer within {timeout:.1f}s")
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+
+def client_for_attempt(client, timeout: float):
+    """A view of the OpenAI client with the attempt timeout and without the SDK's own retries."""
+    return client.with_options(timeout=timeout, max_retries=0)
+
+
+upstream = UpstreamCaller(ledger=usage_ledger, scheduler=FairScheduler() if settings.scheduler_enabled else None)
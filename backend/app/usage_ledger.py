@@ -0,0 +1,260 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .config import settings
+from .course_db import open_wal_connection
+
+# Estimated USD per 1M tokens. Update together with the provider's price list.
+MODEL_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o-transcribe": {"input": 2.50, "audio_input": 6.00, "output": 10.00},
+    "gpt-4o-mini-transcribe": {"input": 1.25, "audio_input": 3.00, "output": 5.00},
+    "gpt-4o-mini-tts": {"input": 0.60, "audio_output": 12.00},
+}
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "audio_input_tokens", "audio_output_tokens")
+ATTRIBUTION_FIELDS = ("session_id", "concept_id", "course_id", "endpoint")
+GROUP_BY_FIELDS = ATTRIBUTION_FIELDS + ("model", "operation")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    operation TEXT NOT NULL,
+    model TEXT,
+    status TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    audio_input_tokens INTEGER NOT NULL DEFAULT 0,
+    audio_output_tokens INTEGER NOT NULL DEFAULT 0,
+    wall_ms REAL NOT NULL,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    session_id TEXT,
+    concept_id TEXT,
+    course_id TEXT,
+    endpoint TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_session ON usage(session_id);
+CREATE INDEX IF NOT EXISTS idx_usage_created ON usage(created_at);
+"""
+
+_attribution = contextvars.ContextVar("usage_attribution", default={})
+
+
+@contextmanager
+def attribute_usage(**fields):
+    """
+    Attribute every upstream call made inside the block to a session, concept, course and endpoint.
+
+    Nested blocks add to (and override) the outer attribution. None values are ignored.
+    """
+    merged = dict(_attribution.get())
+    merged.update({key: str(value) for key, value in fields.items() if value is not None})
+    token = _attribution.set(merged)
+    try:
+        yield merged
+    finally:
+        _attribution.reset(token)
+
+
+def current_attribution() -> Dict[str, str]:
+    return dict(_attribution.get())
+
+
+def _get(obj, name, default=None):
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    """
+    Token counts reported in an API response.
+
+    Understands chat completion usage (prompt/completion tokens with cached and audio
+    details) and transcription usage (input/output tokens with audio details).
+    Responses without usage (e.g. raw TTS audio) give zeros.
+    """
+    usage = _get(response, "usage")
+    counts = dict.fromkeys(USAGE_FIELDS, 0)
+    if usage is None:
+        return counts
+    prompt_details = _get(usage, "prompt_tokens_details") or _get(usage, "input_token_details")
+    completion_details = _get(usage, "completion_tokens_details")
+    counts["prompt_tokens"] = _get(usage, "prompt_tokens") or _get(usage, "input_tokens") or 0
+    counts["completion_tokens"] = _get(usage, "completion_tokens") or _get(usage, "output_tokens") or 0
+    counts["cached_tokens"] = _get(prompt_details, "cached_tokens") or 0
+    counts["audio_input_tokens"] = _get(prompt_details, "audio_tokens") or 0
+    counts["audio_output_tokens"] = _get(completion_details, "audio_tokens") or 0
+    return {key: int(value) for key, value in counts.items()}
+
+
+def estimate_cost(model: Optional[str], usage: Dict[str, int]) -> float:
+    """Estimated cost in USD from MODEL_PRICES (0 for unknown models)."""
+    prices = MODEL_PRICES.get(model or "")
+    if not prices:
+        return 0.0
+    audio_input = usage.get("audio_input_tokens", 0)
+    cached = usage.get("cached_tokens", 0)
+    text_input = max(0, usage.get("prompt_tokens", 0) - audio_input - cached)
+    audio_output = usage.get("audio_output_tokens", 0)
+    text_output = max(0, usage.get("completion_tokens", 0) - audio_output)
+    cost = (
+        text_input * prices.get("input", 0)
+        + cached * prices.get("cached_input", prices.get("input", 0))
+        + audio_input * prices.get("audio_input", prices.get("input", 0))
+        + text_output * prices.get("output", 0)
+        + audio_output * prices.get("audio_output", prices.get("output", 0))
+    )
+    return cost / 1_000_000
+
+
+class UsageLedger:
+    """
+    Append-only ledger of upstream usage: tokens, estimated cost and wall time per
+    call, attributed to the session, concept, course and endpoint active when the
+    call was made (see attribute_usage).
+
+    Stored in SQLite in WAL mode next to the course database; per-session totals for
+    budget checks are indexed queries.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = str(db_path or settings.usage_db_path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_wal_connection(self.db_path)
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    conn.commit()
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def record(self, operation: str, model: Optional[str], usage: Dict[str, int], wall_seconds: float,
+               status: str = "ok", **attribution) -> dict:
+        """
+        Add one upstream call to the ledger.
+
+        Args:
+            operation: Upstream operation, e.g. "analysis" or "extraction"
+            model: Model that served the call
+            usage: Token counts (see usage_from_response)
+            wall_seconds: Wall time of the call including retries
+            status: "ok" or "error"
+            **attribution: Overrides for the current attribution fields
+
+        Returns:
+            The stored entry
+        """
+        fields = current_attribution()
+        fields.update({key: str(value) for key, value in attribution.items() if value is not None})
+        entry = {key: int(usage.get(key, 0)) for key in USAGE_FIELDS}
+        entry.update(
+            created_at=time.time(), operation=operation, model=model, status=status,
+            wall_ms=round(wall_seconds * 1000, 1), cost_usd=estimate_cost(model, usage),
+            **{key: fields.get(key) for key in ATTRIBUTION_FIELDS},
+        )
+        columns = ", ".join(entry)
+        placeholders = ", ".join("?" for _ in entry)
+        try:
+            conn = self.connection()
+            with conn:
+                conn.execute(f"INSERT INTO usage ({columns}) VALUES ({placeholders})", tuple(entry.values()))
+        except Exception as e:
+            # Accounting must never fail the learner's request
+            print(f"Warning: could not record usage for {operation}: {str(e)}")
+        return entry
+
+    def session_totals(self, session_id: str) -> dict:
+        """Token and cost totals of one session."""
+        row = self.connection().execute("""
+            SELECT COUNT(*) AS calls,
+                   COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS total_tokens,
+                   COALESCE(SUM(cost_usd), 0) AS cost_usd,
+                   COALESCE(SUM(wall_ms), 0) AS wall_ms
+            FROM usage WHERE session_id = ?
+        """, (session_id,)).fetchone()
+        return dict(row)
+
+    def summary(self, group_by: str = "session_id", since: float = None, session_id: str = None, limit: int = 100) -> List[dict]:
+        """
+        Usage aggregated by one attribution field, most expensive first.
+
+        Args:
+            group_by: One of GROUP_BY_FIELDS
+            since: Only count calls after this UNIX timestamp
+            session_id: Only count calls of this session
+            limit: Maximum number of groups
+        """
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        token_sums = ", ".join(f"SUM({field}) AS {field}" for field in USAGE_FIELDS)
+        rows = self.connection().execute(f"""
+            SELECT {group_by} AS "group", COUNT(*) AS calls, SUM(status != 'ok') AS errors, {token_sums},
+                   SUM(cost_usd) AS cost_usd, SUM(wall_ms) AS wall_ms, AVG(wall_ms) AS avg_wall_ms
+            FROM usage {where} GROUP BY {group_by} ORDER BY cost_usd DESC, calls DESC LIMIT ?
+        """, (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def recent(self, session_id: str = None, limit: int = 50) -> List[dict]:
+        if session_id is None:
+            rows = self.connection().execute("SELECT * FROM usage ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = self.connection().execute("SELECT * FROM usage WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                                             (session_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def over_budget(self, session_id: Optional[str]) -> bool:
+        """
+        Whether a session has used up its configured token or cost budget.
+
+        Sessions are a single learner's (issued by the server or continued by the
+        client, see api.new_learning_session_id); calls without a session are never
+        over budget.
+        """
+        if not session_id or (settings.session_budget_tokens is None and settings.session_budget_usd is None):
+            return False
+        totals = self.session_totals(session_id)
+        if settings.session_budget_tokens is not None and totals["total_tokens"] >= settings.session_budget_tokens:
+            return True
+        return settings.session_budget_usd is not None and totals["cost_usd"] >= settings.session_budget_usd
+
+    def model_for(self, preferred: str, session_id: str = None) -> str:
+        """
+        The model to use for the next call of a session.
+
+        Once the session is over budget, models with an entry in
+        settings.budget_fallback_models are swapped for their cheaper fallback; the
+        learner keeps getting answers, just from a smaller model.
+        """
+        session_id = session_id or current_attribution().get("session_id")
+        fallback = settings.budget_fallback_models.get(preferred)
+        if fallback and self.over_budget(session_id):
+            print(f"Session '{session_id}' is over budget, using {fallback} instead of {preferred}")
+            return fallback
+        return preferred
+
+
+usage_ledger = UsageLedger()
@@ -0,0 +1,93 @@
+"""
+Measure how much dead air the audio preprocessing stage removes and the transcription latency it saves.
+
+Requires ffmpeg. Transcription latency is only measured when OPENAI_API_KEY is set. Run from the backend directory:
+
+    python -m benchmarks.bench_audio_preprocessing --output benchmarks/results/audio_preprocessing.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from app.audio_preprocessing import ffmpeg_available, preprocess_audio
+from app.core import transcribe_speech_input
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+FIXTURES = [
+    BACKEND_DIR / "tests" / "sample_audio.wav",
+    BACKEND_DIR.parent / "example_explanation.webm",
+]
+
+
+def time_transcription(client, audio_path, repeats):
+    """Median wall time of transcribing one file."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        transcribe_speech_input(client, str(audio_path))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3, help="Transcription runs per file and variant")
+    parser.add_argument("--output", default="benchmarks/results/audio_preprocessing.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        print("ffmpeg not found, cannot run the preprocessing benchmark")
+        return
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    client = OpenAI(api_key=api_key) if api_key else None
+    if client is None:
+        print("OPENAI_API_KEY not set, skipping transcription latency")
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for fixture in FIXTURES:
+            result = preprocess_audio(str(fixture), os.path.join(scratch, fixture.stem))
+            entry = {
+                "fixture": fixture.name,
+                "original_seconds": result.original_seconds,
+                "kept_seconds": result.kept_seconds,
+                "removed_seconds": result.removed_seconds,
+                "input_bytes": result.input_bytes,
+                "output_bytes": result.output_bytes,
+                "preprocessing_seconds": result.elapsed_seconds,
+            }
+            if client is not None:
+                entry["raw_transcription_seconds"] = time_transcription(client, fixture, args.repeats)
+                entry["preprocessed_transcription_seconds"] = time_transcription(client, result.output_path, args.repeats)
+                entry["latency_saved_seconds"] = (entry["raw_transcription_seconds"]
+                                                  - entry["preprocessed_transcription_seconds"]
+                                                  - result.elapsed_seconds)
+            results.append(entry)
+
+            print(f"\n{fixture.name}")
+            print(f"  audio: {result.original_seconds:.2f}s -> {result.kept_seconds:.2f}s "
+                  f"({result.removed_seconds:.2f}s removed)")
+            print(f"  bytes: {result.input_bytes} -> {result.output_bytes}, preprocessing took {result.elapsed_seconds:.3f}s")
+            if "latency_saved_seconds" in entry:
+                print(f"  transcription: {entry['raw_transcription_seconds']:.3f}s -> "
+                      f"{entry['preprocessed_transcription_seconds']:.3f}s "
+                      f"(net saved {entry['latency_saved_seconds']:.3f}s)")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"results": results}, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure concept search latency on synthetic catalogs of thousands of concepts.
+
+Runs offline. Run from the backend directory:
+
+    python -m benchmarks.bench_concept_search --output benchmarks/results/concept_search.json
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.course_db import course_db
+from app.search_index import BM25Index
+
+QUERIES = [
+    "an agent perceives the environment with sensors",
+    "how does the thermostat control the valve",
+    "renting hardware and storage as a service",
+    "rational agent performance measure",
+]
+
+
+def synthetic_corpus(size, seed=0):
+    """Concepts built by recombining the words of the real catalog."""
+    words = []
+    for course in course_db.list_courses():
+        for concept in course_db.get_concepts(course["course_id"]):
+            words.extend(f"{concept['title']} {concept['answer']}".split())
+    rng = random.Random(seed)
+    texts = [" ".join(rng.choices(words, k=rng.randint(40, 120))) for _ in range(size)]
+    documents = [{"course_id": f"course-{i % 50}", "concept_id": str(i)} for i in range(size)]
+    return texts, documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,20000", help="Comma-separated corpus sizes")
+    parser.add_argument("--repeats", type=int, default=200, help="Queries per size")
+    parser.add_argument("--output", default="benchmarks/results/concept_search.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        texts, documents = synthetic_corpus(size)
+        start = time.perf_counter()
+        index = BM25Index.build(texts, documents)
+        build_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as scratch:
+            index.save(Path(scratch) / "index")
+            index = BM25Index.load(Path(scratch) / "index")
+            timings = []
+            for i in range(args.repeats):
+                query = QUERIES[i % len(QUERIES)]
+                start = time.perf_counter()
+                index.search(query, k=10)
+                timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        entry = {
+            "concepts": size,
+            "build_seconds": build_seconds,
+            "median_query_ms": statistics.median(timings) * 1000,
+            "p95_query_ms": timings[int(len(timings) * 0.95)] * 1000,
+        }
+        results.append(entry)
+        print(f"{size:>6} concepts: build {build_seconds:.2f}s, query median {entry['median_query_ms']:.3f} ms, "
+              f"p95 {entry['p95_query_ms']:.3f} ms")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"results": results}, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
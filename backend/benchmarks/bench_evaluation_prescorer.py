@@ -0,0 +1,95 @@
+"""
+Compare the local coverage pre-scorer with the LLM evaluator on recorded histories.
+
+Reads the evaluation log written by the evaluator (every LLM-scored history with
+the local estimate at the time) and re-scores each history locally with the current
+settings, so thresholds can be tuned offline. Reports the fraction of evaluations
+the local scorer would answer on its own (LLM calls avoided) and how often its
+score agrees with the LLM's on those.
+
+Runs offline on the log. With --call-llm, log entries without an LLM score (e.g.
+hand-written histories) are scored with the evaluator first (needs OPENAI_API_KEY).
+Run from the backend directory:
+
+    python -m benchmarks.bench_evaluation_prescorer --output benchmarks/results/evaluation_prescorer.json
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.coverage_scorer import coverage_scorer
+
+
+def band(score):
+    return "low" if score < 40 else "high" if score >= 70 else "mid"
+
+
+def load_histories(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--histories", default=settings.evaluation_log_path,
+                        help="JSONL with title, answer, history and llm_score per line (default: the evaluation log)")
+    parser.add_argument("--tolerance", type=float, default=settings.prescore_agreement_tolerance,
+                        help="Score points within which local and LLM scores agree")
+    parser.add_argument("--call-llm", action="store_true", help="Score entries without llm_score with the LLM evaluator")
+    parser.add_argument("--output", default="benchmarks/results/evaluation_prescorer.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    entries = load_histories(args.histories)
+    if args.call_llm:
+        from app.evaluator import Evaluator
+        evaluator = Evaluator()
+        for entry in entries:
+            if entry.get("llm_score") is None:
+                entry["llm_score"] = evaluator.evaluate_with_llm({"title": entry["title"], "description": entry["answer"]}, entry["history"])
+    entries = [entry for entry in entries if entry.get("llm_score") is not None]
+    if not entries:
+        print(f"No LLM-scored histories in {args.histories}")
+        return
+
+    rows, timings = [], []
+    for entry in entries:
+        start = time.perf_counter()
+        local = coverage_scorer.score(entry["answer"], entry["history"])
+        timings.append(time.perf_counter() - start)
+        rows.append({
+            "title": entry["title"],
+            "llm_score": entry["llm_score"],
+            "local_score": local.score,
+            "confident": local.confident,
+            "reason": local.reason,
+            "agrees": abs(local.score - entry["llm_score"]) <= args.tolerance,
+            "same_band": band(local.score) == band(entry["llm_score"]),
+        })
+
+    confident = [row for row in rows if row["confident"]]
+    summary = {
+        "histories": len(rows),
+        "avoided_fraction": len(confident) / len(rows),
+        "confident_agreement_rate": sum(row["agrees"] for row in confident) / len(confident) if confident else None,
+        "confident_band_agreement_rate": sum(row["same_band"] for row in confident) / len(confident) if confident else None,
+        "overall_agreement_rate": sum(row["agrees"] for row in rows) / len(rows),
+        "mean_abs_error": statistics.mean(abs(row["local_score"] - row["llm_score"]) for row in rows),
+        "median_local_ms": statistics.median(timings) * 1000,
+        "tolerance": args.tolerance,
+    }
+    print(f"{summary['histories']} histories: {summary['avoided_fraction']:.0%} answered locally, "
+          f"agreement on those {summary['confident_agreement_rate']}, overall {summary['overall_agreement_rate']:.0%}, "
+          f"MAE {summary['mean_abs_error']:.1f}, local scoring {summary['median_local_ms']:.2f} ms")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "histories": rows}, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
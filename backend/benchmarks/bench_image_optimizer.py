@@ -0,0 +1,56 @@
+"""
+Report bytes and vision tokens saved per turn by the notepad image optimizer.
+
+Runs offline on the notepad fixtures. Run from the backend directory:
+
+    python -m benchmarks.bench_image_optimizer --output benchmarks/results/image_optimizer.json
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.image_optimizer import optimize_notepad_image
+
+REPO_DIR = Path(__file__).resolve().parent.parent.parent
+FIXTURES = [
+    REPO_DIR / "example_notepad.webp",
+    REPO_DIR / "bad_example_notepad.webp",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmarks/results/image_optimizer.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for fixture in FIXTURES:
+        start = time.perf_counter()
+        optimized = optimize_notepad_image(str(fixture))
+        elapsed = time.perf_counter() - start
+        results.append({
+            "fixture": fixture.name,
+            "detail": optimized.detail,
+            "size": [optimized.width, optimized.height],
+            "original_bytes": optimized.original_bytes,
+            "optimized_bytes": optimized.optimized_bytes,
+            "bytes_saved": optimized.bytes_saved,
+            "original_tokens": optimized.original_tokens,
+            "optimized_tokens": optimized.optimized_tokens,
+            "tokens_saved": optimized.tokens_saved,
+            "optimization_seconds": elapsed,
+        })
+        print(f"{fixture.name}: {optimized.width}x{optimized.height} at {optimized.detail} detail, "
+              f"{optimized.original_bytes} -> {optimized.optimized_bytes} bytes, "
+              f"{optimized.original_tokens} -> {optimized.optimized_tokens} tokens ({elapsed * 1000:.1f} ms)")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"results": results}, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Micro-benchmarks of the backend's local (CPU and disk) processing stages.
+
+Every stage runs on synthetic inputs at several scales, without network:
+
+    pdf_extraction     extract_text_and_images_from_pdf on generated decks (cold and render-cached)
+    concept_catalog    concept CSV parsing, database import and lookups
+    upload_encoding    save_uploaded_files into a scratch workspace plus base64 encoding of the audio and the notepad image
+    history            conversation history load, append and windowing at 10 to 100k turns
+    prompt_assembly    analyze_image up to the request (the client answers instantly)
+
+Results are written as JSON together with the commit they were measured on. Pass
+--compare with an earlier result file to flag stages that got slower. Run from the
+backend directory:
+
+    python -m benchmarks.bench_local_stages --output benchmarks/results/local_stages.json
+    python -m benchmarks.bench_local_stages --quick --compare benchmarks/results/local_stages.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+# The extractor refuses to import without a key; nothing here talks to the API
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+
+import fitz
+from PIL import Image, ImageDraw
+from starlette.datastructures import UploadFile
+
+from app import api, core, pdf_stream, slide_extractor_with_images
+from app.concepts import parse_concepts_csv
+from app.conversation import history_window
+from app.course_db import CourseDatabase
+from app.page_rasterizer import PageRasterizer
+from app.upstream import UpstreamCaller
+
+FULL_SCALES = {
+    "pdf_extraction": [10, 100, 1000],
+    "concept_catalog": [100, 1000, 10000],
+    "upload_encoding": [64 * 1024, 1024 * 1024, 8 * 1024 * 1024],
+    "history": [10, 1000, 100000],
+    "prompt_assembly": [0, 10, 100],
+}
+QUICK_SCALES = {
+    "pdf_extraction": [10, 50],
+    "concept_catalog": [100, 1000],
+    "upload_encoding": [64 * 1024, 1024 * 1024],
+    "history": [10, 1000, 10000],
+    "prompt_assembly": [0, 10],
+}
+
+
+def measure(fn, repeats):
+    """Run fn repeats times; returns timing statistics in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "repeats": repeats,
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+    }
+
+
+@contextmanager
+def working_directory(path):
+    """The history and upload stages use paths relative to the working directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def make_deck(path, pages):
+    """Lecture-like deck: a text page every time, plus a box-and-arrow diagram on every third page."""
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=720, height=540)
+        page.insert_text((40, 50), f"Lecture slide {number}: agents, environments and rationality", fontsize=18)
+        for line in range(8):
+            page.insert_text((60, 100 + 30 * line), f"- point {line} about sensors, actuators and performance measures", fontsize=12)
+        if number % 3 == 0:
+            offset = (number * 7) % 60
+            for x in (80, 280, 480):
+                page.draw_rect(fitz.Rect(x, 340 + offset, x + 140, 440 + offset))
+                page.draw_line((x + 140, 390 + offset), (x + 200, 390 + offset))
+            page.draw_circle((360, 470), 25)
+    doc.save(path)
+    doc.close()
+
+
+def bench_pdf_extraction(scale, scratch, repeats):
+    deck = scratch / f"deck_{scale}.pdf"
+    make_deck(str(deck), scale)
+    results = {}
+    previous = pdf_stream.page_rasterizer
+    try:
+        cold = []
+        for attempt in range(max(1, repeats // 2)):
+            pdf_stream.page_rasterizer = PageRasterizer(scratch / f"render_cache_{scale}_{attempt}")
+            start = time.perf_counter()
+            _, images = slide_extractor_with_images.extract_text_and_images_from_pdf(str(deck))
+            cold.append((time.perf_counter() - start) * 1000)
+        results["cold_median_ms"] = statistics.median(cold)
+        results["images"] = len(images)
+        # The last rasterizer's cache is now warm
+        results.update({f"cached_{key}": value for key, value in measure(
+            lambda: slide_extractor_with_images.extract_text_and_images_from_pdf(str(deck)), repeats).items()})
+    finally:
+        pdf_stream.page_rasterizer = previous
+    results["deck_bytes"] = deck.stat().st_size
+    return results
+
+
+def bench_concept_catalog(scale, scratch, repeats):
+    rows = ["question_number,concept_title,question,answer"]
+    for number in range(1, scale + 1):
+        rows.append(f'{number},"Concept {number}","What is concept {number}?",'
+                    f'"Concept {number} is explained by sensors, actuators and an environment, step {number}."')
+    content = "```csv\n" + "\n".join(rows) + "\n```"
+    parse = measure(lambda: parse_concepts_csv(content), repeats)
+    concepts = parse_concepts_csv(content)
+
+    db = CourseDatabase(scratch / f"courses_{scale}.db")
+    start = time.perf_counter()
+    db.upsert_course("bench", concepts)
+    import_ms = (time.perf_counter() - start) * 1000
+    ids = [str(1 + (i * 7919) % scale) for i in range(1000)]
+    lookup = measure(lambda: [db.get_concept("bench", concept_id) for concept_id in ids], repeats)
+    page = measure(lambda: db.get_concepts("bench", offset=scale // 2, limit=20), repeats)
+    return {
+        "parse_median_ms": parse["median_ms"],
+        "import_ms": import_ms,
+        "lookup_1000_median_ms": lookup["median_ms"],
+        "page_median_ms": page["median_ms"],
+    }
+
+
+def bench_upload_encoding(scale, scratch, repeats):
+    audio = os.urandom(scale)
+    image = Image.new("RGB", (1600, 1200), (20, 20, 20))
+    ImageDraw.Draw(image).line([(100, 100), (1500, 1100)], fill=(240, 240, 240), width=6)
+    image_buffer = io.BytesIO()
+    image.save(image_buffer, "WEBP", quality=80)
+    image_bytes = image_buffer.getvalue()
+
+    def save_and_encode():
+        audio_upload = UploadFile(io.BytesIO(audio), filename="speech.webm")
+        image_upload = UploadFile(io.BytesIO(image_bytes), filename="notepad.webp")
+        with api.scratch_space.workspace("bench-upload"):
+            audio_path, image_path = asyncio.run(api.save_uploaded_files(audio_upload, image_upload))
+            with open(audio_path, "rb") as f:
+                base64.b64encode(f.read())
+            api.encode_notepad_upload(image_path)
+
+    with working_directory(scratch):
+        return measure(save_and_encode, repeats) | {"audio_bytes": scale, "image_bytes": len(image_bytes)}
+
+
+def bench_history(scale, scratch, repeats):
+    directory = scratch / f"history_{scale}"
+    directory.mkdir()
+    entry = ("\n\n--- Conversation at 2025-01-01 10:00:00 ---\nUSER: An agent perceives its environment through sensors "
+             "and acts through actuators.\n\nGRANDPA: Oh my, and what does it do with what it senses?\n--- End of conversation ---")
+    (directory / "conversation_history.txt").write_text("# Learning Companion Conversation History\n" + entry * scale, encoding="utf-8")
+    with working_directory(directory):
+        load = measure(api.load_conversation_history, repeats)
+        append = measure(lambda: api.save_conversation_to_history("What is a percept?", "It is what the agent senses."), repeats)
+        history = api.load_conversation_history()
+        window = measure(lambda: history_window(history, 6), repeats)
+    return {
+        "load_median_ms": load["median_ms"],
+        "append_median_ms": append["median_ms"],
+        "window_median_ms": window["median_ms"],
+        "history_bytes": len(history.encode("utf-8")),
+    }
+
+
+class InstantClient:
+    """Stands in for the OpenAI client so only the local prompt assembly is timed."""
+
+    def __init__(self):
+        response = SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response))
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def bench_prompt_assembly(scale, scratch, repeats):
+    history = history_window("\n\n--- Conversation at 2025-01-01 10:00:00 ---\nUSER: something\n\nGRANDPA: tell me more\n"
+                             "--- End of conversation ---" * scale, 10 ** 6)
+    image_url = "data:image/webp;base64," + base64.b64encode(os.urandom(60_000)).decode("ascii")
+    slides = "\n\n".join(f"[Slide {page}] An agent perceives its environment through sensors." for page in range(4))
+    previous = core.upstream
+    core.upstream = UpstreamCaller()
+    try:
+        result = measure(lambda: core.analyze_image(
+            InstantClient(), "An agent perceives its environment through sensors", image_url,
+            "An intelligent agent is anything that perceives its environment...", "Intelligent agent",
+            history, last_explanation=False, slide_excerpts=slides), repeats)
+    finally:
+        core.upstream = previous
+    return result | {"history_turns": scale}
+
+
+@contextmanager
+def quiet():
+    """The stages print progress for every call; keep the benchmark output readable."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+STAGES = {
+    "pdf_extraction": bench_pdf_extraction,
+    "concept_catalog": bench_concept_catalog,
+    "upload_encoding": bench_upload_encoding,
+    "history": bench_history,
+    "prompt_assembly": bench_prompt_assembly,
+}
+
+
+def headline(entry):
+    """The number compared between runs: the first median in the entry."""
+    return next(value for key, value in entry.items() if key.endswith("median_ms"))
+
+
+def compare(results, baseline_path, threshold, min_delta_ms):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for stage, entries in results.items():
+        previous = {entry["scale"]: entry for entry in baseline.get(stage, [])}
+        for entry in entries:
+            if entry["scale"] not in previous:
+                continue
+            before, after = headline(previous[entry["scale"]]), headline(entry)
+            ratio = after / before if before else float("inf")
+            # Sub-millisecond stages jitter by more than the threshold; require an absolute slowdown too
+            marker = "  REGRESSION" if ratio > 1 + threshold and after - before > min_delta_ms else ""
+            print(f"{stage:>16} @ {entry['scale']:>8}: {before:10.3f} -> {after:10.3f} ms ({ratio:.2f}x){marker}")
+            if marker:
+                regressions.append({"stage": stage, "scale": entry["scale"], "before_ms": before, "after_ms": after})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument("--quick", action="store_true", help="Smaller scales, e.g. for a pre-commit check")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per stage and scale")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown that counts as a regression (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="Smallest absolute slowdown that counts as a regression")
+    parser.add_argument("--output", default="benchmarks/results/local_stages.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    scales = QUICK_SCALES if args.quick else FULL_SCALES
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for stage in args.stages.split(","):
+            results[stage] = []
+            for scale in scales[stage]:
+                scratch_dir = Path(scratch) / f"{stage}_{scale}"
+                scratch_dir.mkdir()
+                with quiet():
+                    entry = {"scale": scale, **STAGES[stage](scale, scratch_dir, args.repeats)}
+                results[stage].append(entry)
+                print(f"{stage:>16} @ {scale:>8}: median {headline(entry):.3f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "quick": args.quick,
+        "results": results,
+    }
+    if args.compare:
+        print(f"\nCompared with {args.compare}:")
+        report["regressions"] = compare(results, args.compare, args.threshold, args.min_delta_ms)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare grandpa's TTS output formats by payload size and time-to-playable.
+
+Calls the live speech endpoint, so OPENAI_API_KEY must be set. Run from the backend directory:
+
+    python -m benchmarks.bench_tts_formats --repeats 3 --output benchmarks/results/tts_formats.json
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from app.core import AUDIO_FORMATS, GRANDPA_TTS_MODEL, GRANDPA_VOICE, GRANDPA_VOICE_INSTRUCTIONS
+
+# Typical grandpa answers: 4-5 sentences, as produced by analyze_image
+SAMPLE_RESPONSES = [
+    "Well now, let me see if I've got this right. An intelligent agent is something that looks at the world with its sensors and then does something with its actuators. "
+    "Your drawing with the arrows going back and forth helped me a lot there. But I'm wondering, what decides which action the agent picks? Is there something in the middle doing the thinking?",
+    "Hmm, that's interesting. So the thermostat feels how warm the room is and then opens or closes the valve. "
+    "I like the little box you drew for the thermostat. But tell me, how does it know what temperature it should aim for?",
+    "Thank you for taking the time to explain this to me, my dear! I think I've got a much better handle on cloud services now. "
+    "Renting the computers, renting the platform and renting the finished program, that makes sense to me. You did a good job!",
+]
+
+
+def measure_format(client, text, audio_format):
+    """Stream one TTS response and record first-byte latency, total latency and payload size."""
+    start = time.perf_counter()
+    first_chunk_at = None
+    payload_bytes = 0
+    with client.audio.speech.with_streaming_response.create(
+        model=GRANDPA_TTS_MODEL,
+        voice=GRANDPA_VOICE,
+        input=text,
+        response_format=audio_format,
+        instructions=GRANDPA_VOICE_INSTRUCTIONS,
+    ) as response:
+        for chunk in response.iter_bytes():
+            if first_chunk_at is None and chunk:
+                first_chunk_at = time.perf_counter()
+            payload_bytes += len(chunk)
+    end = time.perf_counter()
+    return {
+        "time_to_first_byte_s": (first_chunk_at or end) - start,
+        "total_time_s": end - start,
+        "payload_bytes": payload_bytes,
+        # What the client actually downloads: the JSON response carries base64
+        "base64_bytes": len(base64.b64encode(b"\0" * payload_bytes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", default=",".join(AUDIO_FORMATS), help="Comma-separated formats to compare")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per sample and format")
+    parser.add_argument("--output", default="benchmarks/results/tts_formats.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip() in AUDIO_FORMATS]
+
+    results = {}
+    for audio_format in formats:
+        runs = []
+        for sample_index, text in enumerate(SAMPLE_RESPONSES):
+            for _ in range(args.repeats):
+                run = measure_format(client, text, audio_format)
+                run["sample"] = sample_index
+                runs.append(run)
+                print(f"{audio_format:>5} sample {sample_index}: {run['payload_bytes']:>8} bytes, "
+                      f"first byte {run['time_to_first_byte_s']:.3f}s, total {run['total_time_s']:.3f}s")
+        results[audio_format] = {
+            "runs": runs,
+            "median_payload_bytes": statistics.median(r["payload_bytes"] for r in runs),
+            "median_time_to_first_byte_s": statistics.median(r["time_to_first_byte_s"] for r in runs),
+            "median_total_time_s": statistics.median(r["total_time_s"] for r in runs),
+        }
+
+    print("\nformat   median bytes   first byte   total")
+    for audio_format, summary in results.items():
+        print(f"{audio_format:>6} {summary['median_payload_bytes']:>14.0f} {summary['median_time_to_first_byte_s']:>11.3f}s "
+              f"{summary['median_total_time_s']:>6.3f}s")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"model": GRANDPA_TTS_MODEL, "voice": GRANDPA_VOICE, "results": results}, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,25 @@
 import requests
 import os
 import base64
+import uuid
 
 
-def call_ask_follow_up(base_url, concept_id, audio_file_path, notepad_image_path, last_explanation: bool = False):
+def call_ask_follow_up(base_url, concept_id, audio_file_path, notepad_image_path, last_explanation: bool = False,
+                       retries: int = 2, timeout: float = 120):
     """
     Call the ask-follow-up API endpoint.
     
+    Every attempt sends the same Idempotency-Key, so a retry after a timeout or a
+    dropped connection gets the answer of the first attempt instead of a second turn.
+    
     Args:
         base_url: The base URL of the API (e.g., "http://localhost:8000/api")
         concept_id: The ID of the concept being explained
         audio_file_path: Path to the WebM audio file containing the explanation
         notepad_image_path: Path to the WebP image file with drawn notes
         last_explanation: Boolean indicating if this is the final explanation attempt.
+        retries: Extra attempts after a timeout or connection error
+        timeout: Seconds to wait for each attempt
         
     Returns:
         The JSON response from the API or None if an error occurred.
@@ -25,34 +32,41 @@ def call_ask_follow_up(base_url, concept_id, audio_file_path, notepad_image_path
         "concept_id": concept_id,
         "last_explanation": str(last_explanation).lower() # Send as 'true' or 'false'
     }
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
     
-    # Prepare files with correct MIME types
-    files = {
-        "audio_file": (os.path.basename(audio_file_path), open(audio_file_path, "rb"), "audio/webm"),
-        "notepad_image": (os.path.basename(notepad_image_path), open(notepad_image_path, "rb"), "image/webp")
-    }
-    
-    try:
-        # Make the request
-        print(f"Calling {url} with concept_id={concept_id}, last_explanation={last_explanation}")
-        response = requests.post(url, data=form_data, files=files)
-        
-        # Check if request was successful
-        response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-        
-        # Return the JSON response
-        print(f"API call successful (Status: {response.status_code})")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling API: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response status: {e.response.status_code}")
-            print(f"Response body: {e.response.text}")
-        return None
-    finally:
-        # Close the file handles
-        for file_obj in files.values():
-            file_obj[1].close()
+    for attempt in range(retries + 1):
+        # Prepare files with correct MIME types (reopened, a failed attempt may have read them)
+        files = {
+            "audio_file": (os.path.basename(audio_file_path), open(audio_file_path, "rb"), "audio/webm"),
+            "notepad_image": (os.path.basename(notepad_image_path), open(notepad_image_path, "rb"), "image/webp")
+        }
+        try:
+            # Make the request
+            print(f"Calling {url} with concept_id={concept_id}, last_explanation={last_explanation}")
+            response = requests.post(url, data=form_data, files=files, headers=headers, timeout=timeout)
+            
+            # Check if request was successful
+            response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+            
+            # Return the JSON response
+            replayed = " (replayed)" if response.headers.get("Idempotent-Replayed") else ""
+            print(f"API call successful (Status: {response.status_code}){replayed}")
+            return response.json()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if attempt == retries:
+                print(f"Error calling API: {e}")
+                return None
+            print(f"Attempt {attempt + 1} failed ({e}), retrying with the same idempotency key")
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling API: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                print(f"Response status: {e.response.status_code}")
+                print(f"Response body: {e.response.text}")
+            return None
+        finally:
+            # Close the file handles
+            for file_obj in files.values():
+                file_obj[1].close()
 
 
 def main():
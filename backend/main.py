@@ -1,22 +1,52 @@
-from fastapi import FastAPI, UploadFile, File
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, RedirectResponse
 from pathlib import Path
 from pydantic import BaseModel
 from .app.slide_extractor_with_images import extract_key_concepts_and_generate_qa
+from .app.usage_ledger import attribute_usage
+from .app.core import AUDIO_FORMATS
+from .app.course_db import course_db
+from .app.intro_speech import intro_speech
+from .app.upstream import UpstreamUnavailableError
+from .app.openai_clients import openai_clients
+from .app.page_rasterizer import shutdown_render_pool
+from .app.scratch import scratch_space
+from .app.pdf_uploads import (
+    UploadRejectedError, check_declared_size, iter_upload_file, resumable_uploads, store_upload
+)
 
 import os
-import shutil
 
 
 # Import the router from api.py
 from .app.api import router
+from .app.conversation import router as conversation_router
 from .app.config import settings
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open upstream connections before the first learner needs them and start the
+    scratch sweeper (which first removes what a previous run left behind); close the
+    pools and stop the sweeper on shutdown.
+    """
+    if settings.openai_warm_up_on_startup and settings.openai_api_key:
+        await run_in_threadpool(openai_clients.warm_up)
+    await run_in_threadpool(scratch_space.start_sweeper)
+    yield
+    scratch_space.stop_sweeper()
+    openai_clients.close()
+    shutdown_render_pool()
+
 # Create the main FastAPI app
 app = FastAPI(
     title="Learning Companion API",
     description="API for the learning companion that provides feedback on user explanations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -34,33 +64,120 @@ os.makedirs(settings.temp_dir, exist_ok=True)
 
 # Include the router from api.py
 app.include_router(router, prefix="/api")
+app.include_router(conversation_router, prefix="/api")
+
+def ingest_upload(stored):
+    """Run concept extraction on a stored upload and build the response (blocking; run it off the event loop)."""
+    qa_pairs = extract_key_concepts_and_generate_qa(str(stored.path), content_hash=stored.sha256)
+    return {
+        "message": "PDF processed successfully",
+        "filename": stored.path.name,
+        "course_id": stored.course_id,
+        "sha256": stored.sha256,
+        "pages": stored.pages,
+        "qa_pairs_generated": qa_pairs
+    }
 
 @app.post("/upload-pdf/")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Endpoint to handle PDF uploads from frontend."""
+async def upload_pdf(request: Request, file: UploadFile = File(...)):
+    """
+    Endpoint to handle PDF uploads from frontend.
+    
+    The file is copied to uploads/ in fixed-size chunks and hashed on the way; the
+    size limit is enforced per chunk and the page limit before any extraction.
+    """
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = Path(__file__).resolve().parent / "uploads"
-        upload_dir.mkdir(exist_ok=True)
-        
-        # Save the uploaded file
-        file_path = upload_dir / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process the PDF
-        qa_pairs = extract_key_concepts_and_generate_qa(str(file_path))
-        
-        return {
-            "message": "PDF processed successfully",
-            "filename": file.filename,
-            "qa_pairs_generated": qa_pairs
-        }
+        check_declared_size(request.headers.get("content-length"))
+        stored = await store_upload(iter_upload_file(file), file.filename)
+        # The worker thread waits for a background scheduler slot, not the event loop
+        with attribute_usage(endpoint="upload-pdf"):
+            return await run_in_threadpool(ingest_upload, stored)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         return {"error": str(e)}
     finally:
         file.file.close()
+
+@app.post("/upload-pdf/sessions")
+async def create_upload_session(filename: str = Form(...), total_size: int = Form(...)):
+    """
+    Start a resumable upload for a large deck.
     
+    Send the bytes with PUT /upload-pdf/sessions/{upload_id}?offset=N (raw request body,
+    any number of chunks), then POST /upload-pdf/sessions/{upload_id}/complete.
+    """
+    try:
+        return resumable_uploads.create(filename, total_size)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.get("/upload-pdf/sessions/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """Get the state of a resumable upload, including the offset to resume from."""
+    try:
+        return resumable_uploads.status(upload_id)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.put("/upload-pdf/sessions/{upload_id}")
+async def append_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Append the raw request body to a resumable upload, starting at offset."""
+    try:
+        return await resumable_uploads.append(upload_id, offset, request.stream())
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/upload-pdf/sessions/{upload_id}/complete")
+async def complete_upload_session(upload_id: str, sha256: str = Form(None)):
+    """Finish a resumable upload (optionally verifying its SHA-256) and process the PDF."""
+    try:
+        stored = await run_in_threadpool(resumable_uploads.complete, upload_id, expected_sha256=sha256)
+        with attribute_usage(endpoint="upload-pdf"):
+            return await run_in_threadpool(ingest_upload, stored)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/grandmaspeech/")
+async def grandma_speech(
+    concept: str = Query(..., description="Concept ID or exact concept title"),
+    course_id: str = Query(None, description="Course of the concept; defaults to settings.default_course_id"),
+    format: str = Query(None, description="Audio format; defaults to settings.intro_speech_format (wav)")
+):
+    """
+    Grandpa's opening question for a concept.
+    
+    Redirects to the immutable audio store URL of the pre-synthesized audio, so the
+    browser caches it for good. Missing audio is synthesized once on first request.
+    """
+    course_id = course_id or settings.default_course_id
+    audio_format = format or settings.intro_speech_format
+    if audio_format not in AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio format: {audio_format}")
+    found = course_db.get_concept(course_id, concept) or course_db.find_concept_by_title(course_id, concept)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Concept not found: {concept}")
+    try:
+        address = await run_in_threadpool(intro_speech.ensure, found["question"], audio_format, course_id, found["concept_id"])
+    except UpstreamUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Grandpa is temporarily unavailable, please try again: {str(e)}")
+    # The mapping from concept to audio changes when a course is re-ingested, so the redirect is not cached
+    return RedirectResponse(f"/audio-store/{address}.{audio_format}", status_code=307, headers={"Cache-Control": "no-cache"})
+
+@app.get("/audio-store/{name}")
+async def get_stored_audio(name: str):
+    """Serve audio from the content-addressed store; files never change, so they are cached for a year."""
+    address, _, audio_format = name.partition(".")
+    path = intro_speech.store.path(address, audio_format)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return FileResponse(path, media_type=AUDIO_FORMATS[audio_format], headers={
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{address}"',
+    })
+
 @app.get("/")
 async def root():
     """Root endpoint that provides API information."""
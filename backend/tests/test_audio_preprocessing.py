@@ -0,0 +1,71 @@
+import numpy as np
+
+from app import audio_preprocessing
+from app.audio_preprocessing import FRAME_SAMPLES, SAMPLE_RATE, detect_speech_frames, preprocess_audio, select_kept_frames
+from app.config import settings
+
+
+def frames(pattern):
+    return np.array([c == "#" for c in pattern], dtype=bool)
+
+
+def kept(keep):
+    return "".join("#" if k else "." for k in keep)
+
+
+def test_kept_frames_pad_speech_and_shorten_pauses(monkeypatch):
+    # 30 ms frames: one frame of padding, pauses cut to two frames
+    monkeypatch.setattr(settings, "audio_speech_padding_seconds", 0.03)
+    monkeypatch.setattr(settings, "audio_max_silence_seconds", 0.06)
+    assert kept(select_kept_frames(frames("....##.......##...."))) == "...######...####..."
+    assert kept(select_kept_frames(frames("......"))) == "......"
+
+
+def test_short_clips_keep_one_entry_per_frame(monkeypatch):
+    # The padding window (2 * 10 + 1 frames) is longer than the clip
+    monkeypatch.setattr(settings, "audio_speech_padding_seconds", 0.3)
+    for pattern in ("#", "..#", "#....", "...#...#"):
+        keep = select_kept_frames(frames(pattern))
+        assert len(keep) == len(pattern) and keep.all()
+
+
+def tone(seconds, amplitude):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def test_speech_is_detected_above_the_noise_floor(monkeypatch):
+    monkeypatch.setattr(audio_preprocessing, "webrtcvad", None)
+    samples = np.concatenate([tone(0.3, 30), tone(0.3, 8000), tone(0.3, 30)])
+    is_speech = detect_speech_frames(samples)
+    assert len(is_speech) == len(samples) // FRAME_SAMPLES
+    assert not is_speech[:9].any() and is_speech[11:19].all() and not is_speech[-9:].any()
+    assert len(detect_speech_frames(samples[:FRAME_SAMPLES - 1])) == 0
+
+
+def test_preprocessing_trims_silence_and_keeps_quiet_recordings(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_preprocessing, "webrtcvad", None)
+    monkeypatch.setattr(settings, "audio_preprocessing_codec", "flac")
+    monkeypatch.setattr(settings, "audio_speech_padding_seconds", 0.03)
+    encoded = {}
+
+    def encode_pcm(samples, output_path, codec):
+        encoded[output_path] = samples
+        with open(output_path, "wb") as f:
+            f.write(samples.tobytes()[:100])
+
+    monkeypatch.setattr(audio_preprocessing, "encode_pcm", encode_pcm)
+    upload = tmp_path / "turn.webm"
+    upload.write_bytes(b"webm" * 1000)
+
+    recording = np.concatenate([tone(2.0, 30), tone(0.9, 8000), tone(2.0, 30)])
+    monkeypatch.setattr(audio_preprocessing, "decode_to_pcm", lambda path: recording)
+    result = preprocess_audio(str(upload), str(tmp_path / "trimmed"))
+    assert result.output_path == str(tmp_path / "trimmed.flac")
+    assert abs(result.original_seconds - 4.9) < 0.01
+    assert 0.9 <= result.kept_seconds <= 1.0
+    assert len(encoded[result.output_path]) == round(result.kept_seconds * SAMPLE_RATE)
+
+    monkeypatch.setattr(audio_preprocessing, "decode_to_pcm", lambda path: np.zeros(SAMPLE_RATE, dtype=np.int16))
+    quiet = preprocess_audio(str(upload), str(tmp_path / "quiet"))
+    assert quiet.output_path == str(upload) and quiet.kept_seconds == quiet.original_seconds
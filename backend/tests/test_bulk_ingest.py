@@ -0,0 +1,129 @@
+import json
+import shutil
+from types import SimpleNamespace
+
+import fitz
+import pytest
+
+from app import bulk_ingest, pdf_stream, slide_extractor_with_images
+from app.bulk_ingest import BulkIngestor, course_id_for_deck
+from app.course_db import CourseDatabase
+from app.page_rasterizer import PageRasterizer
+from app.slide_index import SlideSearch
+
+CSV = "question_number,concept_title,question,answer\n1,Agents,What is an agent?,\"Perceives, acts\"\n"
+
+
+def make_deck(path, title):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = fitz.open()
+    doc.new_page(width=400, height=300).insert_text((40, 40), title)
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    monkeypatch.setattr(bulk_ingest, "course_db", db)
+    monkeypatch.setattr(slide_extractor_with_images, "course_db", db)
+    monkeypatch.setattr(slide_extractor_with_images, "slide_search", SlideSearch(tmp_path / "slides"))
+    monkeypatch.setattr(bulk_ingest, "concept_search", SimpleNamespace(rebuild=lambda: None))
+    monkeypatch.setattr(pdf_stream, "page_rasterizer", PageRasterizer(tmp_path / "render_cache"))
+
+    calls = []
+    failing = set()
+
+    def generate(text, images=None):
+        calls.append(text.strip())
+        if text.strip() in failing:
+            raise RuntimeError("upstream unavailable")
+        return CSV
+    monkeypatch.setattr(bulk_ingest, "generate_questions_answers", generate)
+
+    root = tmp_path / "decks"
+    make_deck(root / "intro.pdf", "Intro")
+    make_deck(root / "week1" / "agents.pdf", "Agents")
+    make_deck(root / "week1" / "search.pdf", "Search")
+    return SimpleNamespace(db=db, root=root, calls=calls, failing=failing, manifest=tmp_path / "run" / "manifest.json")
+
+
+def ingest(env):
+    return BulkIngestor(env.root, env.manifest, extract_workers=2, generate_workers=2, intro_speech_enabled=False).run()
+
+
+def test_failed_deck_resumes_from_its_last_finished_stage(env):
+    env.failing.add("Search")
+    report = ingest(env)
+    assert report["decks"] == {"found": 3, "ingested": 2, "skipped": 0, "failed": 1, "resumed": 0}
+    assert env.db.has_course("week1_agents") and not env.db.has_course("week1_search")
+    manifest = json.loads(env.manifest.read_text())
+    failed = manifest["decks"]["week1/search.pdf"]
+    assert failed["status"] == "failed" and list(failed["stages"]) == ["extract"]
+
+    env.failing.clear()
+    env.calls.clear()
+    report = ingest(env)
+    # Only the failed deck is generated again, and its extraction is reused
+    assert env.calls == ["Search"]
+    assert report["decks"] == {"found": 3, "ingested": 1, "skipped": 2, "failed": 0, "resumed": 1}
+    assert report["stages"]["extract"]["runs"] == 0
+    assert env.db.get_concept("week1_search", "1")["title"] == "Agents"
+    assert env.db.find_completed_run(json.loads(env.manifest.read_text())["decks"]["week1/search.pdf"]["sha256"])
+
+
+def test_already_ingested_content_is_skipped(env):
+    ingest(env)
+    # A copy of an ingested deck under a new name, with a fresh manifest
+    shutil.copy(env.root / "intro.pdf", env.root / "intro-copy.pdf")
+    env.manifest.unlink()
+    env.calls.clear()
+
+    report = ingest(env)
+    assert env.calls == []
+    assert report["decks"]["skipped"] == 4 and report["decks"]["ingested"] == 0
+    reason = json.loads(env.manifest.read_text())["decks"]["intro-copy.pdf"]["reason"]
+    assert reason == "already ingested as 'intro'"
+
+
+def test_report_and_course_ids(env, tmp_path):
+    report = ingest(env)
+    assert report["pages"] == 3 and report["concepts"] == 3
+    assert report["decks_per_minute"] > 0
+    assert set(report["stages"]) == {"extract", "generate", "store"}
+    assert course_id_for_deck(env.root, env.root / "week1" / "agents.pdf") == "week1_agents"
+    # Stage outputs of stored decks are removed
+    assert list((tmp_path / "run" / "work").iterdir()) == []
+
+
+def test_decks_mapping_to_the_same_course_id_fail(env):
+    make_deck(env.root / "week1_agents.pdf", "Agents again")
+    report = ingest(env)
+    assert report["decks"]["ingested"] == 3 and report["decks"]["failed"] == 1
+    assert report["failed"] == {"week1_agents.pdf": "plan: course ID 'week1_agents' is already used by week1/agents.pdf"}
+    assert "Agents again" not in env.calls
+    assert env.db.find_completed_run(json.loads(env.manifest.read_text())["decks"]["week1/agents.pdf"]["sha256"])
+
+    # Still refused on the next run, while the first deck stays ingested
+    report = ingest(env)
+    assert report["decks"]["failed"] == 1 and report["decks"]["skipped"] == 3
+
+
+def test_decks_named_like_a_course_from_another_deck_fail(env, monkeypatch):
+    env.db.upsert_course("intro", [{"concept_id": "1", "title": "Uploaded", "question": "?", "answer": "!"}],
+                         source_path="uploads/intro.pdf", content_hash="uploaded-deck")
+    report = ingest(env)
+    assert report["failed"] == {"intro.pdf": "plan: course ID 'intro' already belongs to uploads/intro.pdf"}
+    assert env.db.get_concept("intro", "1")["title"] == "Uploaded"
+
+    # A deck whose own content changed replaces its course
+    make_deck(env.root / "week1" / "search.pdf", "Search, revised")
+    assert ingest(env)["decks"]["ingested"] == 1
+
+    # Scripted runs see the failure in the exit status
+    monkeypatch.setattr("sys.argv", ["bulk_ingest", str(env.root), "--manifest", str(env.manifest),
+                                     "--extract-workers", "1", "--no-intro-speech"])
+    with pytest.raises(SystemExit) as exit_status:
+        bulk_ingest.main()
+    assert exit_status.value.code == 1
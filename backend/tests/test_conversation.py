@@ -0,0 +1,135 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import conversation
+from app.config import settings
+from app.conversation import history_window, split_sentences
+
+
+def test_split_sentences_keeps_the_unfinished_rest():
+    sentences, rest = split_sentences("Oh my dear, that is clever! So the agent uses sensors? And then it", 10)
+    assert sentences == ["Oh my dear, that is clever!", "So the agent uses sensors?"]
+    assert rest == "And then it"
+
+
+def test_split_sentences_merges_short_sentences():
+    sentences, rest = split_sentences("Oh. I see. Now tell me about actuators. ", 15)
+    assert sentences == ["Oh. I see. Now tell me about actuators."]
+    assert rest == ""
+
+
+def test_history_window_keeps_the_last_entries():
+    history = "# Header\n" + "".join(
+        f"\n\n--- Conversation at 2025-01-0{day} ---\nUSER: turn {day}\n\nGRANDPA: ok\n--- End of conversation ---"
+        for day in range(1, 5))
+    window = history_window(history, 2)
+    assert "turn 3" in window and "turn 4" in window
+    assert "turn 2" not in window and "# Header" not in window
+    assert history_window(history, 0) == ""
+
+
+@pytest.fixture
+def channel(tmp_path, monkeypatch):
+    """The conversation channel with stubbed transcription, analysis and speech."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "transcription_cache", False)
+    monkeypatch.setattr(settings, "slide_context", False)
+    monkeypatch.setattr(settings, "conversation_sentence_min_chars", 10)
+    monkeypatch.setattr(conversation, "resolve_concept", lambda course_id, concept_id: {
+        "concept_id": concept_id, "title": "Agents", "question": "What is an agent?", "answer": "..."})
+    stub = {"heard": [], "answer": ["An agent perceives ", "its environment. It acts ", "on it too."],
+            "release": threading.Event()}
+    stub["release"].set()
+    monkeypatch.setattr(conversation, "transcribe_speech_bytes",
+                        lambda client, audio: stub["heard"].append(audio) or SimpleNamespace(text="An agent has sensors."))
+
+    def analyze_image(*args, on_delta=None, **kwargs):
+        stub["release"].wait(5)
+        for delta in stub["answer"]:
+            on_delta(delta, 1)
+        return "".join(stub["answer"])
+
+    monkeypatch.setattr(conversation, "analyze_image", analyze_image)
+    monkeypatch.setattr(conversation, "synthesize_speech", lambda client, text, audio_format: f"audio:{text}".encode())
+    app = FastAPI()
+    app.include_router(conversation.router, prefix="/api")
+    with TestClient(app).websocket_connect("/api/conversation?concept_id=1&session_id=learner") as websocket:
+        yield websocket, stub
+
+
+def receive(websocket):
+    message = websocket.receive()
+    return message["bytes"] if message.get("bytes") is not None else json.loads(message["text"])
+
+
+def receive_turn(websocket):
+    messages = []
+    while not messages or not isinstance(messages[-1], dict) or messages[-1]["type"] not in ("turn_complete", "error"):
+        messages.append(receive(websocket))
+    return messages
+
+
+def test_turn_streams_text_then_sentences_in_order(channel):
+    websocket, stub = channel
+    ready = receive(websocket)
+    assert (ready["type"], ready["session_id"], ready["concept"]["title"]) == ("ready", "learner", "Agents")
+
+    websocket.send_bytes(b"webm-1")
+    websocket.send_bytes(b"webm-2")
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    messages = receive_turn(websocket)
+    assert stub["heard"] == [b"webm-1webm-2"]
+    assert messages[0] == {"type": "transcript", "text": "An agent has sensors."}
+    deltas = [m["delta"] for m in messages if isinstance(m, dict) and m["type"] == "feedback_delta"]
+    assert deltas == stub["answer"]
+    assert [m for m in messages if isinstance(m, bytes)] == [b"audio:An agent perceives its environment.",
+                                                          b"audio:It acts on it too."]
+    # Each sentence is spoken only after its text was streamed
+    first_clip = messages.index(b"audio:An agent perceives its environment.")
+    assert messages.index({"type": "feedback_delta", "delta": "its environment. It acts ", "attempt": 1}) < first_clip
+    summary = messages[-1]
+    assert (summary["type"], summary["turn"], summary["audio_clips"]) == ("turn_complete", 1, 2)
+
+
+def test_one_turn_at_a_time_and_cancelled_audio_is_dropped(channel):
+    websocket, stub = channel
+    receive(websocket)
+    websocket.send_bytes(b"discarded")
+    websocket.send_text(json.dumps({"type": "cancel_turn"}))
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    assert receive(websocket)["status"] == 400
+
+    stub["release"].clear()
+    websocket.send_bytes(b"first")
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    websocket.send_bytes(b"second")
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    messages = []
+    while not messages or messages[-1] != {"type": "error", "status": 409,
+                                           "detail": "Grandpa is still answering the previous turn"}:
+        messages.append(receive(websocket))
+    stub["release"].set()
+    assert receive_turn(websocket)[-1]["type"] == "turn_complete"
+
+    # Audio recorded while grandpa answered belongs to the next turn
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    assert receive_turn(websocket)[-1]["turn"] == 2
+    assert stub["heard"] == [b"first", b"second"]
+
+
+def test_oversized_turn_audio_is_rejected(channel, monkeypatch):
+    websocket, stub = channel
+    receive(websocket)
+    monkeypatch.setattr(settings, "conversation_max_turn_audio_bytes", 8)
+    websocket.send_bytes(b"12345")
+    websocket.send_bytes(b"67890")
+    error = receive(websocket)
+    assert (error["type"], error["status"]) == ("error", 413)
+    websocket.send_text(json.dumps({"type": "end_turn"}))
+    receive_turn(websocket)
+    assert stub["heard"] == [b"12345"]
@@ -0,0 +1,28 @@
+from app.core import AUDIO_QUALITY_TIERS, DEFAULT_AUDIO_FORMAT, negotiate_audio_format
+
+
+def test_audio_format_follows_the_clients_preference_order():
+    assert negotiate_audio_format("opus,aac,mp3") == "opus"
+    assert negotiate_audio_format("mp3,opus") == "mp3"
+    # The quality tier does not override a format the client asked for
+    assert negotiate_audio_format("wav,opus", "low") == "wav"
+    assert negotiate_audio_format(" AAC , opus") == "aac"
+
+
+def test_unknown_audio_formats_are_skipped():
+    assert negotiate_audio_format("webm,vorbis,opus,mp3") == "opus"
+    assert negotiate_audio_format(",,flac") == "flac"
+
+
+def test_audio_format_falls_back_to_the_quality_tiers_format():
+    # Legacy clients that send no formats keep getting mp3
+    assert negotiate_audio_format(None, "low") == negotiate_audio_format("", "high") == DEFAULT_AUDIO_FORMAT == "mp3"
+    assert negotiate_audio_format("webm", "low") == AUDIO_QUALITY_TIERS["low"] == "opus"
+    assert negotiate_audio_format("webm", "high") == "flac"
+    assert negotiate_audio_format("webm") == AUDIO_QUALITY_TIERS["standard"]
+
+
+def test_unknown_audio_quality_counts_as_standard():
+    assert negotiate_audio_format("webm", "ultra") == AUDIO_QUALITY_TIERS["standard"]
+    assert negotiate_audio_format("webm", None) == AUDIO_QUALITY_TIERS["standard"]
+    assert negotiate_audio_format("opus", "ultra") == "opus"
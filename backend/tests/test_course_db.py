@@ -0,0 +1,130 @@
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import api
+from app.course_db import CourseDatabase, import_concept_csvs
+
+
+def make_concepts(count):
+    return [{"concept_id": str(i), "title": f"Concept {i}", "question": f"What is {i}?", "answer": f"Answer {i}"}
+            for i in range(1, count + 1)]
+
+
+def test_upsert_and_lookup(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    db.upsert_course("ai", make_concepts(30), page_texts=["Slide one", "Slide two"])
+
+    assert db.get_concept("ai", "7")["title"] == "Concept 7"
+    assert db.get_concept("ai", "07")["title"] == "Concept 7"
+    assert db.get_concept("ai", "31") is None
+    assert db.get_concept("missing", "1") is None
+    assert db.has_course("ai") and not db.has_course("missing")
+    assert [c["concept_id"] for c in db.get_concepts("ai", offset=10, limit=3)] == ["11", "12", "13"]
+    assert db.get_source_pages("ai") == ["Slide one", "Slide two"]
+    assert db.list_courses() == [{"course_id": "ai", "title": "ai", "concept_count": 30}]
+    assert db.connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_writes_change_the_version(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    db.upsert_course("ai", make_concepts(3))
+    first, _ = db.version()
+    db.upsert_course("ai", make_concepts(2))
+    second, _ = db.version()
+
+    assert first != second
+    assert len(db.get_concepts("ai")) == 2
+
+
+def test_ingestion_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    failed = db.start_ingestion_run("deck.pdf", "abc")
+    db.finish_ingestion_run(failed, error="boom")
+    assert db.find_completed_run("abc") is None
+
+    run_id = db.start_ingestion_run("deck.pdf", "abc")
+    db.upsert_course("deck", make_concepts(1))
+    db.finish_ingestion_run(run_id, course_id="deck", concept_count=1)
+    assert db.find_completed_run("abc")["course_key"] == "deck"
+
+
+def test_import_csv_and_concurrent_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    (tmp_path / "ai_qa.csv").write_text(
+        "```csv\nquestion_number,concept_title,question,answer\n1,Agents,What is an agent?,\"Perceives, acts\"\n```\n",
+        encoding="utf-8")
+    db = CourseDatabase(tmp_path / "courses.db")
+    assert import_concept_csvs(db, tmp_path) == 1
+
+    results = []
+
+    def read():
+        results.append(db.get_concept("ai", "1")["answer"])
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["Perceives, acts"] * 8
+
+
+def catalog_client(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    monkeypatch.setattr(api, "course_db", db)
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    return db, TestClient(app)
+
+
+def test_concepts_endpoint_pages_with_cursors_and_selects_fields(tmp_path, monkeypatch):
+    db, client = catalog_client(tmp_path, monkeypatch)
+    db.upsert_course("ai", make_concepts(5))
+
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2, "fields": "concept_id,title"}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/courses/ai/concepts", params=params).json()
+        assert all(set(item) == {"concept_id", "title"} for item in page["items"])
+        ids += [item["concept_id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == ["1", "2", "3", "4", "5"]
+
+    assert client.get("/api/courses/ai/concepts", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/courses/ai/concepts", params={"cursor": api.encode_cursor(-1)}).status_code == 400
+    assert client.get("/api/courses/ai/concepts", params={"fields": "title,secret"}).status_code == 400
+    assert client.get("/api/courses/missing/concepts").status_code == 404
+
+
+def test_catalog_endpoints_answer_conditional_requests(tmp_path, monkeypatch):
+    db, client = catalog_client(tmp_path, monkeypatch)
+    db.upsert_course("ai", make_concepts(3))
+
+    for path in ("/api/courses", "/api/courses/ai/concepts"):
+        first = client.get(path)
+        assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+        etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+        repeated = client.get(path, headers={"If-None-Match": etag})
+        assert repeated.status_code == 304 and repeated.headers["ETag"] == etag and not repeated.content
+        assert client.get(path, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    # Another page or field selection of the same catalog has its own tag
+    etag = client.get("/api/courses/ai/concepts").headers["ETag"]
+    other = client.get("/api/courses/ai/concepts", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+    # A catalog change invalidates the tags
+    db.upsert_course("search", make_concepts(2))
+    changed = client.get("/api/courses/ai/concepts", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [course["course_id"] for course in client.get("/api/courses").json()] == ["ai", "search"]
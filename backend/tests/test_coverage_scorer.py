@@ -0,0 +1,45 @@
+from app.config import settings
+from app.coverage_scorer import coverage_scorer, split_key_points, user_turns
+from app.evaluator import Evaluator
+
+ANSWER = ("An intelligent agent is anything that perceives its environment through sensors "
+          "and acts upon the environment through actuators. A rational agent chooses the action "
+          "that maximizes its expected performance measure.")
+
+
+def history(*turns):
+    return "# Learning Companion Conversation History\n" + "".join(
+        f"\n\n--- Conversation at 2025-01-01 10:00:0{i} ---\nUSER: {turn}\n\nGRANDPA: Tell me more, dear.\n--- End of conversation ---"
+        for i, turn in enumerate(turns))
+
+
+def test_key_points_and_user_turns():
+    assert len(split_key_points(ANSWER)) == 2
+    assert user_turns(history("first try", "second try")) == ["first try", "second try"]
+
+
+def test_clear_cases_are_confident():
+    silent = coverage_scorer.score(ANSWER, history("um"))
+    assert (silent.score, silent.confident) == (0.0, True)
+
+    off_topic = coverage_scorer.score(ANSWER, history("I went to the football match with my cousins yesterday"))
+    assert off_topic.confident and off_topic.score < 15
+
+    complete = coverage_scorer.score(ANSWER, history(
+        "An intelligent agent is anything that perceives its environment through sensors and acts on it through actuators.",
+        "A rational agent picks the action that maximizes the expected performance measure."))
+    assert complete.confident and complete.score >= 85
+
+
+def test_partial_explanations_escalate_to_the_llm(monkeypatch):
+    monkeypatch.setattr(settings, "prescore_audit_rate", 0.0)
+    evaluator = Evaluator()
+    llm_calls = []
+    monkeypatch.setattr(evaluator, "evaluate_with_llm", lambda concept, chat_history: llm_calls.append(1) or 55.0)
+    monkeypatch.setattr(evaluator, "record", lambda *args: None)
+    concept = {"title": "Intelligent agent", "description": ANSWER}
+
+    assert evaluator.evaluate(concept, history("um")) == 0.0
+    assert evaluator.evaluate(concept, history("An agent perceives its environment through sensors.")) == 55.0
+    assert len(llm_calls) == 1
+    assert evaluator.snapshot()["avoided_fraction"] == 0.5
@@ -0,0 +1,85 @@
+import io
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+from app import api
+from app.drawing_tracker import DrawingTracker, compare_fingerprints, fingerprint
+
+
+def test_learners_without_a_session_never_share_drawing_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracked = []
+
+    def process_follow_up(client, audio_path, image_path, *args, session_id=None, **kwargs):
+        tracked.append(session_id)
+        output_path = api.scratch_space.path("response.mp3")
+        with open(output_path, "wb") as f:
+            f.write(b"ID3audio")
+        return "Tell me more!", output_path, "An agent has sensors."
+
+    monkeypatch.setattr(api, "process_follow_up", process_follow_up)
+    monkeypatch.setattr(api, "resolve_concept", lambda course_id, concept_id: {"title": "Agents", "answer": "..."})
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    client = TestClient(app)
+
+    def turn(**data):
+        return client.post("/api/ask-follow-up", data={"concept_id": "1", **data},
+                           files={"audio_file": ("a.webm", b"webm-audio", "audio/webm"),
+                                  "notepad_image": ("n.webp", b"webp-image", "image/webp")}).json()
+
+    first, second = turn(), turn()
+    # Each learner gets a session of their own; drawings of a turn without one are not compared
+    assert first["session_id"] != second["session_id"]
+    assert tracked == [None, None]
+    assert turn(session_id=first["session_id"])["session_id"] == first["session_id"]
+    assert tracked[-1] == first["session_id"]
+
+
+def blackboard(*labels):
+    """A notepad drawing with a box and arrow, plus a short label at each (x, y)."""
+    image = Image.new("RGB", (1200, 800), (51, 51, 51))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((200, 200, 500, 400), outline="white", width=4)
+    draw.line((500, 300, 800, 300), fill="white", width=4)
+    for x, y in labels:
+        draw.line((x, y, x + 40, y - 20, x + 80, y), fill="white", width=3)
+    return image
+
+
+def reencoded(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+def test_reencoding_is_unchanged_but_a_new_label_is_a_region():
+    before = fingerprint(reencoded(blackboard(), 80))
+    assert compare_fingerprints(before, fingerprint(reencoded(blackboard(), 60))).kind == "unchanged"
+
+    labelled = compare_fingerprints(before, fingerprint(reencoded(blackboard((900, 600)), 80)))
+    assert labelled.kind == "region"
+    left, top, right, bottom = labelled.bbox
+    assert left < 900 < 980 < right and top < 580 < 600 < bottom
+    assert right - left < 200 and bottom - top < 100
+
+    everywhere = blackboard(*((x, y) for x in range(50, 1150, 150) for y in range(100, 800, 120)))
+    assert compare_fingerprints(before, fingerprint(everywhere)).kind == "changed"
+    assert compare_fingerprints(before, fingerprint(blackboard().resize((600, 400)))).kind == "changed"
+
+
+def test_tracker_compares_with_the_remembered_drawing_per_session():
+    tracker = DrawingTracker(max_sessions=2)
+    drawing = fingerprint(blackboard())
+    assert tracker.compare("a", drawing).kind == "new"
+    tracker.remember("a", drawing)
+    assert tracker.compare("a", drawing).kind == "unchanged"
+    assert tracker.compare("b", drawing).kind == "new"
+
+    tracker.remember("b", drawing)
+    tracker.remember("c", drawing)
+    assert tracker.compare("a", drawing).kind == "new"  # least recently used, evicted
+    tracker.forget("c")
+    assert tracker.compare("c", drawing).kind == "new"
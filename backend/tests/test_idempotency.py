@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import api
+from app.config import settings
+from app.idempotency import IdempotencyCache, IdempotencyConflictError
+from app.transcription_cache import TranscriptionCache, transcription_key
+
+
+def test_concurrent_retries_share_one_execution():
+    cache = IdempotencyCache(ttl_seconds=60, max_bytes=10**6)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"feedback": "ok"}
+
+    async def scenario():
+        first, retry = await asyncio.gather(cache.run("k", "f", compute), cache.run("k", "f", compute))
+        later = await cache.run("k", "f", compute)
+        return first, retry, later
+
+    first, retry, later = asyncio.run(scenario())
+    assert calls == [1]
+    assert first == ({"feedback": "ok"}, False)
+    assert retry == later == ({"feedback": "ok"}, True)
+    assert cache.snapshot()["joined_in_flight"] == 1 and cache.snapshot()["replayed"] == 1
+
+
+def test_conflicts_failures_and_expiry():
+    now = [0.0]
+    cache = IdempotencyCache(ttl_seconds=10, max_bytes=10**6, clock=lambda: now[0])
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    async def succeed():
+        return {"feedback": "ok"}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.run("k", "f", fail)
+        # Errors are not stored: the retry runs
+        assert await cache.run("k", "f", succeed) == ({"feedback": "ok"}, False)
+        with pytest.raises(IdempotencyConflictError):
+            await cache.run("k", "other request", succeed)
+        now[0] = 11
+        assert await cache.run("k", "other request", succeed) == ({"feedback": "ok"}, False)
+
+    asyncio.run(scenario())
+
+
+def test_same_recording_is_transcribed_once(tmp_path, monkeypatch):
+    cache = TranscriptionCache(tmp_path)
+    calls = []
+
+    def transcribe():
+        calls.append(1)
+        return "an agent perceives its environment"
+
+    threads = [threading.Thread(target=cache.transcribe, args=("a" * 64, transcribe)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert TranscriptionCache(tmp_path).get("a" * 64) == "an agent perceives its environment"
+
+    # Preprocessing changes what is sent, so it changes the key
+    key = transcription_key("a" * 64)
+    monkeypatch.setattr(settings, "audio_preprocessing", not settings.audio_preprocessing)
+    assert transcription_key("a" * 64) != key
+
+
+def test_retried_follow_up_is_answered_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    def process_follow_up(client, audio_path, image_path, *args, **kwargs):
+        calls.append(audio_path)
+        output_path = tmp_path / f"response_{len(calls)}.mp3"
+        output_path.write_bytes(b"ID3audio")
+        return "Oh my, tell me more!", str(output_path), "An agent has sensors."
+
+    monkeypatch.setattr(api, "process_follow_up", process_follow_up)
+    monkeypatch.setattr(api, "resolve_concept", lambda course_id, concept_id: {"title": "Agents", "answer": "..."})
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    client = TestClient(app)
+
+    def post(key, audio=b"webm-audio"):
+        return client.post("/api/ask-follow-up", data={"concept_id": "1"}, headers={"Idempotency-Key": key},
+                           files={"audio_file": ("a.webm", audio, "audio/webm"),
+                                  "notepad_image": ("n.webp", b"webp-image", "image/webp")})
+
+    first = post("turn-1")
+    retry = post("turn-1")
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true" and "Idempotent-Replayed" not in first.headers
+    assert len(calls) == 1
+    assert (tmp_path / "conversation_history.txt").read_text().count("USER: An agent has sensors.") == 1
+
+    assert post("turn-1", audio=b"different audio").status_code == 422
+    assert post("turn-2").status_code == 200 and len(calls) == 2
@@ -0,0 +1,68 @@
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from app.config import settings
+from app.image_optimizer import (LOW_DETAIL_MAX_SIDE, LOW_DETAIL_TOKENS, choose_scale, estimate_stroke_width,
+                                 estimate_vision_tokens, ink_mask, prepare_image)
+
+BLACKBOARD = (51, 51, 51)
+
+
+def sketch(box, stroke_width, size=(1200, 800)):
+    """A blackboard with a grid of chalk lines filling box."""
+    image = Image.new("RGB", size, BLACKBOARD)
+    draw = ImageDraw.Draw(image)
+    left, top, right, bottom = box
+    for y in range(top, bottom + 1, 40):
+        draw.line((left, y, right, y), fill="white", width=stroke_width)
+    for x in range(left, right + 1, 80):
+        draw.line((x, top, x, bottom), fill="white", width=stroke_width)
+    return image
+
+
+def decoded(optimized):
+    data = base64.b64decode(optimized.image_url.split(",", 1)[1])
+    return Image.open(io.BytesIO(data))
+
+
+def test_scale_keeps_strokes_and_text_readable():
+    # Thick strokes shrink until they reach the minimum stroke width ...
+    assert abs(choose_scale(4000, 3000, 4 * settings.notepad_min_stroke_px) - 0.25) < 1e-9
+    # ... but the drawing keeps at least notepad_min_side pixels on its longest side
+    assert choose_scale(1000, 600, 10 * settings.notepad_min_stroke_px) * 1000 == settings.notepad_min_side
+    # Thin strokes are never upscaled, and small drawings never enlarged
+    assert choose_scale(1200, 800, 1.0) == 1.0
+    assert choose_scale(300, 200, 10 * settings.notepad_min_stroke_px) == 1.0
+    # Just above the low-detail size snaps to it; clearly above stays
+    assert choose_scale(600, 400, 1.0) * 600 == LOW_DETAIL_MAX_SIDE
+    assert choose_scale(700, 400, 1.0) == 1.0
+
+
+def test_ink_is_cropped_with_a_margin_and_strokes_measured():
+    image = sketch((300, 200, 700, 440), 6)
+    assert ink_mask(image).getbbox() == (298, 198, 704, 444)
+    assert 5 <= estimate_stroke_width(ink_mask(image)) <= 8
+
+    optimized = prepare_image(image)
+    margin = settings.notepad_crop_margin
+    # 406x246 of ink plus the margin fits low detail unscaled
+    assert (optimized.width, optimized.height) == (406 + 2 * margin, 246 + 2 * margin)
+    assert decoded(optimized).size == (optimized.width, optimized.height)
+    assert optimized.detail == "low" and optimized.optimized_tokens == LOW_DETAIL_TOKENS
+    assert optimized.original_tokens == estimate_vision_tokens(1200, 800, "high")
+
+
+def test_detail_follows_the_size_that_keeps_strokes_readable():
+    # Thin strokes filling the canvas cannot shrink to 512px: high detail, only cropped
+    dense = prepare_image(sketch((40, 40, 1160, 760), 2))
+    assert (dense.width, dense.height, dense.detail) == (1170, 770, "high")
+    assert dense.optimized_tokens == estimate_vision_tokens(1170, 770, "high")
+
+    # Thick strokes over the canvas shrink to the minimum side and go low detail
+    bold = prepare_image(sketch((40, 40, 1160, 760), 12))
+    assert max(bold.width, bold.height) == LOW_DETAIL_MAX_SIDE and bold.detail == "low"
+
+    blank = prepare_image(Image.new("RGB", (1200, 800), BLACKBOARD))
+    assert (blank.width, blank.height, blank.detail) == (64, 43, "low")
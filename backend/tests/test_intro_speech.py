@@ -0,0 +1,51 @@
+import pytest
+
+from app import intro_speech as intro_speech_module
+from app.course_db import CourseDatabase
+from app.intro_speech import AudioStore, IntroSpeech, speech_address
+
+
+@pytest.fixture
+def speech(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    db.upsert_course("ai", [
+        {"concept_id": "1", "title": "Agents", "question": "What is an agent?", "answer": "..."},
+        {"concept_id": "2", "title": "Rationality", "question": "What makes an agent rational?", "answer": "..."},
+    ])
+    monkeypatch.setattr(intro_speech_module, "course_db", db)
+    spoken = []
+
+    def fake_synthesize(client, text, audio_format):
+        spoken.append(text)
+        return f"RIFF {text}".encode("utf-8")
+
+    monkeypatch.setattr(intro_speech_module, "synthesize_speech", fake_synthesize)
+    service = IntroSpeech(AudioStore(tmp_path / "store"))
+    service._client = object()
+    return service, spoken
+
+
+def test_addresses_are_stable_and_input_specific():
+    assert speech_address("What is an agent?", "wav") == speech_address(" What is an agent? ", "wav")
+    assert speech_address("What is an agent?", "wav") != speech_address("What is an agent?", "mp3")
+    assert speech_address("What is an agent?", "wav") != speech_address("What is a robot?", "wav")
+
+
+def test_synthesizes_each_concept_once(speech):
+    service, spoken = speech
+
+    assert service.synthesize_course("ai") == {"synthesized": 2, "stored": 0, "failed": 0}
+    assert service.synthesize_course("ai") == {"synthesized": 0, "stored": 2, "failed": 0}
+    assert spoken == ["What is an agent?", "What makes an agent rational?"]
+
+    address = service.ensure("What is an agent?", "wav")
+    assert service.store.path(address, "wav").read_bytes() == b"RIFF What is an agent?"
+    assert len(spoken) == 2
+
+
+def test_store_rejects_malformed_addresses(tmp_path):
+    store = AudioStore(tmp_path)
+    assert store.path("../../etc/passwd", "wav") is None
+    assert store.path("a" * 64, "exe") is None
+    assert store.path("a" * 64, "wav") == tmp_path / "aa" / f"{'a' * 64}.wav"
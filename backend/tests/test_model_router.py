@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+from app import core
+from app.config import settings
+from app.model_router import ModelRouter, classify_analysis
+from app.upstream import UpstreamLatency, upstream
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def completion(prompt_tokens, completion_tokens):
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            prompt_tokens_details=None, completion_tokens_details=None)
+    return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=SimpleNamespace(content="Tell me more!"))])
+
+
+class RecordingClient:
+    """OpenAI client stand-in that remembers the model of every chat completion."""
+
+    def __init__(self):
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create(self, model, messages, **kwargs):
+        self.models.append(model)
+        return completion(1200, 80)
+
+
+def test_turns_are_classified_from_local_signals():
+    short, long = "An agent perceives.", " ".join(["word"] * 150)
+    medium = " ".join(["word"] * 50)
+    assert classify_analysis(short, "changed", False)[0] == "easy"
+    assert classify_analysis(medium, "unchanged", False)[0] == "easy"
+    assert classify_analysis(medium, "region", False)[0] == "hard"
+    assert classify_analysis(long, "unchanged", False)[0] == "hard"
+    assert classify_analysis(short, "unchanged", True) == ("hard", "final summary turn")
+
+
+def test_routing_modes_and_latency_switch(monkeypatch):
+    clock = FakeClock()
+    router = ModelRouter(latency=UpstreamLatency(alpha=0.5, max_age=60, clock=clock))
+    monkeypatch.setattr(settings, "model_routing", "off")
+    assert router.route_analysis("gpt-4o", "hi", "unchanged", False).model == "gpt-4o"
+
+    monkeypatch.setattr(settings, "model_routing", "on")
+    easy = router.route_analysis("gpt-4o", "hi", "unchanged", False)
+    assert (easy.model, easy.alternative) == ("gpt-4o-mini", "gpt-4o")
+    assert router.route_analysis("gpt-4o", "hi", "unchanged", True).model == "gpt-4o"
+
+    # The big model is congested and the small one answers quickly: hard turns go small
+    router.latency.observe("analysis", "gpt-4o", 20.0)
+    router.latency.observe("analysis", "gpt-4o-mini", 2.0)
+    switched = router.route_analysis("gpt-4o", "hi", "unchanged", True)
+    assert switched.model == "gpt-4o-mini" and "averages 20.0s" in switched.reason
+    # ... until the observations are stale
+    clock.now += 61
+    assert router.route_analysis("gpt-4o", "hi", "unchanged", True).model == "gpt-4o"
+    assert router.snapshot()["operations"]["analysis"]["latency_switches"] == 1
+
+
+def test_shadow_mode_keeps_the_default_and_prices_the_alternative(monkeypatch):
+    router = ModelRouter(latency=UpstreamLatency())
+    monkeypatch.setattr(core, "model_router", router)
+    monkeypatch.setattr(upstream, "ledger", None)
+    monkeypatch.setattr(settings, "model_routing", "shadow")
+    router.latency.observe("analysis", "gpt-4o-mini", 1.5)
+    client = RecordingClient()
+
+    core.analyze_image(client, "An agent perceives its environment.", None, "...", "Agents", "", False,
+                       drawing_change="unchanged")
+    assert client.models == ["gpt-4o"]
+    stats = router.snapshot()["operations"]["analysis"]
+    assert (stats["calls"], stats["easy"], stats["off_default"]) == (1, 1, 0)
+    # Same tokens at gpt-4o-mini prices
+    assert stats["cost_usd"] == round((1200 * 2.50 + 80 * 10.00) / 1e6, 6)
+    assert stats["alternative_cost_usd"] == round((1200 * 0.15 + 80 * 0.60) / 1e6, 6)
+    assert stats["alternative_wall_seconds"] == 1.5
+
+    monkeypatch.setattr(settings, "model_routing", "on")
+    core.analyze_image(client, "An agent perceives its environment.", None, "...", "Agents", "", False,
+                       drawing_change="unchanged")
+    assert client.models == ["gpt-4o", "gpt-4o-mini"]
+    assert router.snapshot()["operations"]["analysis"]["off_default"] == 1
@@ -0,0 +1,46 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.openai_clients import ClientRegistry
+
+
+class ModelsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between requests
+
+    def do_GET(self):
+        body = json.dumps({"object": "list", "data": []}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ModelsHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/v1"
+    httpd.shutdown()
+
+
+def test_shared_client_reuses_warm_connection(server):
+    registry = ClientRegistry(api_key="sk-test", base_url=server)
+    assert registry.sync() is registry.sync()
+
+    assert registry.warm_up(1) == 1
+    for _ in range(3):
+        registry.sync().with_options(max_retries=0).models.list()
+
+    stats = registry.stats.snapshot()
+    assert stats["requests"] == 4
+    assert stats["new_connections"] == 1
+    assert stats["reuse_rate"] == 0.75
+    registry.close()
@@ -0,0 +1,72 @@
+import fitz
+import pytest
+
+from app import page_rasterizer
+from app.config import settings
+from app.page_rasterizer import PageImage, PageRasterizer, render_pool, shutdown_render_pool
+
+
+def make_deck(path):
+    """Page 0: text only, pages 1 and 2: box-and-arrow diagrams drawn as vector paths."""
+    doc = fitz.open()
+    doc.new_page(width=400, height=300).insert_text((40, 40), "Learning outcomes")
+    for y in (100, 140):
+        page = doc.new_page(width=400, height=300)
+        for x in (40, 160, 280):
+            page.draw_rect(fitz.Rect(x, y, x + 80, y + 50))
+            page.draw_line((x + 80, y + 25), (x + 120, y + 25))
+        page.draw_circle((200, y + 120), 30)
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture
+def deck(tmp_path):
+    path = tmp_path / "deck.pdf"
+    make_deck(str(path))
+    return str(path)
+
+
+def test_renders_only_diagram_pages_and_caches(tmp_path, deck, monkeypatch):
+    monkeypatch.setattr(settings, "raster_workers", 2)
+    rasterizer = PageRasterizer(tmp_path / "cache")
+
+    images = rasterizer.collect(deck)
+    assert [image.page_number for image in images] == [1, 2]
+    assert all(image.source == "render" for image in images)
+    assert rasterizer.last_stats["rendered"] == 2
+
+    again = rasterizer.collect(deck)
+    assert rasterizer.last_stats["cache_hits"] == 2
+    assert rasterizer.last_stats["rendered"] == 0
+    assert [image.png for image in again] == [image.png for image in images]
+
+
+def test_one_spawned_render_pool_and_none_inside_pool_workers(tmp_path, deck, monkeypatch):
+    monkeypatch.setattr(settings, "raster_workers", 2)
+    shutdown_render_pool()
+    try:
+        pool = render_pool()
+        assert pool is render_pool()
+        assert pool._mp_context.get_start_method() == "spawn"
+        PageRasterizer(tmp_path / "cache").collect(deck)
+        assert render_pool() is pool
+
+        # An extraction worker of bulk ingestion renders in its own process
+        monkeypatch.setattr(page_rasterizer, "_in_pool_worker", True)
+        assert render_pool() is None
+        rasterizer = PageRasterizer(tmp_path / "other-cache")
+        assert [image.page_number for image in rasterizer.collect(deck)] == [1, 2]
+        assert rasterizer.last_stats["rendered"] == 2
+    finally:
+        shutdown_render_pool()
+
+
+def test_fit_budget_prefers_renders_and_skips_what_does_not_fit():
+    def image(page, width, source, priority=0.0):
+        return PageImage(page, b"", width, width * 3 // 4, source, priority)
+
+    images = [image(0, 200, "embedded"), image(1, 1024, "render", 5.0), image(2, 1024, "render", 9.0)]
+    # 765 tokens per render, 255 for the small embedded image
+    selected = PageRasterizer.fit_budget(images, token_budget=1100, max_images=10)
+    assert [image.page_number for image in selected] == [0, 2]
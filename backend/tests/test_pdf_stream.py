@@ -0,0 +1,133 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import fitz
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.page_rasterizer import PageRasterizer
+from app.pdf_stream import MemoryGuard, MemoryLimitError, iter_pdf_pages
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PAGES = 30
+SIDE = 1400  # 5.9 MB of RGB pixels per page, about 175 MB for the deck
+
+# Walks the deck in a fresh process and reports RSS before and the peak after, in KB.
+# VmHWM rather than ru_maxrss, which also counts the forked parent's pages from before exec.
+MEASURE = """
+import json, re, sys
+from app.page_rasterizer import PageRasterizer
+from app.pdf_stream import current_rss_bytes, iter_pdf_pages
+deck, spill, cache = sys.argv[1:4]
+before = current_rss_bytes() // 1024
+images = 0
+for page in iter_pdf_pages(deck, spill, rasterizer=PageRasterizer(cache)):
+    images += sum(len(image.png) > 0 for image in page.images)
+with open("/proc/self/status") as f:
+    peak = int(re.search(r"VmHWM:\\s+(\\d+) kB", f.read()).group(1))
+print(json.dumps({"before_kb": before, "peak_kb": peak, "images": images}))
+"""
+
+# Ingests the deck in a fresh process against a stub client that serializes the request
+# like the HTTP client would, and reports peak RSS and what was sent.
+MEASURE_INGESTION = """
+import json, re, sys
+from types import SimpleNamespace
+from app import slide_extractor_with_images as extractor
+from app.pdf_stream import current_rss_bytes
+sent = {}
+def create(model, messages, **kwargs):
+    body = json.dumps({"model": model, "messages": messages})
+    sent.update(request_bytes=len(body), images=sum(part["type"] == "image_url" for part in messages[1]["content"]))
+    answer = 'question_number,concept_title,question,answer\\n"1","Scanned slides","What is shown?","Noise."'
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+stub.with_options = lambda **kwargs: stub
+extractor.client = stub
+before = current_rss_bytes() // 1024
+concepts = extractor.extract_key_concepts_and_generate_qa(sys.argv[1])
+with open("/proc/self/status") as f:
+    peak = int(re.search(r"VmHWM:\\s+(\\d+) kB", f.read()).group(1))
+print(json.dumps(dict(sent, before_kb=before, peak_kb=peak, concepts=concepts)))
+"""
+
+
+def make_scanned_deck(path, pages=PAGES, side=SIDE):
+    """Every page is one full-page photo-like image (noise, so its PNG is as large as its pixels)."""
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for number in range(pages):
+        pixels = rng.integers(0, 256, (side, side, 3), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csRGB, side, side, pixels.tobytes(), False)
+        page = doc.new_page(width=720, height=720)
+        page.insert_image(page.rect, stream=pix.tobytes("jpeg", jpg_quality=60))
+        page.insert_text((40, 40), f"Scanned slide {number}")
+    doc.save(path)
+    doc.close()
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="peak RSS is read from /proc")
+def test_peak_memory_does_not_grow_with_the_deck(tmp_path):
+    deck = tmp_path / "scanned.pdf"
+    make_scanned_deck(str(deck))
+    # Every page fits the budget, so all images go through extraction
+    env = dict(os.environ, SLIDE_IMAGE_TOKEN_BUDGET="1000000", SLIDE_IMAGE_MAX_COUNT="1000", PYTHONPATH=str(BACKEND_DIR))
+    result = subprocess.run([sys.executable, "-c", MEASURE, str(deck), str(tmp_path / "spill"), str(tmp_path / "cache")],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["images"] == PAGES
+    raw_mb = PAGES * SIDE * SIDE * 3 / 2**20
+    growth_mb = (report["peak_kb"] - report["before_kb"]) / 1024
+    # Holding the deck's images would take raw_mb; streaming needs a few pages plus MuPDF's bounded cache
+    assert growth_mb < raw_mb / 2
+    assert len(list((tmp_path / "spill").iterdir())) == PAGES
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="peak RSS is read from /proc")
+def test_ingestion_memory_is_bounded_by_the_prompt_image_budget(tmp_path):
+    deck = tmp_path / "scanned.pdf"
+    make_scanned_deck(str(deck))
+    budget_mb = 24
+    env = dict(os.environ, SLIDE_IMAGE_TOKEN_BUDGET="1000000", SLIDE_IMAGE_MAX_COUNT="1000", PYTHONPATH=str(BACKEND_DIR),
+               PDF_PROMPT_IMAGES_MAX_MB=str(budget_mb),
+               COURSE_DB_PATH=str(tmp_path / "courses.db"), COURSE_DB_AUTO_IMPORT="false", USAGE_DB_PATH=str(tmp_path / "usage.db"),
+               INTRO_SPEECH_PREGENERATION="false", OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "sk-test")
+    result = subprocess.run([sys.executable, "-c", MEASURE_INGESTION, str(deck)],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["concepts"] == 1
+    assert 0 < report["images"] < PAGES
+    assert report["request_bytes"] < (budget_mb + 1) * 2**20
+    # The request holds the budgeted images a few times over (bytes, base64, JSON body), never the deck
+    growth_mb = (report["peak_kb"] - report["before_kb"]) / 1024
+    assert growth_mb < 4 * budget_mb + 64
+    assert growth_mb < PAGES * SIDE * SIDE * 3 / 2**20
+
+
+def test_pages_are_yielded_in_order_with_their_images(tmp_path):
+    deck = tmp_path / "scanned.pdf"
+    make_scanned_deck(str(deck), pages=3, side=200)
+    pages = list(iter_pdf_pages(str(deck), tmp_path / "spill", rasterizer=PageRasterizer(tmp_path / "cache")))
+
+    assert [page.page_number for page in pages] == [0, 1, 2]
+    assert "Scanned slide 1" in pages[1].text
+    assert all(len(page.images) == 1 and isinstance(page.images[0].payload, Path) for page in pages)
+    assert pages[2].images[0].png.startswith(b"\x89PNG")
+
+
+def test_guard_stops_extraction_above_the_limit(tmp_path, monkeypatch):
+    deck = tmp_path / "scanned.pdf"
+    make_scanned_deck(str(deck), pages=2, side=100)
+    monkeypatch.setattr(settings, "pdf_extraction_max_rss_mb", 1)
+    with pytest.raises(MemoryLimitError):
+        list(iter_pdf_pages(str(deck), tmp_path / "spill", rasterizer=PageRasterizer(tmp_path / "cache")))
+
+    guard = MemoryGuard(limit_bytes=0)
+    guard.check()
+    assert guard.peak_bytes > 0
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+
+import fitz
+import pytest
+
+from app import pdf_uploads
+from app.config import settings
+from app.pdf_uploads import ResumableUploads, UploadRejectedError, safe_pdf_name, store_upload
+
+
+def make_pdf(pages=3):
+    doc = fitz.open()
+    for number in range(pages):
+        doc.new_page().insert_text((72, 72), f"Slide {number + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+async def chunked(data, size=1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_uploads, "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+def test_safe_pdf_name():
+    assert safe_pdf_name("../../etc/Cloud Systems_2.pdf") == "Cloud Systems_2.pdf"
+    assert safe_pdf_name("C:\\decks\\a;b.PDF") == "a_b.pdf"
+    with pytest.raises(UploadRejectedError):
+        safe_pdf_name("notes.txt")
+
+
+def test_store_upload_hashes_and_counts_pages(upload_dir):
+    data = make_pdf(pages=3)
+    stored = asyncio.run(store_upload(chunked(data), "deck.pdf"))
+
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert stored.pages == 3
+    assert stored.path.read_bytes() == data
+    assert [path.name for path in upload_dir.iterdir()] == ["deck.pdf"]
+
+
+def test_store_upload_aborts_at_size_limit(upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_bytes", 1500)
+    consumed = []
+
+    async def endless():
+        while True:
+            consumed.append(1)
+            yield b"%PDF-" + b"x" * 995
+
+    with pytest.raises(UploadRejectedError) as error:
+        asyncio.run(store_upload(endless(), "deck.pdf"))
+    assert error.value.status_code == 413
+    assert len(consumed) == 2
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_store_upload_rejects_non_pdf_and_too_many_pages(upload_dir, monkeypatch):
+    with pytest.raises(UploadRejectedError):
+        asyncio.run(store_upload(chunked(b"GIF89a..."), "deck.pdf"))
+    monkeypatch.setattr(settings, "upload_max_pages", 2)
+    with pytest.raises(UploadRejectedError) as error:
+        asyncio.run(store_upload(chunked(make_pdf(pages=3)), "deck.pdf"))
+    assert error.value.status_code == 413
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_resumable_upload_survives_restart(upload_dir):
+    data = make_pdf(pages=2)
+    uploads = ResumableUploads(upload_dir / ".partial")
+    session = uploads.create("big deck.pdf", len(data))
+    upload_id = session["upload_id"]
+    half = len(data) // 2
+
+    asyncio.run(uploads.append(upload_id, 0, chunked(data[:half])))
+    with pytest.raises(UploadRejectedError) as error:
+        asyncio.run(uploads.append(upload_id, 0, chunked(data[:half])))
+    assert error.value.status_code == 409
+
+    # A new instance (e.g. after a restart) picks up from the stored offset
+    restarted = ResumableUploads(upload_dir / ".partial")
+    offset = restarted.status(upload_id)["offset"]
+    assert offset == half
+    asyncio.run(restarted.append(upload_id, offset, chunked(data[offset:])))
+    stored = restarted.complete(upload_id, expected_sha256=hashlib.sha256(data).hexdigest())
+
+    assert stored.path.read_bytes() == data
+    assert stored.course_id == "big deck"
+    with pytest.raises(UploadRejectedError):
+        restarted.status(upload_id)
+
+
+def test_resumable_upload_alternating_between_workers(upload_dir):
+    data = make_pdf(pages=2)
+    worker_a, worker_b = ResumableUploads(upload_dir / ".partial"), ResumableUploads(upload_dir / ".partial")
+    upload_id = worker_a.create("deck.pdf", len(data))["upload_id"]
+    third = len(data) // 3
+
+    asyncio.run(worker_a.append(upload_id, 0, chunked(data[:third])))
+    asyncio.run(worker_b.append(upload_id, third, chunked(data[third:2 * third])))
+    asyncio.run(worker_a.append(upload_id, 2 * third, chunked(data[2 * third:])))
+    # Worker A's running hash missed B's chunk; it is rebuilt from the partial file
+    stored = worker_a.complete(upload_id, expected_sha256=hashlib.sha256(data).hexdigest())
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert stored.path.read_bytes() == data
+
+
+def test_resumable_upload_is_locked_across_workers(upload_dir):
+    data = make_pdf(pages=2)
+    worker_a, worker_b = ResumableUploads(upload_dir / ".partial"), ResumableUploads(upload_dir / ".partial")
+    upload_id = worker_a.create("deck.pdf", len(data))["upload_id"]
+
+    async def b_appends_while_a_streams():
+        yield data[:100]
+        with pytest.raises(UploadRejectedError) as error:
+            await worker_b.append(upload_id, 0, chunked(data[:100]))
+        assert error.value.status_code == 409
+        yield data[100:200]
+
+    asyncio.run(worker_a.append(upload_id, 0, b_appends_while_a_streams()))
+    assert worker_b.status(upload_id)["offset"] == 200
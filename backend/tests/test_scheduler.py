@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openai import OpenAI
+
+from app import api
+from app.config import settings
+from app.scheduler import FairScheduler, ModelLimit, QueueTimeoutError, request_class
+from app.upstream import OperationPolicy, UpstreamCaller, client_for_attempt
+from app.usage_ledger import attribute_usage
+
+STUB_CONCURRENCY = 4
+
+
+class RateLimitedStub(BaseHTTPRequestHandler):
+    """Chat completions endpoint that answers 429 once more than STUB_CONCURRENCY requests are in flight."""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    rejected = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            limited = cls.in_flight > STUB_CONCURRENCY
+            cls.rejected += limited
+        try:
+            if limited:
+                self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+            else:
+                time.sleep(0.02)
+                self.reply(200, {"id": "x", "object": "chat.completion", "created": 0, "model": "gpt-4o", "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}]})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedStub)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield OpenAI(api_key="sk-test", base_url=f"http://127.0.0.1:{httpd.server_port}/v1")
+    httpd.shutdown()
+
+
+def test_classroom_burst_stays_within_the_stub_limit(stub, monkeypatch):
+    monkeypatch.setattr(settings, "upstream_max_attempts", 1)
+    scheduler = FairScheduler({"gpt-4o": ModelLimit(concurrency=STUB_CONCURRENCY)})
+    caller = UpstreamCaller(policies={"analysis": OperationPolicy(attempt_timeout=10.0, deadline=30.0)}, scheduler=scheduler)
+    errors = []
+
+    def learner(number):
+        with attribute_usage(session_id=f"learner-{number}", endpoint="ask-follow-up"):
+            for _ in range(3):
+                try:
+                    caller.call("analysis", lambda timeout: client_for_attempt(stub, timeout).chat.completions.create(
+                        model="gpt-4o", messages=[{"role": "user", "content": "hi"}]), model="gpt-4o")
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=learner, args=(number,)) for number in range(30)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert RateLimitedStub.rejected == 0
+    assert RateLimitedStub.max_in_flight <= STUB_CONCURRENCY
+    waits = scheduler.snapshot()["queue_wait"]["gpt-4o"]["interactive"]
+    assert waits["requests"] == 90 and waits["max_wait_ms"] > 0
+
+
+def run_in_order(scheduler, requests):
+    """Queue (priority, learner) requests behind a held slot one by one, then record the order they are served in."""
+    served = []
+    holder = scheduler.acquire("gpt-4o", "interactive", "holder")
+    threads = []
+    for priority, learner in requests:
+        def wait_for_slot(priority=priority, learner=learner):
+            waiter = scheduler.acquire("gpt-4o", priority, learner, timeout=5)
+            served.append(learner)
+            scheduler.release(waiter)
+        queued = scheduler.snapshot()["models"]["gpt-4o"]["queued"]
+        threads.append(threading.Thread(target=wait_for_slot))
+        threads[-1].start()
+        while scheduler.snapshot()["models"]["gpt-4o"]["queued"] == queued:
+            time.sleep(0.001)
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join()
+    return served
+
+
+def test_interactive_turns_overtake_background_work():
+    scheduler = FairScheduler({"gpt-4o": ModelLimit(concurrency=1)})
+    served = run_in_order(scheduler, [("background", "ingest"), ("evaluation", "eval"), ("interactive", "turn")])
+    assert served == ["turn", "eval", "ingest"]
+
+
+def test_learners_take_turns_within_a_class():
+    scheduler = FairScheduler({"gpt-4o": ModelLimit(concurrency=1)})
+    served = run_in_order(scheduler, [("interactive", "a"), ("interactive", "a"), ("interactive", "a"), ("interactive", "b")])
+    assert served == ["a", "b", "a", "a"]
+
+
+def test_rate_limit_and_queue_timeout():
+    scheduler = FairScheduler({"tts": ModelLimit(concurrency=10, rpm=600, burst=2)})
+    started = time.monotonic()
+    for _ in range(4):
+        scheduler.release(scheduler.acquire("tts"))
+    # Two requests from the burst, then one every 0.1s
+    assert time.monotonic() - started >= 0.15
+
+    scheduler = FairScheduler({"gpt-4o": ModelLimit(concurrency=1)})
+    held = scheduler.acquire("gpt-4o")
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire("gpt-4o", "background", "ingest", timeout=0.05)
+    scheduler.release(held)
+    assert scheduler.snapshot()["queue_wait"]["gpt-4o"]["background"]["timeouts"] == 1
+
+
+def test_only_learners_are_capped():
+    assert request_class({"endpoint": "ask-follow-up", "session_id": "learner-1"}) == ("interactive", "learner-1", True)
+    assert request_class({"endpoint": "evaluate"}) == ("evaluation", "endpoint:evaluate", False)
+
+    scheduler = FairScheduler({"gpt-4o": ModelLimit(concurrency=8)})
+    held = [scheduler.acquire("gpt-4o", "evaluation", "endpoint:evaluate", timeout=0.05, capped=False) for _ in range(5)]
+    held += [scheduler.acquire("gpt-4o", "interactive", "learner-1", timeout=0.05) for _ in range(settings.scheduler_per_learner_concurrency)]
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire("gpt-4o", "interactive", "learner-1", timeout=0.05)
+    for waiter in held:
+        scheduler.release(waiter)
+
+
+def test_turns_wait_for_slots_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    loops = []
+
+    def running_loop():
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def process_follow_up(client, audio_path, image_path, *args, **kwargs):
+        loops.append(running_loop())
+        output_path = api.scratch_space.path("response.mp3")
+        with open(output_path, "wb") as f:
+            f.write(b"ID3audio")
+        return "Tell me more!", output_path, "An agent has sensors."
+
+    def evaluate(concept, chat_history):
+        loops.append(running_loop())
+        return 50.0
+
+    monkeypatch.setattr(api, "process_follow_up", process_follow_up)
+    monkeypatch.setattr(api.evaluator, "evaluate", evaluate)
+    monkeypatch.setattr(api, "resolve_concept", lambda course_id, concept_id: {"title": "Agents", "answer": "..."})
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    client = TestClient(app)
+    client.post("/api/ask-follow-up", data={"concept_id": "1"},
+                files={"audio_file": ("a.webm", b"webm-audio", "audio/webm"),
+                       "notepad_image": ("n.webp", b"webp-image", "image/webp")})
+    client.post("/api/evaluate", data={"concept_id": "1"})
+    # Both ran in worker threads, where waiting for a slot blocks no one else
+    assert loops == [None, None]
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+
+from app import api
+from app.scratch import ScratchSpace, scratch_space
+
+
+def test_workspace_is_current_in_worker_threads_and_removed_on_failure(tmp_path):
+    scratch = ScratchSpace(tmp_path)
+
+    async def request():
+        with scratch.workspace("ask-follow-up") as workspace:
+            path = await run_in_threadpool(scratch.path, "audio.webm")
+            with open(path, "wb") as f:
+                f.write(b"x" * 100)
+            assert os.path.dirname(path) == str(workspace)
+            assert scratch.usage()["files"] == 1 and scratch.usage()["active_workspaces"] == 1
+            raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(request())
+    assert list(tmp_path.iterdir()) == []
+    assert scratch.usage()["workspaces_removed"] == 1
+
+
+def test_sweeper_removes_orphans_only(tmp_path):
+    scratch = ScratchSpace(tmp_path, orphan_age_seconds=60)
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    dead = tmp_path / f"{finished.pid}-0123456789ab-ask-follow-up"
+    dead.mkdir()
+    (dead / "audio.webm").write_bytes(b"x" * 10)
+    old = tmp_path / f"{os.getpid()}-0123456789ab-response.mp3"
+    old.write_bytes(b"x")
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    young = scratch.path("response.mp3")
+    open(young, "wb").close()
+
+    with scratch.workspace("finalize-stream") as active:
+        os.utime(active, (time.time() - 120, time.time() - 120))
+        assert scratch.sweep() == 2
+        assert sorted(p.name for p in tmp_path.iterdir()) == sorted([active.name, os.path.basename(young)])
+    assert scratch.usage()["swept_bytes"] == 11
+
+
+def test_follow_up_leaves_no_files_behind(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scratch_space, "_root", tmp_path / "scratch")
+    seen = []
+
+    def process_follow_up(client, audio_path, image_path, *args, **kwargs):
+        seen.extend([audio_path, image_path])
+        output_path = api.scratch_space.path("response.mp3")
+        with open(output_path, "wb") as f:
+            f.write(b"ID3audio")
+        return "Tell me more!", output_path, "An agent has sensors."
+
+    monkeypatch.setattr(api, "process_follow_up", process_follow_up)
+    monkeypatch.setattr(api, "resolve_concept", lambda course_id, concept_id: {"title": "Agents", "answer": "..."})
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    response = TestClient(app).post("/api/ask-follow-up", data={"concept_id": "1"},
+                                    files={"audio_file": ("a.webm", b"webm-audio", "audio/webm"),
+                                           "notepad_image": ("n.webp", b"webp-image", "image/webp")})
+    assert response.status_code == 200
+    assert all(path.startswith(str(tmp_path / "scratch")) for path in seen)
+    assert list((tmp_path / "scratch").iterdir()) == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["conversation_history.txt", "scratch"]
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from app import slide_extractor_with_images
+from app.course_db import CourseDatabase
+from app.search_index import BM25Index, ConceptSearch, tokenize
+from app.slide_index import SlideSearch
+
+
+def build_index():
+    texts = [
+        "Intelligent agent perceives its environment through sensors and acts through actuators",
+        "A thermostat senses the room temperature and controls a valve",
+        "Infrastructure as a service rents hardware and storage in the cloud",
+    ]
+    documents = [{"course_id": "ai", "concept_id": "1"}, {"course_id": "ai", "concept_id": "2"},
+                 {"course_id": "cloud", "concept_id": "1"}]
+    return BM25Index.build(texts, documents, meta={"catalog_version": "v1"})
+
+
+def test_tokenize_drops_stopwords_and_stems():
+    assert tokenize("The agents and their sensors") == ["agent", "sensor"]
+
+
+def test_search_ranks_matching_document_first():
+    index = build_index()
+    results = index.search("how does an agent use its sensors", k=2)
+    assert results[0][0] == {"course_id": "ai", "concept_id": "1"}
+    assert all(score > 0 for _, score in results)
+
+
+def test_search_respects_mask_and_unknown_terms():
+    index = build_index()
+    assert index.search("hardware storage", mask=index.field_mask("course_id", "ai")) == []
+    assert index.search("quantum chromodynamics") == []
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+    index = build_index()
+    index.save(tmp_path / "concepts")
+    loaded = BM25Index.load(tmp_path / "concepts")
+
+    assert loaded.meta == {"catalog_version": "v1"}
+    assert loaded.search("thermostat valve") == index.search("thermostat valve")
+    assert BM25Index.load(tmp_path / "missing") is None
+
+
+def test_concurrent_rebuilds_and_rebuild_at_ingestion(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    search = ConceptSearch(db, tmp_path / "concepts")
+    monkeypatch.setattr(slide_extractor_with_images, "course_db", db)
+    monkeypatch.setattr(slide_extractor_with_images, "concept_search", search)
+    monkeypatch.setattr(slide_extractor_with_images, "slide_search", SlideSearch(tmp_path / "slides"))
+
+    concepts = [{"concept_id": "1", "title": "Agents", "question": "What is an agent?", "answer": "Sensors and actuators"}]
+    slide_extractor_with_images.store_course("ai", concepts, "ai.pdf", "hash", ["Agents"])
+    # Built at ingestion, before any query
+    assert BM25Index.load(tmp_path / "concepts").meta["catalog_version"] == db.version()[0]
+
+    db.upsert_course("cloud", [{"concept_id": "1", "title": "IaaS", "question": "?", "answer": "Rented hardware"}])
+    saves = []
+    save = BM25Index.save
+
+    def slow_save(index, index_dir):
+        saves.append(index_dir)
+        time.sleep(0.05)
+        save(index, index_dir)
+
+    monkeypatch.setattr(BM25Index, "save", slow_save)
+    errors = []
+
+    def query():
+        try:
+            assert search.search("rented hardware")[0]["course_id"] == "cloud"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=query) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The stale index is rebuilt (and saved) once, not by every waiting query
+    assert errors == [] and len(saves) == 1
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".concepts")] == []
@@ -1,25 +1,12 @@
-from app.slide_extractor_with_images import extract_key_concepts_and_generate_qa
-import os
+from app.bulk_ingest import BulkIngestor
+import json
 from pathlib import Path
 
 def main():
-    # Get all PDF files from course_content directory
+    # Ingest every PDF below course_content; decks ingested before are skipped, failed ones resume
     course_content_dir = Path("course_content")
-    pdf_files = list(course_content_dir.glob("*.pdf"))
-    
-    print(f"Found {len(pdf_files)} PDF files to process:")
-    for pdf_file in pdf_files:
-        print(f"- {pdf_file}")
-    
-    print("\nStarting PDF analysis...")
-    for pdf_file in pdf_files:
-        try:
-            print(f"\nProcessing: {pdf_file}")
-            qa_pairs = extract_key_concepts_and_generate_qa(pdf_file)
-            print(f"\nGenerated Q&A pairs for {pdf_file.name}:")
-            print(qa_pairs)
-        except Exception as e:
-            print(f"Error processing {pdf_file}: {str(e)}")
+    report = BulkIngestor(course_content_dir).run()
+    print(json.dumps(report, indent=2))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
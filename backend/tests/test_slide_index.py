@@ -0,0 +1,69 @@
+import pytest
+
+from app import slide_index
+from app.course_db import CourseDatabase
+from app.slide_index import SlideSearch, chunk_pages, estimate_tokens
+
+CONCEPTS = [{"concept_id": "1", "title": "Agents", "question": "What is an agent?", "answer": "Perceives and acts"}]
+PAGES = [
+    "Agents perceive their environment through sensors",
+    "Agents act upon the environment with actuators",
+    " ".join(["A rational agent chooses the action that maximizes its expected performance."] * 20),
+    "",
+    "Search problems: states, actions and goals",
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.course_db.settings.course_db_auto_import", False)
+    db = CourseDatabase(tmp_path / "courses.db")
+    monkeypatch.setattr(slide_index, "course_db", db)
+    monkeypatch.setattr(slide_index, "DECK_DIRS", [])
+    return db
+
+
+def test_pages_are_chunked_by_words():
+    chunks = chunk_pages(["one two three", "", " ".join(str(i) for i in range(250))], chunk_words=100)
+    assert [chunk["page"] for chunk in chunks] == [1, 3, 3, 3]
+    assert chunks[0]["text"] == "one two three"
+    assert [len(chunk["text"].split()) for chunk in chunks[1:]] == [100, 100, 50]
+
+
+def test_top_chunks_respect_k_and_the_token_budget(db, tmp_path):
+    db.upsert_course("ai", CONCEPTS, content_hash="v1", page_texts=PAGES)
+    search = SlideSearch(tmp_path / "slides")
+
+    everything = search.top_chunks("ai", "agent agents environment actions", k=10, token_budget=10_000)
+    assert [chunk["page"] for chunk in everything] == sorted(chunk["page"] for chunk in everything)
+    assert {1, 2, 3, 5} <= {chunk["page"] for chunk in everything}
+
+    assert len(search.top_chunks("ai", "agent agents environment actions", k=2, token_budget=10_000)) == 2
+    # The long page's chunks do not fit; the short pages are taken instead
+    small = search.top_chunks("ai", "agent agents environment", k=3, token_budget=40)
+    assert [chunk["page"] for chunk in small] == [1, 2]
+    assert sum(estimate_tokens(chunk["text"]) for chunk in small) <= 40
+
+
+def test_courses_without_an_index_are_looked_up_once(db, tmp_path, monkeypatch):
+    search = SlideSearch(tmp_path / "slides")
+    lookups = []
+    get_source_pages = db.get_source_pages
+    monkeypatch.setattr(db, "get_source_pages", lambda course_id: lookups.append(course_id) or get_source_pages(course_id))
+
+    assert search.top_chunks("unknown", "agents") == []
+    assert search.top_chunks("unknown", "agents") == []
+    assert lookups == ["unknown"]
+
+
+def test_a_course_reingested_by_another_worker_is_reindexed(db, tmp_path):
+    db.upsert_course("ai", CONCEPTS, content_hash="v1", page_texts=PAGES)
+    ingesting, serving = SlideSearch(tmp_path / "slides"), SlideSearch(tmp_path / "slides")
+    ingesting.index_pages("ai", PAGES, content_hash="v1")
+    assert serving.top_chunks("ai", "sensors")[0]["page"] == 1
+
+    new_pages = ["Multi-agent systems", "Sensors and cameras in robots"]
+    db.upsert_course("ai", CONCEPTS, content_hash="v2", page_texts=new_pages)
+    ingesting.index_pages("ai", new_pages, content_hash="v2")
+    assert [chunk["text"] for chunk in serving.top_chunks("ai", "sensors")] == ["Sensors and cameras in robots"]
+    assert serving.index("ai").meta["content_hash"] == "v2"
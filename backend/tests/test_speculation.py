@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import api
+from app.config import settings
+from app.realtime_transcription import TranscriptBuffer
+from app.speculation import Speculator, transcript_similarity
+
+SAID = "an agent perceives its environment through sensors and acts on it through actuators"
+
+
+@pytest.fixture
+def speculator(monkeypatch):
+    monkeypatch.setattr(settings, "speculation_min_words", 3)
+    monkeypatch.setattr(settings, "speculation_reuse_similarity", 0.9)
+    return Speculator(workers=2)
+
+
+def draft_fn(text, drawing):
+    return f"draft for: {text}", 100
+
+
+def test_similarity_ignores_case_and_punctuation():
+    assert transcript_similarity(SAID, SAID.upper() + ".") == 1.0
+    assert transcript_similarity(SAID, SAID + " like a robot with cameras and wheels") < 0.9
+
+
+def test_unchanged_transcript_reuses_the_draft(speculator):
+    speculator.speculate("s1", SAID, None, draft_fn)
+    outcome = speculator.resolve("s1", SAID.capitalize() + ".", lambda draft: True)
+
+    assert outcome.kind == "hit"
+    assert outcome.feedback == f"draft for: {SAID}"
+    metrics = speculator.metrics.snapshot()
+    assert (metrics["hits"], metrics["hit_rate"], metrics["wasted_tokens"]) == (1, 1.0, 0)
+
+
+def test_changed_transcript_or_drawing_asks_for_a_revision(speculator):
+    speculator.speculate("s1", SAID, None, draft_fn)
+    assert speculator.resolve("s1", SAID + " like a robot with cameras and wheels", lambda draft: True).kind == "revise"
+
+    speculator.speculate("s2", SAID, None, draft_fn)
+    assert speculator.resolve("s2", SAID, lambda draft: False).kind == "revise"
+    assert speculator.resolve("s3", SAID, lambda draft: True).kind == "miss"
+
+
+def test_superseded_and_late_drafts_count_as_wasted(speculator):
+    speculator.speculate("s1", "an agent perceives", None, draft_fn)
+    speculator.latest("s1").future.result()
+    speculator.speculate("s1", SAID, None, draft_fn)
+    speculator.latest("s1").future.result()
+    assert speculator.resolve("s1", SAID, lambda draft: True).kind == "hit"
+
+    release = threading.Event()
+
+    def slow_draft(text, drawing):
+        release.wait(5)
+        return "late", 70
+
+    draft = speculator.speculate("s2", SAID, None, slow_draft)
+    assert speculator.resolve("s2", SAID, lambda draft: True, wait_seconds=0.05).kind == "miss"
+    release.set()
+    draft.future.result()
+    speculator._executor.shutdown(wait=True)
+
+    metrics = speculator.metrics.snapshot()
+    assert metrics["draft_tokens"] == 270
+    assert metrics["wasted_tokens"] == 170
+    assert metrics["hit_rate"] == 0.5
+
+
+def test_transcript_keeps_commit_order_and_settles():
+    async def scenario():
+        buffer = TranscriptBuffer()
+        buffer.apply({"type": "input_audio_buffer.committed", "item_id": "a"})
+        buffer.apply({"type": "input_audio_buffer.committed", "item_id": "b"})
+        buffer.apply({"type": "conversation.item.input_audio_transcription.delta", "item_id": "a", "delta": "an agent"})
+        assert buffer.apply({"type": "conversation.item.input_audio_transcription.completed",
+                             "item_id": "b", "transcript": "through sensors."}) == "segment"
+        assert buffer.text() == "through sensors."
+        assert buffer.text(include_partial=True) == "an agent through sensors."
+        assert not await buffer.wait_settled(0.01)
+
+        buffer.apply({"type": "conversation.item.input_audio_transcription.completed",
+                      "item_id": "a", "transcript": "An agent perceives"})
+        assert await buffer.wait_settled(0.01)
+        buffer.expect_commit()
+        assert not await buffer.wait_settled(0.01)
+        buffer.apply({"type": "error", "error": {"code": "input_audio_buffer_commit_empty"}})
+        assert await buffer.wait_settled(0.01)
+        return buffer.text()
+
+    assert asyncio.run(scenario()) == "An agent perceives through sensors."
+
+
+def test_abandoned_voice_sessions_are_swept_with_their_drafts(speculator, monkeypatch):
+    monkeypatch.setattr(api, "speculator", speculator)
+    monkeypatch.setattr(api, "active_voice_sessions", {})
+    monkeypatch.setattr(api, "resolve_concept", lambda course_id, concept_id: {"title": "Agents", "answer": "..."})
+    now = time.time()
+    api.active_voice_sessions["abandoned"] = {"created_at": now - settings.voice_session_ttl_seconds - 1}
+    api.active_voice_sessions["talking"] = {"created_at": now - 5}
+    speculator.speculate("abandoned", SAID, None, draft_fn)
+
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    started = TestClient(app).post("/api/session/initiate", data={"concept_id": "1"}).json()
+
+    assert sorted(api.active_voice_sessions) == sorted(["talking", started["session_id"]])
+    assert speculator.latest("abandoned") is None
@@ -0,0 +1,124 @@
+import io
+import json
+import math
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import api
+from app.drawing_tracker import DrawingTracker, compare_fingerprints
+from app.config import settings
+from app.image_optimizer import prepare_image
+from app.stroke_rasterizer import (StrokeFormatError, StrokeRasterizer, parse_strokes, rasterize_for_vision, render,
+                                   stroke_fingerprint, write_strokes)
+
+
+def word(x, y, width=3):
+    """A handwriting-like squiggle, as DrawingCanvas would record it."""
+    points = []
+    for k in range(40):
+        points += [round(x + 3 * k + 4 * math.sin(k / 2)), round(y + 10 * math.cos(k / 3))]
+    return {"color": "#ffffff", "width": width, "points": points}
+
+
+def drawing(*strokes):
+    return {"width": 1200, "height": 800, "background": "#333333", "strokes": list(strokes)}
+
+
+def test_parsing_is_canonical_and_validated():
+    absolute = parse_strokes(json.dumps(drawing(word(100, 100))))
+    relative = json.loads(absolute.to_json())
+    assert relative["strokes"][0]["deltas"][:2] == [100, 110]
+    # Delta-encoded and absolute uploads of the same drawing are the same stroke set
+    assert parse_strokes(absolute.to_json()) == absolute
+    assert parse_strokes(dict(relative, background="#333")).key == absolute.key
+
+    for bad in (drawing({"color": "white", "width": 2, "points": [1, 2]}),
+                drawing({"color": "#fff", "width": 2, "points": [1, 2, 3]}),
+                drawing({"color": "#fff", "width": 0, "points": [1, 2]}),
+                dict(drawing(), width=0),
+                "not json"):
+        with pytest.raises(StrokeFormatError):
+            parse_strokes(bad if isinstance(bad, str) else json.dumps(bad))
+
+
+def test_rasterized_like_the_uploaded_image_but_smaller_upload():
+    strokes = parse_strokes(json.dumps(drawing(*(word(150 + 150 * (i % 4), 150 + 60 * (i // 4)) for i in range(16)))))
+    # What the browser uploads today: the whole canvas as WebP
+    buffer = io.BytesIO()
+    render(strokes).save(buffer, format="WEBP", quality=80)
+    from_image = prepare_image(Image.open(io.BytesIO(buffer.getvalue())).convert("RGB"))
+
+    from_strokes = rasterize_for_vision(strokes, original_bytes=len(strokes.to_json()))
+    assert from_strokes.detail == from_image.detail
+    assert abs(from_strokes.width - from_image.width) <= 8 and abs(from_strokes.height - from_image.height) <= 8
+    assert len(strokes.to_json()) * 2 < len(buffer.getvalue())
+
+    blank = rasterize_for_vision(parse_strokes(json.dumps(drawing())))
+    assert (blank.width, blank.detail) == (64, "low")
+
+
+def test_change_between_turns_comes_from_the_stroke_lists():
+    first = drawing(word(100, 100), word(100, 300))
+    before = stroke_fingerprint(parse_strokes(json.dumps(first)))
+    assert compare_fingerprints(before, stroke_fingerprint(parse_strokes(json.dumps(first)))).kind == "unchanged"
+
+    added = compare_fingerprints(before, stroke_fingerprint(parse_strokes(json.dumps(drawing(*first["strokes"], word(700, 600))))))
+    assert (added.kind, added.strokes_added, added.strokes_removed) == ("region", 1, 0)
+    left, top, right, bottom = added.bbox
+    assert 650 < left < 700 and 550 < top < 600 and right > 800
+
+    cleared = compare_fingerprints(before, stroke_fingerprint(parse_strokes(json.dumps(drawing(word(100, 500))))))
+    assert cleared.strokes_removed == 2 and cleared.kind in ("region", "changed")
+
+
+def test_prepared_once_per_stroke_set(tmp_path, monkeypatch):
+    rasterizer = StrokeRasterizer(max_entries=8)
+    monkeypatch.setattr(api, "stroke_rasterizer", rasterizer)
+    monkeypatch.setattr(api, "drawing_tracker", DrawingTracker())
+    path = str(tmp_path / "turn.strokes.json")
+    write_strokes(parse_strokes(json.dumps(drawing(word(100, 100)))), path)
+
+    image_url, detail, change, fingerprint = api.prepare_notepad_image(path, "session-1")
+    assert image_url.startswith("data:image/") and change == "changed"
+    # The same drawing shared during a pause and again with the finished turn
+    assert api.prepare_notepad_image(path, "session-1")[0] == image_url
+    assert rasterizer.snapshot()["hits"] == 2  # fingerprint and image
+
+    api.drawing_tracker.remember("session-1", fingerprint)
+    assert api.prepare_notepad_image(path, "session-1")[0] is None
+
+
+def test_follow_up_rejects_missing_or_malformed_drawings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    client = TestClient(app)
+    audio = {"audio_file": ("a.webm", b"webm-audio", "audio/webm")}
+
+    missing = client.post("/api/ask-follow-up", data={"concept_id": "1"}, files=audio)
+    malformed = client.post("/api/ask-follow-up", data={"concept_id": "1", "notepad_strokes": "{\"width\": 5}"}, files=audio)
+    assert missing.status_code == malformed.status_code == 400
+    assert "notepad_strokes" in malformed.json()["detail"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_render_never_allocates_more_than_the_pixel_budget(monkeypatch):
+    monkeypatch.setattr(settings, "stroke_render_max_pixels", 1_000_000)
+    allocated = []
+    new = Image.new
+    monkeypatch.setattr(Image, "new", lambda mode, size, *args: allocated.append(size) or new(mode, size, *args))
+
+    # Small outputs keep the full supersampling
+    assert render(parse_strokes(json.dumps(drawing(word(100, 100)))), scale=0.5).size == (600, 400)
+    assert allocated[-1] == (1200, 800)
+    # A full-size 1200x800 render fits only without supersampling
+    assert render(parse_strokes(json.dumps(drawing(word(100, 100))))).size == (1200, 800)
+    assert allocated[-1] == (1200, 800)
+    # The largest accepted canvas is drawn smaller instead of as a 16384x16384 buffer
+    huge = parse_strokes(json.dumps({"width": 8192, "height": 8192, "strokes": [word(4000, 4000, width=40)]}))
+    image = render(huge)
+    assert image.size == allocated[-1] and image.size[0] * image.size[1] <= 1_000_000
+    assert image.size[0] >= 990
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.upstream import CircuitOpenError, OperationPolicy, UpstreamCaller, UpstreamUnavailableError
+
+
+class FaultInjectingStub:
+    """
+    Stand-in for an upstream endpoint that plays back a script of outcomes.
+
+    Each call consumes the next outcome: "ok", "error" (retryable connection error),
+    "fatal" (non-retryable), or ("slow", seconds) which answers after a delay.
+    The last outcome repeats once the script is exhausted.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            outcome = self.script[min(self.calls, len(self.script) - 1)]
+            self.calls += 1
+            call_number = self.calls
+            self.timeouts.append(timeout)
+        if outcome == "error":
+            raise ConnectionError("injected connection reset")
+        if outcome == "fatal":
+            raise ValueError("injected bad request")
+        if isinstance(outcome, tuple) and outcome[0] == "slow":
+            time.sleep(outcome[1])
+        return f"response {call_number}"
+
+
+def make_caller(monkeypatch, hedge_after=None, max_attempts=3, failure_threshold=5):
+    monkeypatch.setattr(settings, "upstream_max_attempts", max_attempts)
+    monkeypatch.setattr(settings, "circuit_breaker_failure_threshold", failure_threshold)
+    monkeypatch.setattr(settings, "circuit_breaker_reset_seconds", 60.0)
+    policies = {"test": OperationPolicy(attempt_timeout=1.0, deadline=5.0, hedge_after=hedge_after)}
+    sleeps = []
+    caller = UpstreamCaller(policies=policies, sleep=sleeps.append)
+    return caller, sleeps
+
+
+def test_retries_retryable_errors_with_backoff(monkeypatch):
+    caller, sleeps = make_caller(monkeypatch)
+    stub = FaultInjectingStub("error", "error", "ok")
+
+    assert caller.call("test", stub) == "response 3"
+    assert stub.calls == 3
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= settings.upstream_backoff_max_seconds for delay in sleeps)
+    counts = caller.metrics.snapshot()["test"]
+    assert counts["retries"] == 2
+    assert counts["successes"] == 1
+
+
+def test_does_not_retry_non_retryable_errors(monkeypatch):
+    caller, sleeps = make_caller(monkeypatch)
+    stub = FaultInjectingStub("fatal")
+
+    with pytest.raises(ValueError):
+        caller.call("test", stub)
+    assert stub.calls == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    caller, _ = make_caller(monkeypatch, max_attempts=2)
+    stub = FaultInjectingStub("error")
+
+    with pytest.raises(UpstreamUnavailableError):
+        caller.call("test", stub)
+    assert stub.calls == 2
+    assert caller.metrics.snapshot()["test"]["failures"] == 1
+
+
+def test_passes_attempt_timeout_to_the_call(monkeypatch):
+    caller, _ = make_caller(monkeypatch)
+    stub = FaultInjectingStub("ok")
+
+    caller.call("test", stub)
+    assert 0 < stub.timeouts[0] <= 1.0
+
+
+def test_circuit_opens_and_fails_fast(monkeypatch):
+    caller, _ = make_caller(monkeypatch, max_attempts=1, failure_threshold=2)
+    stub = FaultInjectingStub("error")
+
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailableError):
+            caller.call("test", stub)
+    with pytest.raises(CircuitOpenError):
+        caller.call("test", stub)
+    assert stub.calls == 2
+    assert caller.metrics.snapshot()["test"]["circuit_rejections"] == 1
+
+
+def test_circuit_half_opens_after_reset_timeout(monkeypatch):
+    caller, _ = make_caller(monkeypatch, max_attempts=1, failure_threshold=1)
+    now = [0.0]
+    caller.clock = lambda: now[0]
+    stub = FaultInjectingStub("error", "ok")
+
+    with pytest.raises(UpstreamUnavailableError):
+        caller.call("test", stub)
+    with pytest.raises(CircuitOpenError):
+        caller.call("test", stub)
+
+    now[0] += settings.circuit_breaker_reset_seconds
+    assert caller.call("test", stub) == "response 2"
+    assert caller.breaker("test").state == "closed"
+
+
+def test_hedge_wins_when_primary_is_slow(monkeypatch):
+    caller, _ = make_caller(monkeypatch, hedge_after=0.05)
+    stub = FaultInjectingStub(("slow", 0.5), "ok")
+
+    start = time.monotonic()
+    assert caller.call("test", stub) == "response 2"
+    assert time.monotonic() - start < 0.4
+    counts = caller.metrics.snapshot()["test"]
+    assert counts["hedges_started"] == 1
+    assert counts["hedges_won"] == 1
+
+
+def test_no_hedge_when_primary_is_fast(monkeypatch):
+    caller, _ = make_caller(monkeypatch, hedge_after=0.2)
+    stub = FaultInjectingStub("ok")
+
+    assert caller.call("test", stub) == "response 1"
+    assert stub.calls == 1
+    assert caller.metrics.snapshot()["test"]["hedges_started"] == 0
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.core import estimate_speech_usage
+from app.upstream import OperationPolicy, UpstreamCaller
+from app.usage_ledger import UsageLedger, attribute_usage, estimate_cost, usage_from_response
+
+
+def chat_response(prompt=1000, completion=200, cached=400):
+    usage = SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=cached, audio_tokens=0),
+                            completion_tokens_details=SimpleNamespace(audio_tokens=0))
+    return SimpleNamespace(usage=usage)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return UsageLedger(tmp_path / "usage.db")
+
+
+def test_usage_from_chat_and_transcription_responses():
+    assert usage_from_response(chat_response())["cached_tokens"] == 400
+    transcription = {"usage": {"input_tokens": 120, "output_tokens": 30, "input_token_details": {"audio_tokens": 100}}}
+    usage = usage_from_response(transcription)
+    assert (usage["prompt_tokens"], usage["completion_tokens"], usage["audio_input_tokens"]) == (120, 30, 100)
+    assert not any(usage_from_response(b"audio bytes").values())
+
+
+def test_estimate_cost_prices_cached_tokens_lower():
+    full = estimate_cost("gpt-4o", {"prompt_tokens": 1000, "completion_tokens": 0})
+    cached = estimate_cost("gpt-4o", {"prompt_tokens": 1000, "completion_tokens": 0, "cached_tokens": 1000})
+    assert cached == pytest.approx(full / 2)
+    assert estimate_cost("unknown-model", {"prompt_tokens": 1000}) == 0.0
+
+
+def test_records_are_attributed_and_summarized(ledger):
+    with attribute_usage(endpoint="ask-follow-up", session_id="s1", concept_id="3"):
+        ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 1.5)
+        with attribute_usage(concept_id="4"):
+            ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 0.5)
+    ledger.record("evaluation", "gpt-4o-mini", usage_from_response(chat_response()), 0.2, session_id="s2")
+
+    by_concept = {row["group"]: row for row in ledger.summary("concept_id", session_id="s1")}
+    assert set(by_concept) == {"3", "4"}
+    assert by_concept["3"]["wall_ms"] == 1500
+    totals = ledger.session_totals("s1")
+    assert totals["calls"] == 2
+    assert totals["total_tokens"] == 2400
+    with pytest.raises(ValueError):
+        ledger.summary("prompt")
+
+
+def test_over_budget_session_degrades_to_fallback_model(ledger, monkeypatch):
+    monkeypatch.setattr(settings, "session_budget_tokens", 2000)
+    with attribute_usage(session_id="s1"):
+        assert ledger.model_for("gpt-4o") == "gpt-4o"
+        ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 1.0)
+        ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 1.0)
+        assert ledger.model_for("gpt-4o") == "gpt-4o-mini"
+        assert ledger.model_for("gpt-4o-mini-tts") == "gpt-4o-mini-tts"
+    assert ledger.model_for("gpt-4o", session_id="s2") == "gpt-4o"
+
+
+def test_upstream_calls_are_recorded(ledger):
+    caller = UpstreamCaller(policies={"test": OperationPolicy(attempt_timeout=1.0, deadline=5.0)}, ledger=ledger)
+    with attribute_usage(session_id="s1", endpoint="evaluate"):
+        caller.call("test", lambda timeout: chat_response(), model="gpt-4o-mini")
+        caller.call("test", lambda timeout: b"audio", model="gpt-4o-mini-tts", usage_hint={"prompt_tokens": 50})
+
+    calls = ledger.recent(session_id="s1")
+    assert [call["prompt_tokens"] for call in calls] == [50, 1000]
+    assert all(call["endpoint"] == "evaluate" and call["status"] == "ok" for call in calls)
+
+
+def test_budgets_are_per_learner(ledger, monkeypatch):
+    monkeypatch.setattr(settings, "session_budget_tokens", 2000)
+    for _ in range(2):
+        ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 1.0, session_id="learner-a", concept_id="3")
+        ledger.record("analysis", "gpt-4o", usage_from_response(chat_response()), 1.0, concept_id="3")
+    assert ledger.model_for("gpt-4o", session_id="learner-a") == "gpt-4o-mini"
+    # Another learner on the same concept, and calls without a session, keep the full model
+    assert ledger.model_for("gpt-4o", session_id="learner-b") == "gpt-4o"
+    with attribute_usage(concept_id="3"):
+        assert ledger.model_for("gpt-4o") == "gpt-4o"
+
+
+def test_speech_is_billed_for_its_audio_output():
+    text = "Let me see if I've got this right... an agent perceives its environment through sensors. " * 2
+    usage = estimate_speech_usage(text)
+    # About 12 seconds of speech at $0.015 per minute, far more than the input text
+    assert estimate_cost("gpt-4o-mini-tts", usage) == pytest.approx(0.015 * 12 / 60, rel=0.1)
+    assert estimate_cost("gpt-4o-mini-tts", {"prompt_tokens": usage["prompt_tokens"]}) < estimate_cost("gpt-4o-mini-tts", usage) / 10
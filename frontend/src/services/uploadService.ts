@@ -1,3 +1,7 @@
+// Learning session issued by the backend with the first answer; sent with later turns
+// so grandpa can tell which drawing is new
+let learningSessionId: string | null = null;
+
 export const uploadAndPlayAudio = async ({
                                              audioFile,
                                              imageFile,
@@ -14,6 +18,9 @@ export const uploadAndPlayAudio = async ({
     formData.append('audio_file', audioFile);
     formData.append('notepad_image', imageFile);
     formData.append('last_explanation', String(lastExplanation));
+    if (learningSessionId) {
+        formData.append('session_id', learningSessionId);
+    }
 
     try {
         const response = await fetch('http://localhost:8000/api/ask-follow-up', {
@@ -27,7 +34,8 @@ export const uploadAndPlayAudio = async ({
             throw new Error(`Failed to upload: ${response.status} ${errorText}`);
         }
 
-        const { feedback, audio_data } = await response.json();
+        const { feedback, audio_data, session_id } = await response.json();
+        learningSessionId = session_id ?? learningSessionId;
 
         console.log('Feedback:', feedback);
 